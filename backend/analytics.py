@@ -0,0 +1,112 @@
+"""Cross-user app usage, read from the AppUsageDaily aggregates.
+
+Every app time write moves its day's AppUsageDaily rows by the change, so
+a summary over any date range reads days × apps × buckets × shards rows and never
+app_time_history. Percentiles are over user-days (one user's hours on one
+app on one day) and are interpolated within the USAGE_BUCKET_EDGES bucket
+they fall in; charges at a percentile use the app's average charge per hour.
+"""
+from apptime import MAX_HOURS_PER_DAY, USAGE_BUCKET_EDGES, sql_usage_bucket
+from extensions import db
+from models import AppTimeHistory, AppUsageDaily
+
+ANALYTICS_PERCENTILES = (50, 90, 99)
+ANALYTICS_MAX_DAYS = 366
+
+
+def bucket_bounds(bucket):
+    lower = USAGE_BUCKET_EDGES[bucket - 1] if bucket else 0.0
+    # The open-ended last bucket is taken to end at MAX_HOURS_PER_DAY when interpolating
+    upper = USAGE_BUCKET_EDGES[bucket] if bucket < len(USAGE_BUCKET_EDGES) else MAX_HOURS_PER_DAY
+    return lower, upper
+
+def bucket_percentile(counts, percentile):
+    """Hours at percentile of a {bucket: user_days} histogram, linear within the bucket."""
+    total = sum(counts.values())
+    target = total * percentile / 100
+    seen = 0
+    for bucket in sorted(counts):
+        count = counts[bucket]
+        if count > 0 and seen + count >= target:
+            lower, upper = bucket_bounds(bucket)
+            return lower + (upper - lower) * (target - seen) / count
+        seen += count
+    return 0.0
+
+def app_usage(start_date, end_date, limit=None):
+    """Per-app totals, averages and percentiles between two dates, most charged first."""
+    rows = db.session.execute(
+        db.select(
+            AppUsageDaily.app_name,
+            AppUsageDaily.bucket,
+            db.func.sum(AppUsageDaily.user_days),
+            db.func.sum(AppUsageDaily.time_spent_hours),
+            db.func.sum(AppUsageDaily.amount_charged)
+        ).where(
+            AppUsageDaily.date >= start_date,
+            AppUsageDaily.date <= end_date
+        ).group_by(AppUsageDaily.app_name, AppUsageDaily.bucket)
+    ).all()
+    
+    apps = {}
+    for app_name, bucket, user_days, hours, charged in rows:
+        app = apps.setdefault(app_name, {'counts': {}, 'hours': 0.0, 'charged': 0.0})
+        app['counts'][bucket] = user_days
+        app['hours'] += hours
+        app['charged'] += charged
+    
+    result = []
+    for app_name, app in apps.items():
+        user_days = sum(app['counts'].values())
+        if user_days <= 0:
+            continue
+        rate = app['charged'] / app['hours'] if app['hours'] else 0.0
+        percentiles = {}
+        for percentile in ANALYTICS_PERCENTILES:
+            hours = bucket_percentile(app['counts'], percentile)
+            percentiles[f'p{percentile}'] = {
+                'time_spent_hours': round(hours, 2),
+                'amount_charged': round(hours * rate, 2)
+            }
+        result.append({
+            'app_name': app_name,
+            'user_days': user_days,
+            'total_hours': round(app['hours'], 2),
+            'total_charged': round(app['charged'], 2),
+            'avg_hours': round(app['hours'] / user_days, 2),
+            'avg_charged': round(app['charged'] / user_days, 2),
+            'percentiles': percentiles
+        })
+    result.sort(key=lambda entry: (-entry['total_charged'], entry['app_name']))
+    return result[:limit] if limit else result
+
+def rebuild_app_usage(start_date=None, end_date=None):
+    """Recompute AppUsageDaily from AppTimeHistory, between start_date and end_date if given.
+
+    Days outside the range are kept as they are, so compacted history
+    (see retention.py) keeps its daily usage.
+    """
+    delete = db.delete(AppUsageDaily)
+    bucket = sql_usage_bucket(AppTimeHistory.time_spent_hours)
+    source = db.select(
+        AppTimeHistory.date,
+        AppTimeHistory.app_name,
+        bucket,
+        db.func.count(),
+        db.func.sum(AppTimeHistory.time_spent_hours),
+        db.func.sum(AppTimeHistory.amount_charged)
+    ).group_by(AppTimeHistory.date, AppTimeHistory.app_name, bucket)
+    if start_date is not None:
+        delete = delete.where(AppUsageDaily.date >= start_date)
+        source = source.where(AppTimeHistory.date >= start_date)
+    if end_date is not None:
+        delete = delete.where(AppUsageDaily.date <= end_date)
+        source = source.where(AppTimeHistory.date <= end_date)
+    
+    db.session.execute(delete.execution_options(synchronize_session=False))
+    db.session.execute(
+        db.insert(AppUsageDaily).from_select(
+            ['date', 'app_name', 'bucket', 'user_days', 'time_spent_hours', 'amount_charged'],
+            source
+        )
+    )
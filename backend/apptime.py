@@ -0,0 +1,374 @@
+"""App time charging and the summaries kept on write: weekly per user, daily per app."""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import math
+import zlib
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import AppTimeHistory, AppTimeRollup, AppTimeWeekly, AppUsageDaily, User, WeeklySettlement
+
+
+CHARGE_PER_HOUR = 2.0  # £2 per hour
+APPTIME_BATCH_MAX_ENTRIES = 500
+APP_NAME_MAX_LENGTH = 255
+MAX_HOURS_PER_DAY = 24.0
+# Upper edges, in hours, of the per-user-day buckets AppUsageDaily splits
+# each day's usage into; the last bucket is open-ended
+USAGE_BUCKET_EDGES = (0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0, 12.0)
+# Live writes spread each AppUsageDaily counter over this many rows, so
+# concurrent users don't queue on one row per (date, app, bucket)
+APP_USAGE_SHARDS = 8
+
+def week_bounds(date):
+    week_start = date - timedelta(days=date.weekday())
+    return week_start, week_start + timedelta(days=6)
+
+def current_week_start():
+    return week_bounds(datetime.now().date())[0]
+
+def sql_week_start(column):
+    # Monday of the week containing column, matching week_bounds
+    if db.session.get_bind().dialect.name == 'sqlite':
+        days_since_monday = (db.cast(db.func.strftime('%w', column), db.Integer) + 6) % 7
+        return db.type_coerce(db.func.date(column, db.func.printf('-%d days', days_since_monday)), db.Date)
+    return db.cast(db.func.date_trunc('week', column), db.Date)
+
+def dialect_insert():
+    """Return the dialect insert() that supports ON CONFLICT, if any."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert
+    if dialect == 'sqlite':
+        return sqlite.insert
+    return None
+
+def usage_bucket(hours):
+    return bisect_right(USAGE_BUCKET_EDGES, hours)
+
+def usage_shard(user_id):
+    return zlib.crc32(user_id.encode()) % APP_USAGE_SHARDS
+
+def sql_usage_bucket(column):
+    # The bucket index of column, matching usage_bucket
+    return db.case(
+        *((column < edge, index) for index, edge in enumerate(USAGE_BUCKET_EDGES)),
+        else_=len(USAGE_BUCKET_EDGES)
+    )
+
+def current_weekly_totals(user_ids):
+    """Map each user id to its (hours, charge) for the current week."""
+    rows = AppTimeWeekly.query.filter(
+        AppTimeWeekly.user_id.in_(user_ids),
+        AppTimeWeekly.week_start == current_week_start()
+    ).all()
+    totals = {row.user_id: (row.time_spent_hours, row.amount_charged) for row in rows}
+    return {user_id: totals.get(user_id, (0.0, 0.0)) for user_id in user_ids}
+
+def apply_weekly_deltas(user, deltas):
+    """Add (hours, charge) deltas to the user's AppTimeWeekly rows.
+
+    deltas maps week_start to the change in that week's totals, so a write
+    costs one upsert per affected week instead of re-summing its history.
+    The user's weekly fields are only refreshed when the current week
+    changes, so back-dated edits cannot clobber them.
+    """
+    rows = [{
+        'user_id': user.user_id,
+        'week_start': week_start,
+        'time_spent_hours': hours,
+        'amount_charged': charged
+    } for week_start, (hours, charged) in deltas.items()]
+    if not rows:
+        return
+    
+    insert = dialect_insert()
+    if insert is None:
+        totals = {}
+        for row in rows:
+            weekly = db.session.get(AppTimeWeekly, (row['user_id'], row['week_start']))
+            if weekly:
+                weekly.time_spent_hours += row['time_spent_hours']
+                weekly.amount_charged += row['amount_charged']
+            else:
+                weekly = AppTimeWeekly(**row)
+                db.session.add(weekly)
+            totals[row['week_start']] = (weekly.time_spent_hours, weekly.amount_charged)
+    else:
+        stmt = insert(AppTimeWeekly).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'week_start'],
+            set_={
+                'time_spent_hours': AppTimeWeekly.time_spent_hours + stmt.excluded.time_spent_hours,
+                'amount_charged': AppTimeWeekly.amount_charged + stmt.excluded.amount_charged
+            }
+        ).returning(
+            AppTimeWeekly.week_start,
+            AppTimeWeekly.time_spent_hours,
+            AppTimeWeekly.amount_charged
+        )
+        totals = {
+            row.week_start: (row.time_spent_hours, row.amount_charged)
+            for row in db.session.execute(stmt)
+        }
+    
+    current_week = current_week_start()
+    if current_week in totals:
+        user.targeted_apps_time_weekly, user.amount_charged_weekly = totals[current_week]
+    past_weeks = [week_start for week_start in totals if week_start < current_week]
+    if past_weeks:
+        reopen_settled_weeks(past_weeks)
+
+def reopen_settled_weeks(week_starts):
+    """Flag the weeks' started settlements as changed; week_starts is a list or a SELECT of Mondays.
+
+    The next settle-week run settles the difference, so a late edit to a
+    settled week still reaches total_invested exactly once.
+    """
+    db.session.execute(
+        db.update(WeeklySettlement)
+        .where(WeeklySettlement.week_start.in_(week_starts), WeeklySettlement.reopened == db.false())
+        .values(reopened=True)
+        .execution_options(synchronize_session=False)
+    )
+
+def usage_deltas(changes):
+    """Turn (date, app_name, old, new) row changes into AppUsageDaily deltas.
+
+    old and new are (hours, charge) pairs, old None for a new row. Returns
+    {(date, app_name, bucket): [user_days, hours, charge]}.
+    """
+    deltas = {}
+    for date, app_name, old, new in changes:
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            delta = deltas.setdefault((date, app_name, usage_bucket(values[0])), [0, 0.0, 0.0])
+            delta[0] += sign
+            delta[1] += sign * values[0]
+            delta[2] += sign * values[1]
+    return deltas
+
+def apply_usage_deltas(deltas, shard=0):
+    """Add usage_deltas() to one shard of the AppUsageDaily rows with one upsert.
+
+    Only the sum over a key's shards means anything, so a change may land
+    in any shard; live writes use their user's usage_shard(). Rows are
+    written in key order, so concurrent writers touching the same days and
+    apps lock them in the same order.
+    """
+    rows = [{
+        'date': date,
+        'app_name': app_name,
+        'bucket': bucket,
+        'shard': shard,
+        'user_days': user_days,
+        'time_spent_hours': hours,
+        'amount_charged': charged
+    } for (date, app_name, bucket), (user_days, hours, charged) in sorted(deltas.items())
+        if user_days or hours or charged]
+    if not rows:
+        return
+    
+    insert = dialect_insert()
+    if insert is None:
+        for row in rows:
+            usage = db.session.get(AppUsageDaily, (row['date'], row['app_name'], row['bucket'], shard))
+            if usage:
+                usage.user_days += row['user_days']
+                usage.time_spent_hours += row['time_spent_hours']
+                usage.amount_charged += row['amount_charged']
+            else:
+                db.session.add(AppUsageDaily(**row))
+        return
+    
+    stmt = insert(AppUsageDaily).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['date', 'app_name', 'bucket', 'shard'],
+        set_={
+            'user_days': AppUsageDaily.user_days + stmt.excluded.user_days,
+            'time_spent_hours': AppUsageDaily.time_spent_hours + stmt.excluded.time_spent_hours,
+            'amount_charged': AppUsageDaily.amount_charged + stmt.excluded.amount_charged
+        }
+    ))
+
+def rebuild_weekly_totals(affected=None):
+    """Recompute AppTimeWeekly rows from AppTimeHistory and AppTimeRollup.
+
+    affected is an optional SELECT of (user_id, week_start) pairs that
+    limits the rebuild to those weeks and users; by default every row is
+    recomputed.
+    """
+    week_start = sql_week_start(AppTimeHistory.date)
+    columns = ['user_id', 'week_start', 'time_spent_hours', 'amount_charged']
+    delete = db.delete(AppTimeWeekly)
+    daily = db.select(
+        AppTimeHistory.user_id,
+        week_start.label('week_start'),
+        AppTimeHistory.time_spent_hours,
+        AppTimeHistory.amount_charged
+    )
+    rolled_up = db.select(
+        AppTimeRollup.user_id,
+        AppTimeRollup.week_start,
+        AppTimeRollup.time_spent_hours,
+        AppTimeRollup.amount_charged
+    )
+    update = db.update(User)
+    if affected is not None:
+        affected = affected.subquery()
+        users = db.select(affected.c[0])
+        pairs = db.select(affected.c[0], affected.c[1])
+        delete = delete.where(db.tuple_(AppTimeWeekly.user_id, AppTimeWeekly.week_start).in_(pairs))
+        # The user_id filter keeps the scan on the history index
+        daily = daily.where(
+            AppTimeHistory.user_id.in_(users),
+            db.tuple_(AppTimeHistory.user_id, week_start).in_(pairs)
+        )
+        rolled_up = rolled_up.where(db.tuple_(AppTimeRollup.user_id, AppTimeRollup.week_start).in_(pairs))
+        update = update.where(User.user_id.in_(users))
+    
+    # A week can hold both daily rows and a rollup (compacted before a
+    # daily row landed), so the two are summed together per week
+    rows = db.union_all(daily, rolled_up).subquery()
+    weekly = db.select(
+        rows.c.user_id,
+        rows.c.week_start,
+        db.func.sum(rows.c.time_spent_hours),
+        db.func.sum(rows.c.amount_charged)
+    ).group_by(rows.c.user_id, rows.c.week_start)
+    
+    db.session.execute(delete.execution_options(synchronize_session=False))
+    db.session.execute(db.insert(AppTimeWeekly).from_select(columns, weekly))
+    
+    current = db.select(AppTimeWeekly).where(
+        AppTimeWeekly.user_id == User.user_id,
+        AppTimeWeekly.week_start == current_week_start()
+    )
+    db.session.execute(
+        update
+        .values(
+            targeted_apps_time_weekly=db.func.coalesce(
+                current.with_only_columns(AppTimeWeekly.time_spent_hours).scalar_subquery(), 0.0
+            ),
+            amount_charged_weekly=db.func.coalesce(
+                current.with_only_columns(AppTimeWeekly.amount_charged).scalar_subquery(), 0.0
+            ),
+            row_version=User.row_version + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def upsert_app_time(rows):
+    """Write app time rows with a single INSERT ... ON CONFLICT DO UPDATE.
+
+    rows are dicts of AppTimeHistory column values, unique on
+    (user_id, date, app_name) within the batch.
+    """
+    if not rows:
+        return
+    
+    insert = dialect_insert()
+    if insert is None:
+        # No native upsert: fall back to one merge per row
+        for row in rows:
+            entry = AppTimeHistory.query.filter_by(
+                user_id=row['user_id'],
+                date=row['date'],
+                app_name=row['app_name']
+            ).first()
+            if entry:
+                entry.time_spent_hours = row['time_spent_hours']
+                entry.amount_charged = row['amount_charged']
+            else:
+                db.session.add(AppTimeHistory(**row))
+        return
+    
+    stmt = insert(AppTimeHistory).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date', 'app_name'],
+        set_={
+            'time_spent_hours': stmt.excluded.time_spent_hours,
+            'amount_charged': stmt.excluded.amount_charged
+        }
+    )
+    db.session.execute(stmt)
+
+def lock_user(user_id):
+    # Row lock held until commit; SQLite has no row locks and serializes
+    # writers on its database lock instead
+    db.session.execute(db.select(User.user_id).where(User.user_id == user_id).with_for_update())
+
+def lock_users(user_ids):
+    # lock_user() for many users at once, in user_id order so two bulk
+    # writers with overlapping users can't each hold a row the other waits for
+    db.session.execute(
+        db.select(User.user_id).where(User.user_id.in_(user_ids)).order_by(User.user_id).with_for_update()
+    )
+
+def write_app_time(user, rows):
+    """Upsert one user's app time rows and move their weekly and per-app totals by the change.
+
+    rows are dicts of AppTimeHistory column values, unique on
+    (date, app_name). The user's row is locked before the rows being
+    replaced are read, so concurrent writers of one user take turns and
+    each computes its deltas from what the previous one committed, keys
+    written for the first time included.
+    """
+    if not rows:
+        return
+    lock_user(user.user_id)
+    existing = {
+        (entry.date, entry.app_name): entry
+        for entry in AppTimeHistory.query.filter(
+            AppTimeHistory.user_id == user.user_id,
+            db.tuple_(AppTimeHistory.date, AppTimeHistory.app_name).in_(
+                [(row['date'], row['app_name']) for row in rows]
+            )
+        ).with_for_update()
+    }
+    
+    deltas = {}
+    changes = []
+    for row in rows:
+        old = existing.get((row['date'], row['app_name']))
+        week_start = week_bounds(row['date'])[0]
+        hours, charged = deltas.get(week_start, (0.0, 0.0))
+        deltas[week_start] = (
+            hours + row['time_spent_hours'] - (old.time_spent_hours if old else 0.0),
+            charged + row['amount_charged'] - (old.amount_charged if old else 0.0)
+        )
+        changes.append((
+            row['date'],
+            row['app_name'],
+            (old.time_spent_hours, old.amount_charged) if old else None,
+            (row['time_spent_hours'], row['amount_charged'])
+        ))
+    
+    upsert_app_time(rows)
+    apply_weekly_deltas(user, deltas)
+    apply_usage_deltas(usage_deltas(changes), usage_shard(user.user_id))
+
+def parse_apptime_entry(data):
+    """Validate one app time entry, returning (date, app_name, hours)."""
+    if not isinstance(data, dict):
+        raise ValueError('Entry must be an object')
+    
+    date_str = data.get('date')
+    app_name = data.get('app_name')
+    time_spent_hours = data.get('time_spent_hours', 0)
+    
+    if not date_str or not app_name:
+        raise ValueError('Date and app_name required')
+    if not isinstance(date_str, str) or not isinstance(app_name, str):
+        raise ValueError('date and app_name must be strings')
+    if len(app_name) > APP_NAME_MAX_LENGTH:
+        raise ValueError(f'app_name must be at most {APP_NAME_MAX_LENGTH} characters')
+    if isinstance(time_spent_hours, bool) or not isinstance(time_spent_hours, (int, float)):
+        raise ValueError('time_spent_hours must be a number')
+    if not math.isfinite(time_spent_hours) or not 0 <= time_spent_hours <= MAX_HOURS_PER_DAY:
+        raise ValueError(f'time_spent_hours must be between 0 and {MAX_HOURS_PER_DAY:g}')
+    
+    date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    return date, app_name, time_spent_hours
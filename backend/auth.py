@@ -0,0 +1,172 @@
+"""Bearer token verification and the request's current user."""
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import threading
+import time
+
+from flask import current_app, has_app_context, jsonify, request
+import jwt
+from sqlalchemy import event
+
+from extensions import db
+from jwks import JWKSCache
+from models import User
+
+
+class TokenCache:
+    """Per-worker LRU of decoded tokens keyed by token hash.
+
+    Entries live for at most ttl seconds and never past the token's own exp,
+    so a hit can safely skip signature verification. Entries for a user are
+    dropped when the user row changes, and entries signed with a JWKS key
+    are dropped when that key leaves the key set.
+    """
+    
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    def get(self, token):
+        if not self.max_size:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            claims, expires_at, _ = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return claims
+    
+    def put(self, token, claims, kid=None):
+        if not self.max_size:
+            return
+        key = self._key(token)
+        expires_at = min(time.time() + self.ttl, claims.get('exp', float('inf')))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (claims, expires_at, kid)
+            self._by_user.setdefault(claims.get('sub'), set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+    
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+    
+    def invalidate_keys(self, kids):
+        with self._lock:
+            for key in [key for key, (_, _, kid) in self._entries.items() if kid in kids]:
+                self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_keys = self._by_user.get(entry[0].get('sub'))
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._by_user[entry[0].get('sub')]
+
+def init_app(app):
+    token_cache = TokenCache(app.config['TOKEN_CACHE_SIZE'], app.config['TOKEN_CACHE_TTL'])
+    app.extensions['token_cache'] = token_cache
+    # Keys are only fetched when the first RS256 token arrives
+    app.extensions['jwks_cache'] = JWKSCache(
+        app.config['AUTH0_JWKS_URL'],
+        ttl=app.config['JWKS_CACHE_TTL'],
+        logger=app.logger,
+        on_keys_removed=token_cache.invalidate_keys
+    ) if app.config['AUTH0_JWKS_URL'] else None
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_user_tokens(mapper, connection, target):
+    # Writes to a user row force that user's next request to re-verify its token
+    if has_app_context():
+        current_app.extensions['token_cache'].invalidate_user(target.user_id)
+
+def decode_token(token):
+    """Verify a bearer token and return its claims.
+
+    RS256 tokens are Auth0 access tokens checked against the cached JWKS;
+    anything else must be an HS256 token issued by /auth/login. Raises
+    jwt.InvalidTokenError when verification fails.
+    """
+    header = jwt.get_unverified_header(token)
+    if header.get('alg') != 'RS256':
+        return jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=['HS256'])
+    
+    jwks_cache = current_app.extensions['jwks_cache']
+    if jwks_cache is None:
+        raise jwt.InvalidTokenError('Auth0 verification is not configured')
+    key = jwks_cache.get_key(header.get('kid'))
+    if key is None:
+        raise jwt.InvalidTokenError('Unknown signing key')
+    
+    domain = current_app.config['AUTH0_DOMAIN']
+    return jwt.decode(
+        token,
+        key,
+        algorithms=['RS256'],
+        audience=current_app.config['AUTH0_AUDIENCE'],
+        issuer=f'https://{domain}/' if domain else None,
+        options={'verify_aud': bool(current_app.config['AUTH0_AUDIENCE'])}
+    )
+
+def get_token_from_header():
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+    return None
+
+def verify_token(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = get_token_from_header()
+        if not token:
+            return jsonify({'error': 'No token provided'}), 401
+        
+        token_cache = current_app.extensions['token_cache']
+        decoded = token_cache.get(token)
+        if decoded is None:
+            try:
+                decoded = decode_token(token)
+            except jwt.InvalidTokenError:
+                return jsonify({'error': 'Invalid token'}), 401
+            token_cache.put(token, decoded, jwt.get_unverified_header(token).get('kid'))
+        
+        request.user_id = decoded.get('sub')
+        return f(*args, **kwargs)
+    return decorated_function
+
+def current_user(*columns):
+    """Return the authenticated user's row, loading it at most once per request.
+
+    columns limits the load to those User attributes (plus the primary key);
+    any other attribute is fetched on first access.
+    """
+    if not hasattr(request, 'current_user'):
+        query = User.query.filter_by(user_id=request.user_id)
+        if columns:
+            query = query.options(db.load_only(*columns))
+        request.current_user = query.first()
+    return request.current_user
@@ -0,0 +1,11 @@
+"""Load-test benchmarks for the API.
+
+    python -m benchmark seed --users 1000 --days 90 --apps 5
+    python -m benchmark run --concurrency 8 --requests 200 --output results.json
+    python -m benchmark compare baseline.json results.json
+
+seed bulk-loads a reproducible synthetic dataset, run drives every endpoint
+through the Flask test client (or a running server with --url) and records
+throughput, latency percentiles and SQL statements per request, and compare
+reports the change between two result files.
+"""
@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+
+import click
+
+from app import create_app
+from benchmark import dataset, runner
+from config import Config
+from extensions import db
+from models import User
+
+# A separate database by default, since seeding replaces its contents
+DEFAULT_DATABASE_URL = os.getenv('BENCHMARK_DATABASE_URL', 'sqlite:///benchmark.db')
+
+
+@click.group()
+def cli():
+    """Seed a synthetic dataset, benchmark the API and compare runs."""
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--users', default=1000, show_default=True, help='Synthetic users')
+@click.option('--days', default=90, show_default=True, help='Days of history per user')
+@click.option('--apps', default=5, show_default=True, help='Tracked apps per user')
+@click.option('--seed', 'seed_value', default=0, show_default=True, help='Random seed')
+@click.option('--yes', is_flag=True, help='Do not ask before replacing the database contents')
+def seed(database_url, users, days, apps, seed_value, yes):
+    """Replace the database contents with a synthetic dataset."""
+    if not yes:
+        click.confirm(f'Drop and recreate every table in {database_url}?', abort=True)
+    
+    def report(counts):
+        click.echo(f"  {counts['users']} users, {counts['app_time_history']} app time rows, "
+                   f"{counts['investment_history']} investment rows")
+    
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    with app.app_context():
+        counts = dataset.seed(users, days, apps, seed=seed_value, progress=report)
+    click.echo(f"✅ Seeded {counts['users']} users")
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True,
+              help='Database for in-process runs')
+@click.option('--url', help='Benchmark a running server (e.g. http://localhost:5000) instead')
+@click.option('--users', type=int, help='Synthetic users seeded on the server (required with --url)')
+@click.option('--jwt-secret', default=Config.JWT_SECRET, help="The server's JWT_SECRET (with --url)")
+@click.option('--requests', 'requests_count', default=100, show_default=True, help='Requests per endpoint')
+@click.option('--concurrency', default=4, show_default=True, help='Concurrent clients')
+@click.option('--warmup', default=5, show_default=True, help='Unrecorded requests per endpoint')
+@click.option('--only', multiple=True, help='Run only this scenario (repeatable)')
+@click.option('--seed', 'seed_value', default=0, show_default=True, help='Random seed for request plans')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results JSON here')
+def run(database_url, url, users, jwt_secret, requests_count, concurrency, warmup, only, seed_value, output):
+    """Benchmark every endpoint and report latency, throughput and queries."""
+    if url:
+        if users is None:
+            raise click.UsageError('--users is required with --url')
+        target = runner.HTTPTarget(url, jwt_secret)
+    else:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+        with app.app_context():
+            seeded = db.session.query(db.func.count(User.user_id)).filter(
+                User.user_id.like('bench-user-%')
+            ).scalar()
+        if not seeded:
+            raise click.ClickException(f'No benchmark users in {database_url}; run `python -m benchmark seed` first')
+        users = users or seeded
+        target = runner.AppTarget(app)
+    
+    click.echo(f"{'endpoint':<30}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}")
+    
+    def report(name, result):
+        latency = result['latency_ms']
+        queries = result['queries']['mean'] if result['queries'] else '-'
+        click.echo(f"{name:<30}{result['throughput_rps']:>9}{latency['p50']:>10}{latency['p95']:>10}"
+                   f"{latency['p99']:>10}{queries:>9}{result['errors']:>8}")
+    
+    try:
+        results = runner.run(
+            target, users, requests_count=requests_count, concurrency=concurrency,
+            only=only, seed=seed_value, warmup=warmup, progress=report
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        click.echo(f'✅ Results written to {output}')
+
+@cli.command()
+@click.argument('baseline', type=click.File())
+@click.argument('current', type=click.File())
+@click.option('--threshold', default=0.2, show_default=True, help='Allowed relative p95 increase')
+def compare(baseline, current, threshold):
+    """Compare two results files; exits 1 if any endpoint regressed."""
+    rows, regressions = runner.compare(json.load(baseline), json.load(current), threshold)
+    
+    def percent(change):
+        return f'{change:+.1%}' if change is not None else '-'
+    
+    click.echo(f"{'endpoint':<30}{'p95 ms':>20}{'p95':>9}{'rps':>9}{'queries':>16}")
+    for row in rows:
+        old_p95, new_p95 = row['p95_ms']
+        old_queries, new_queries = row['queries']
+        marker = '  ⚠️' if row['endpoint'] in regressions else ''
+        click.echo(f"{row['endpoint']:<30}{f'{old_p95} → {new_p95}':>20}{percent(row['p95_change']):>9}"
+                   f"{percent(row['throughput_change']):>9}{f'{old_queries} → {new_queries}':>16}{marker}")
+    
+    if regressions:
+        click.echo(f"❌ Regressed: {', '.join(regressions)}")
+        sys.exit(1)
+    click.echo('✅ No regressions')
+
+if __name__ == '__main__':
+    cli()
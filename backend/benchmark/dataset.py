@@ -0,0 +1,171 @@
+"""Reproducible synthetic users, app time and investment history.
+
+Rows are generated per chunk of users and bulk-loaded with COPY on
+PostgreSQL or a single executemany insert per table elsewhere, so a dataset
+of millions of rows never goes through session.add.
+"""
+import csv
+import io
+import json
+import random
+from datetime import datetime, timedelta
+
+from analytics import rebuild_app_usage
+from apptime import CHARGE_PER_HOUR, rebuild_weekly_totals, week_bounds
+from extensions import db
+from leaderboard import rebuild_leaderboard
+from models import AppTimeHistory, InvestmentHistory, User
+from portfolio import rebuild_portfolio_summaries
+
+APP_NAMES = [
+    'Instagram', 'TikTok', 'YouTube', 'Snapchat', 'Facebook', 'X', 'Reddit',
+    'Netflix', 'Twitch', 'Pinterest', 'Discord', 'WhatsApp', 'Spotify', 'Threads'
+]
+RISK_LEVELS = ['low', 'standard', 'medium', 'high']
+# Daily (drift, volatility) of the synthetic portfolio random walk per risk level
+RISK_WALKS = {
+    'low': (0.0001, 0.003),
+    'standard': (0.0002, 0.006),
+    'medium': (0.0003, 0.01),
+    'high': (0.0004, 0.02),
+}
+USER_CHUNK_SIZE = 500
+# Users per leaderboard group
+GROUP_SIZE = 50
+
+
+def benchmark_user_id(index):
+    return f'bench-user-{index:07d}'
+
+def benchmark_group_id(user_id):
+    """The leaderboard group a benchmark user is seeded into."""
+    return f'bench-group-{int(user_id.rsplit("-", 1)[1]) // GROUP_SIZE:05d}'
+
+def generate_user(rng, index, days, apps, today):
+    """Return (user, app_time_rows, investment_rows) for one synthetic user."""
+    user_id = benchmark_user_id(index)
+    tracked_apps = rng.sample(APP_NAMES, min(apps, len(APP_NAMES)))
+    risk_level = rng.choice(RISK_LEVELS)
+    # Heavy and light users: mean hours per app per day varies by user
+    mean_hours = rng.lognormvariate(-0.7, 0.6)
+    
+    app_time = []
+    charges_by_week = {}
+    for offset in range(days, 0, -1):
+        date = today - timedelta(days=offset - 1)
+        weekend = 1.3 if date.weekday() >= 5 else 1.0
+        for app_name in tracked_apps:
+            hours = round(min(rng.gammavariate(2.0, mean_hours * weekend / 2.0), 16.0), 2)
+            charged = round(hours * CHARGE_PER_HOUR, 2)
+            app_time.append({
+                'user_id': user_id,
+                'date': date,
+                'app_name': app_name,
+                'time_spent_hours': hours,
+                'amount_charged': charged
+            })
+            week_start = week_bounds(date)[0]
+            charges_by_week[week_start] = charges_by_week.get(week_start, 0.0) + charged
+    
+    # Finished weeks have been settled into total_invested; the portfolio
+    # grows by each week's contribution and a daily random walk
+    current_week = week_bounds(today)[0]
+    drift, volatility = RISK_WALKS[risk_level]
+    investments = []
+    contributed = 0.0
+    value = 0.0
+    for offset in range(days, 0, -1):
+        date = today - timedelta(days=offset - 1)
+        if date.weekday() == 0:
+            settled = charges_by_week.get(date - timedelta(days=7), 0.0)
+            contributed += settled
+            value += settled
+        value *= 1 + rng.gauss(drift, volatility)
+        if contributed > 0:
+            investments.append({
+                'user_id': user_id,
+                'date': date,
+                'portfolio_value': round(value, 2),
+                'contributed': round(contributed, 2)
+            })
+    
+    user = {
+        'user_id': user_id,
+        'name': f'Bench User {index}',
+        'email': f'{user_id}@example.com',
+        'targeted_apps_time_weekly': 0.0,
+        'amount_charged_weekly': 0.0,
+        'total_invested': round(sum(
+            charged for week_start, charged in charges_by_week.items() if week_start < current_week
+        ), 2),
+        'leaderboard_id': benchmark_group_id(user_id),
+        'investment_risk_level': risk_level,
+        'tracked_apps': tracked_apps
+    }
+    return user, app_time, investments
+
+def bulk_insert(model, rows):
+    """Insert rows (dicts with the same keys) with COPY or one executemany."""
+    if not rows:
+        return
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        db.session.execute(db.insert(model), rows)
+        return
+    
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.driver_connection.cursor()
+    cursor.copy_expert(
+        f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer
+    )
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, list):
+        return json.dumps(value)
+    return value
+
+def seed(users, days, apps, seed=0, today=None, progress=None):
+    """Replace the database contents with a synthetic dataset.
+
+    Each user tracks `apps` apps and has `days` days of history; the same
+    seed always produces the same rows. Returns row counts per table.
+    """
+    today = today or datetime.now().date()
+    rng = random.Random(seed)
+    counts = {'users': 0, 'app_time_history': 0, 'investment_history': 0}
+    
+    db.drop_all()
+    db.create_all()
+    for start in range(0, users, USER_CHUNK_SIZE):
+        chunk = [generate_user(rng, index, days, apps, today)
+                 for index in range(start, min(start + USER_CHUNK_SIZE, users))]
+        user_rows = [user for user, _, _ in chunk]
+        app_time = [row for _, rows, _ in chunk for row in rows]
+        investments = [row for _, _, rows in chunk for row in rows]
+        
+        bulk_insert(User, user_rows)
+        bulk_insert(AppTimeHistory, app_time)
+        bulk_insert(InvestmentHistory, investments)
+        db.session.commit()
+        
+        counts['users'] += len(user_rows)
+        counts['app_time_history'] += len(app_time)
+        counts['investment_history'] += len(investments)
+        if progress:
+            progress(counts)
+    
+    # Derived tables and columns are built set-based, as after a restore
+    rebuild_weekly_totals()
+    rebuild_app_usage()
+    rebuild_portfolio_summaries()
+    rebuild_leaderboard()
+    db.session.commit()
+    return counts
@@ -0,0 +1,261 @@
+"""Drive every endpoint with concurrent clients and summarise the timings.
+
+In-process runs go through the Flask test client and also count the SQL
+statements each request sends; runs against a URL measure a real server
+(for example gunicorn) over HTTP, where statement counts are not visible.
+"""
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import jwt
+import requests
+from sqlalchemy import event
+
+from benchmark.dataset import APP_NAMES, GROUP_SIZE, RISK_LEVELS, benchmark_group_id, benchmark_user_id
+from extensions import db
+
+
+def scenarios(today):
+    """Map each scenario name to a function of (rng, user_id) giving (method, path, body)."""
+    def recent_day(rng):
+        return (today - timedelta(days=rng.randrange(7))).isoformat()
+    
+    def fixed(method, path):
+        return lambda rng, user_id: (method, path, None)
+    
+    return {
+        'root': fixed('GET', '/'),
+        'health': fixed('GET', '/health'),
+        'login': lambda rng, user_id: ('POST', '/auth/login', {
+            'email': f'{user_id}@example.com', 'name': user_id, 'user_id': user_id
+        }),
+        'get_profile': fixed('GET', '/user/profile'),
+        'get_apps': fixed('GET', '/user/apps'),
+        'update_apps': lambda rng, user_id: ('PUT', '/user/apps', {
+            'tracked_apps': rng.sample(APP_NAMES, 3)
+        }),
+        'get_apptime_week': fixed('GET', '/user/apptime?days=7'),
+        'get_apptime_year_weekly': fixed('GET', '/user/apptime?days=365&bucket=week'),
+        'get_apptime_page': fixed('GET', '/user/apptime?days=90&limit=100'),
+        'export_apptime': fixed('GET', '/user/apptime/export?days=90&format=csv'),
+        'update_apptime': lambda rng, user_id: ('POST', '/user/apptime', {
+            'date': recent_day(rng),
+            'app_name': rng.choice(APP_NAMES),
+            'time_spent_hours': round(rng.uniform(0, 4), 2)
+        }),
+        'update_apptime_batch': lambda rng, user_id: ('POST', '/user/apptime/batch', {'entries': [
+            {'date': recent_day(rng), 'app_name': app_name, 'time_spent_hours': round(rng.uniform(0, 4), 2)}
+            for app_name in rng.sample(APP_NAMES, 5)
+        ]}),
+        'get_leaderboard': fixed('GET', '/leaderboard'),
+        'get_leaderboard_around': fixed('GET', '/leaderboard?around=5'),
+        'get_group_leaderboard': lambda rng, user_id: ('GET', f'/leaderboard/{benchmark_group_id(user_id)}?limit=20', None),
+        # Moves users between groups, so it runs after the group reads
+        'update_leaderboard_group': lambda rng, user_id: ('PUT', '/user/leaderboard', {
+            'leaderboard_id': benchmark_group_id(benchmark_user_id(rng.randrange(GROUP_SIZE * 4)))
+        }),
+        'get_app_analytics': fixed('GET', '/analytics/apps'),
+        'get_app_analytics_month': fixed(
+            'GET', f'/analytics/apps?start={(today - timedelta(days=29)).isoformat()}&end={today.isoformat()}'
+        ),
+        'get_portfolio': fixed('GET', '/investments/portfolio'),
+        'setup_investments': lambda rng, user_id: ('POST', '/investments/setup', {
+            'risk_level': rng.choice(RISK_LEVELS)
+        }),
+        'get_investment_history': fixed('GET', '/investments/history?days=30'),
+        'get_investment_history_year': fixed('GET', '/investments/history?days=365&points=60'),
+        'export_investment_history': fixed('GET', '/investments/history/export?format=ndjson'),
+        'get_dashboard': fixed('GET', '/dashboard'),
+    }
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, queries, errors, wall_seconds):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    summary = {
+        'requests': count,
+        'errors': errors,
+        'throughput_rps': round(count / wall_seconds, 2) if wall_seconds else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / count * 1000, 3) if count else None,
+            'p50': round(percentile(latencies, 0.50) * 1000, 3) if count else None,
+            'p95': round(percentile(latencies, 0.95) * 1000, 3) if count else None,
+            'p99': round(percentile(latencies, 0.99) * 1000, 3) if count else None,
+            'max': round(latencies[-1] * 1000, 3) if count else None,
+        },
+        'queries': None,
+    }
+    if queries:
+        summary['queries'] = {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries),
+        }
+    return summary
+
+class Target:
+    """Sends one request and returns (status, statements or None)."""
+    
+    def __init__(self, jwt_secret):
+        self.jwt_secret = jwt_secret
+        self._tokens = {}
+    
+    def headers(self, user_id):
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = jwt.encode({
+                'sub': user_id,
+                'exp': datetime.utcnow() + timedelta(hours=12)
+            }, self.jwt_secret, algorithm='HS256')
+            self._tokens[user_id] = token
+        return {'Authorization': f'Bearer {token}'}
+
+class AppTarget(Target):
+    """Requests through per-thread Flask test clients, counting SQL statements."""
+    
+    def __init__(self, app):
+        super().__init__(app.config['JWT_SECRET'])
+        self.app = app
+        self._local = threading.local()
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+    
+    def _count(self, *args):
+        self._local.statements = getattr(self._local, 'statements', 0) + 1
+    
+    def request(self, method, path, body, user_id):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        self._local.statements = 0
+        response = client.open(path, method=method, json=body, headers=self.headers(user_id))
+        # Streamed bodies only run their queries as they are read
+        response.get_data()
+        return response.status_code, self._local.statements
+
+class HTTPTarget(Target):
+    """Requests over HTTP to a running server, one connection pool per thread."""
+    
+    def __init__(self, base_url, jwt_secret, timeout=30):
+        super().__init__(jwt_secret)
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+    
+    def request(self, method, path, body, user_id):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.request(
+            method, self.base_url + path, json=body,
+            headers=self.headers(user_id), timeout=self.timeout
+        )
+        response.content
+        return response.status_code, None
+
+def run_scenario(target, build, user_count, requests_count, concurrency, rng_seed, warmup=0):
+    """Send requests_count requests (plus warmup) with concurrency threads."""
+    rng = random.Random(rng_seed)
+    plans = []
+    for _ in range(warmup + requests_count):
+        user_id = benchmark_user_id(rng.randrange(user_count))
+        plans.append((user_id, build(rng, user_id)))
+    
+    for user_id, (method, path, body) in plans[:warmup]:
+        target.request(method, path, body, user_id)
+    
+    def send(plan):
+        user_id, (method, path, body) = plan
+        started = time.perf_counter()
+        try:
+            status, statements = target.request(method, path, body, user_id)
+        except requests.RequestException:
+            status, statements = None, None
+        return time.perf_counter() - started, status, statements
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, plans[warmup:]))
+    wall = time.perf_counter() - started
+    
+    latencies = [elapsed for elapsed, _, _ in results]
+    queries = [statements for _, _, statements in results if statements is not None]
+    errors = sum(1 for _, status, _ in results if status is None or status >= 400)
+    return summarize(latencies, queries, errors, wall)
+
+def run(target, user_count, requests_count=100, concurrency=4, only=None, seed=0, warmup=5,
+        today=None, progress=None):
+    """Run every scenario (or those named in only) and return the results document."""
+    today = today or datetime.now().date()
+    plans = scenarios(today)
+    unknown = set(only or ()) - set(plans)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    
+    endpoints = {}
+    for index, (name, build) in enumerate(plans.items()):
+        if only and name not in only:
+            continue
+        method, path, _ = build(random.Random(0), benchmark_user_id(0))
+        result = run_scenario(
+            target, build, user_count, requests_count, concurrency,
+            rng_seed=seed * 1000 + index, warmup=warmup
+        )
+        endpoints[name] = {'method': method, 'path': path, **result}
+        if progress:
+            progress(name, endpoints[name])
+    
+    return {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'target': getattr(target, 'base_url', 'flask-test-client'),
+            'users': user_count,
+            'requests_per_endpoint': requests_count,
+            'concurrency': concurrency,
+            'seed': seed,
+        },
+        'endpoints': endpoints,
+    }
+
+def compare(baseline, current, threshold=0.2):
+    """Compare two results documents.
+
+    Returns (rows, regressions): one row per endpoint in both runs with the
+    relative change in p95 latency and throughput, and the names of the
+    endpoints whose p95 grew by more than threshold or that now send more
+    SQL statements per request.
+    """
+    rows = []
+    regressions = []
+    for name, new in current['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+        old_p95, new_p95 = old['latency_ms']['p95'], new['latency_ms']['p95']
+        p95_change = (new_p95 - old_p95) / old_p95 if old_p95 else None
+        rps_change = (
+            (new['throughput_rps'] - old['throughput_rps']) / old['throughput_rps']
+            if old['throughput_rps'] else None
+        )
+        old_queries = (old.get('queries') or {}).get('mean')
+        new_queries = (new.get('queries') or {}).get('mean')
+        rows.append({
+            'endpoint': name,
+            'p95_ms': (old_p95, new_p95),
+            'p95_change': p95_change,
+            'throughput_change': rps_change,
+            'queries': (old_queries, new_queries),
+        })
+        more_queries = old_queries is not None and new_queries is not None and new_queries > old_queries
+        if (p95_change is not None and p95_change > threshold) or more_queries:
+            regressions.append(name)
+    return rows, regressions
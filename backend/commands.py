@@ -0,0 +1,204 @@
+"""Maintenance commands, registered on the app by create_app."""
+from datetime import datetime, timedelta
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from analytics import rebuild_app_usage
+from apptime import current_week_start, rebuild_weekly_totals
+from events import notify_user_changes
+from extensions import db
+from idempotency import purge_idempotency_keys
+from importer import IMPORT_CHUNK_SIZE, import_app_time
+from leaderboard import rebuild_leaderboard
+from portfolio import rebuild_portfolio_summaries
+from retention import RETENTION_CHUNK_SIZE, compact_app_time, daily_boundary, retention_boundary
+from settlement import SETTLEMENT_CHUNK_SIZE, parse_week, reopened_weeks, settle_week
+
+
+@click.command('rebuild-leaderboard')
+@with_appcontext
+def rebuild_leaderboard_command():
+    """Recompute all leaderboard positions from total_invested."""
+    rebuild_leaderboard()
+    notify_user_changes()
+    db.session.commit()
+    print('✅ Leaderboard positions rebuilt')
+
+@click.command('rebuild-weekly-totals')
+@with_appcontext
+def rebuild_weekly_totals_command():
+    """Recompute the weekly app time summaries from AppTimeHistory."""
+    rebuild_weekly_totals()
+    db.session.commit()
+    print('✅ Weekly totals rebuilt')
+
+@click.command('rebuild-app-usage')
+@click.option('--since', 'since_str', help='First day to recompute (YYYY-MM-DD); defaults to all daily history')
+@with_appcontext
+def rebuild_app_usage_command(since_str):
+    """Recompute the daily per-app usage aggregates from AppTimeHistory."""
+    since = datetime.strptime(since_str, '%Y-%m-%d').date() if since_str else None
+    # Compacted days have no daily rows left to recompute them from
+    boundary = daily_boundary()
+    if boundary and (since is None or since < boundary):
+        since = boundary
+    rebuild_app_usage(since)
+    db.session.commit()
+    print('✅ App usage rebuilt' + (f' from {since.isoformat()}' if since else ''))
+
+@click.command('rebuild-portfolio-summaries')
+@with_appcontext
+def rebuild_portfolio_summaries_command():
+    """Recompute every user's portfolio summary from InvestmentHistory."""
+    rebuild_portfolio_summaries()
+    notify_user_changes()
+    db.session.commit()
+    print('✅ Portfolio summaries rebuilt')
+
+@click.command('settle-week')
+@click.option('--week', 'week', help='ISO week (2025-W07) or a date in it; defaults to last week')
+@click.option('--chunk-size', default=SETTLEMENT_CHUNK_SIZE, show_default=True, help='Users per transaction')
+@with_appcontext
+def settle_week_command(week, chunk_size):
+    """Roll a finished week's charges into total_invested."""
+    if week:
+        try:
+            week_start = parse_week(week)
+        except ValueError:
+            raise click.BadParameter(f'{week!r} is not an ISO week or YYYY-MM-DD date', param_hint='--week')
+    else:
+        week_start = current_week_start() - timedelta(days=7)
+    
+    if week_start >= current_week_start():
+        raise click.ClickException(f'Week of {week_start} has not finished yet')
+    
+    # Charges still in this host's write-behind journal belong in the week
+    buffer = current_app.extensions.get('apptime_buffer')
+    if buffer is not None:
+        print(f'  flushed {buffer.drain()} pending app time rows')
+    
+    def report(applied, upper):
+        print(f'  applied {applied} users' + (f' up to {upper}' if upper else ''))
+    
+    print(f'Settling week of {week_start.isoformat()}...')
+    settlement = settle_week(week_start, chunk_size=chunk_size, progress=report)
+    if settlement is None:
+        print(f'Week of {week_start.isoformat()} was already settled')
+    else:
+        print(f'✅ Settled £{settlement.amount_settled:.2f} for {settlement.users_settled} users')
+    
+    # Late edits to weeks settled before are settled by the difference
+    for reopened in reopened_weeks():
+        print(f'Settling changes to the week of {reopened.isoformat()}...')
+        settlement = settle_week(reopened, chunk_size=chunk_size, progress=report)
+        if settlement is not None:
+            print(f'✅ Week of {reopened.isoformat()} now settles £{settlement.amount_settled:.2f}')
+
+@click.command('flush-apptime')
+@with_appcontext
+def flush_apptime_command():
+    """Write every app time update waiting in the write-behind journal."""
+    buffer = current_app.extensions.get('apptime_buffer')
+    if buffer is None:
+        raise click.ClickException('APPTIME_WRITE_BEHIND is not enabled')
+    flushed = buffer.drain()
+    failed = buffer.failed()
+    if failed:
+        print(f'⚠️  {len(failed)} rejected rows are kept in failed_app_time in {buffer.path}')
+    print(f'✅ Flushed {flushed} app time rows')
+
+@click.command('compact-apptime')
+@click.option('--chunk-size', default=RETENTION_CHUNK_SIZE, show_default=True, help='Users compacted per transaction')
+@with_appcontext
+def compact_apptime_command(chunk_size):
+    """Roll daily app time older than APPTIME_RETENTION_DAYS into weekly rows."""
+    cutoff = retention_boundary()
+    if cutoff is None:
+        raise click.ClickException('APPTIME_RETENTION_DAYS is not set')
+    
+    # Journaled updates for old days must land before their week is compacted
+    buffer = current_app.extensions.get('apptime_buffer')
+    if buffer is not None:
+        print(f'  flushed {buffer.drain()} pending app time rows')
+    
+    def report(removed, upper):
+        print(f'  compacted {removed} rows up to {upper}')
+    
+    print(f'Compacting app time before {cutoff.isoformat()}...')
+    removed = compact_app_time(cutoff, chunk_size=chunk_size, progress=report)
+    print(f'✅ Rolled {removed} daily rows into weekly totals')
+
+@click.command('import-apptime')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'user_id', help='User id for records without a user_id column')
+@click.option('--replace', is_flag=True, help='Overwrite days that already have app time')
+@click.option('--import-id', help='Progress key to resume under; defaults to one per file path, size and mtime')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Records staged per transaction')
+@with_appcontext
+def import_apptime_command(paths, user_id, replace, import_id, chunk_size):
+    """Load historical app time from CSV, NDJSON or JSON export files."""
+    if import_id and len(paths) > 1:
+        raise click.BadParameter('can only be given for a single file', param_hint='--import-id')
+    
+    # Journaled updates must land first, so they are replaced or kept as asked
+    buffer = current_app.extensions.get('apptime_buffer')
+    if buffer is not None:
+        print(f'  flushed {buffer.drain()} pending app time rows')
+    
+    def report(read, staged, rejected):
+        print(f'  read {read} records, staged {staged}, rejected {rejected}')
+    
+    for path in paths:
+        print(f'Importing {path}...')
+        result = import_app_time(path, user_id=user_id, import_id=import_id, replace=replace,
+                                 chunk_size=chunk_size, progress=report)
+        print(f'✅ {path}: merged {result.rows_merged} of {result.rows_staged} rows '
+              f'({result.rows_rejected} rejected, finished {result.merged_at:%Y-%m-%d %H:%M})')
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Delete stored Idempotency-Key responses older than IDEMPOTENCY_TTL."""
+    removed = purge_idempotency_keys()
+    db.session.commit()
+    print(f'✅ Removed {removed} expired idempotency keys')
+
+@click.command('value-portfolios')
+@click.option('--date', 'date_str', help='Valuation date (YYYY-MM-DD); defaults to today')
+@click.option('--prices', 'prices_path', help='date,close CSV of benchmark prices')
+@click.option('--chunk-size', default=50000, show_default=True, help='Users valued per chunk')
+@with_appcontext
+def value_portfolios_command(date_str, prices_path, chunk_size):
+    """Write every user's InvestmentHistory row for a day."""
+    # NumPy is only needed by the valuation job, not the web workers
+    from valuation import load_price_series, value_portfolios
+    
+    day = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else datetime.now().date()
+    if day > datetime.now().date():
+        raise click.BadParameter(f'{day.isoformat()} is in the future', param_hint='--date')
+    prices = load_price_series(prices_path or os.getenv('PRICE_SERIES_PATH'))
+    if day > prices.last_date:
+        print(f'⚠️  Prices end on {prices.last_date.isoformat()}; later days are valued at that price')
+    
+    def report(users, written, upper):
+        print(f'  valued {users} users, wrote {written} rows (up to {upper})')
+    
+    print(f'Valuing portfolios for {day.isoformat()}...')
+    written = value_portfolios(day, prices, chunk_size=chunk_size, progress=report)
+    print(f'✅ Wrote {written} portfolio values')
+
+COMMANDS = (
+    rebuild_leaderboard_command,
+    rebuild_weekly_totals_command,
+    rebuild_app_usage_command,
+    rebuild_portfolio_summaries_command,
+    settle_week_command,
+    flush_apptime_command,
+    compact_apptime_command,
+    import_apptime_command,
+    purge_idempotency_keys_command,
+    value_portfolios_command,
+)
@@ -0,0 +1,65 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def database_url():
+    # Handle DATABASE_URL from environment or construct from components
+    # For quick testing, use SQLite if no PostgreSQL is available
+    url = os.getenv('DATABASE_URL')
+    if url:
+        return url
+    # Check if we should use SQLite for quick testing
+    if os.getenv('USE_SQLITE', 'false').lower() == 'true':
+        return 'sqlite:///test.db'
+    db_user = os.getenv('DB_USER', 'postgres')
+    db_password = os.getenv('DB_PASSWORD', 'postgres')
+    db_host = os.getenv('DB_HOST', 'localhost')
+    db_port = os.getenv('DB_PORT', '5432')
+    db_name = os.getenv('DB_NAME', 'screen_time_db')
+    return f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Reads in GET requests go to DATABASE_REPLICA_URL when set (see replicas.py)
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} if os.getenv('DATABASE_REPLICA_URL') else {}
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+    JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
+    # CORS configuration - allow all origins in development, restrict in production
+    CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:80').split(',')
+    # Per-worker cache of verified tokens; set TOKEN_CACHE_SIZE=0 to disable
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+    TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '300'))
+    # Per-worker cache of each group leaderboard's top page; set LEADERBOARD_GROUP_CACHE_SIZE=0 to disable
+    LEADERBOARD_GROUP_CACHE_SIZE = int(os.getenv('LEADERBOARD_GROUP_CACHE_SIZE', '10000'))
+    LEADERBOARD_GROUP_CACHE_TTL = int(os.getenv('LEADERBOARD_GROUP_CACHE_TTL', '30'))
+    # GET /events sends a keep-alive after this many idle seconds and ends streams (clients reconnect) after EVENTS_STREAM_SECONDS
+    EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+    EVENTS_STREAM_SECONDS = float(os.getenv('EVENTS_STREAM_SECONDS', '300'))
+    # Responses to writes sent with an Idempotency-Key are replayed to retries for
+    # IDEMPOTENCY_TTL seconds; IDEMPOTENCY_PERSIST shares them across workers
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+    IDEMPOTENCY_PERSIST = os.getenv('IDEMPOTENCY_PERSIST', 'true').lower() == 'true'
+    # Auth0 access tokens (RS256) are verified when a domain or JWKS source is set
+    AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN')
+    AUTH0_AUDIENCE = os.getenv('AUTH0_AUDIENCE')
+    AUTH0_JWKS_URL = os.getenv('AUTH0_JWKS_URL')
+    JWKS_CACHE_TTL = int(os.getenv('JWKS_CACHE_TTL', '600'))
+    # Prometheus metrics on /metrics; METRICS_ENABLED=false installs no hooks
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    # Bearer token scrapers send to /metrics; /metrics is not served without one
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Development aid: log N+1 patterns and slow statements with their plans
+    QUERY_DEBUG = os.getenv('QUERY_DEBUG', 'false').lower() == 'true'
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+    QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '3'))
+    # Write-behind journal for POST /user/apptime (defaults to instance/apptime-journal.db)
+    APPTIME_WRITE_BEHIND = os.getenv('APPTIME_WRITE_BEHIND', 'false').lower() == 'true'
+    APPTIME_JOURNAL_PATH = os.getenv('APPTIME_JOURNAL_PATH')
+    APPTIME_FLUSH_INTERVAL = float(os.getenv('APPTIME_FLUSH_INTERVAL', '5'))
+    # Days of daily app time kept before `flask compact-apptime` rolls them into weeks; 0 keeps all
+    APPTIME_RETENTION_DAYS = int(os.getenv('APPTIME_RETENTION_DAYS', '0'))
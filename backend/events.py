@@ -0,0 +1,241 @@
+"""Server-sent events for live rank and portfolio changes.
+
+GET /events keeps a stream open per client. Each worker runs one publisher
+thread: when ranks or portfolio values change it reads the subscribed
+users' values with one query per EVENTS_READ_CHUNK users and pushes only
+what differs from the last values sent, so N connected clients cost one
+read per change rather than N polls.
+
+Writers call notify_user_changes() inside their transaction. On Postgres
+that is a NOTIFY on EVENTS_CHANNEL, delivered to every worker's LISTEN
+connection when the transaction commits, including commits made by flask
+commands. On other databases it only wakes the publisher of the process
+that committed.
+
+Streams wait on the publisher, not on a database connection, so they are
+served by gevent workers (gunicorn.conf.py); a sync worker would be held
+for the whole life of each stream.
+"""
+import json
+import os
+import select
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import User
+from portfolio import serialize_portfolio
+
+EVENTS_CHANNEL = 'fyh_user_changes'
+EVENTS_READ_CHUNK = 1000
+# Client reconnect delay sent with every stream, and the publisher's delay
+# before reconnecting after a database error
+EVENTS_RETRY_SECONDS = 5
+LISTEN_POLL_SECONDS = 60
+
+SNAPSHOT_COLUMNS = (
+    User.user_id,
+    User.leaderboard_position,
+    User.leaderboard_id,
+    User.total_invested,
+    User.portfolio_value,
+    User.portfolio_previous_value,
+    User.investment_risk_level
+)
+
+
+def user_snapshot(row):
+    """The event payloads for one row of SNAPSHOT_COLUMNS, keyed by event name."""
+    return {
+        'rank': {
+            'leaderboard_position': row.leaderboard_position,
+            'leaderboard_id': row.leaderboard_id,
+            'total_invested': row.total_invested
+        },
+        'portfolio': serialize_portfolio(row)
+    }
+
+class Subscription:
+    """One stream's unsent events; a newer event replaces an unsent one of the same name."""
+    
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+    
+    def push(self, name, data):
+        with self._lock:
+            self._pending[name] = data
+        self._ready.set()
+    
+    def wait(self, timeout):
+        """Return the unsent events by name, waiting up to timeout seconds for one."""
+        self._ready.wait(timeout)
+        with self._lock:
+            self._ready.clear()
+            pending, self._pending = self._pending, {}
+        return pending
+
+class EventPublisher:
+    """This worker's subscriptions and the last values sent to each user."""
+    
+    def __init__(self):
+        self._subscriptions = {}
+        self._sent = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._publisher_pid = None
+        self._publisher_lock = threading.Lock()
+    
+    def subscribe(self, user_id, snapshot):
+        """Open a subscription for user_id, starting with the events in snapshot."""
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+            self._sent.setdefault(user_id, dict(snapshot))
+        for name, data in snapshot.items():
+            subscription.push(name, data)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+                self._sent.pop(subscription.user_id, None)
+    
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+    
+    def wake(self):
+        self._wake.set()
+    
+    def refresh(self):
+        """Read every subscribed user's values and push the ones that changed.
+
+        Needs an app context. Returns the number of events pushed.
+        """
+        with self._lock:
+            user_ids = list(self._subscriptions)
+        pushed = 0
+        for start in range(0, len(user_ids), EVENTS_READ_CHUNK):
+            rows = db.session.execute(
+                db.select(*SNAPSHOT_COLUMNS).where(User.user_id.in_(user_ids[start:start + EVENTS_READ_CHUNK]))
+            ).all()
+            for row in rows:
+                snapshot = user_snapshot(row)
+                with self._lock:
+                    sent = self._sent.get(row.user_id)
+                    if sent is None:
+                        continue
+                    changed = {name: data for name, data in snapshot.items() if sent.get(name) != data}
+                    sent.update(changed)
+                    subscriptions = list(self._subscriptions.get(row.user_id, ()))
+                for subscription in subscriptions:
+                    for name, data in changed.items():
+                        subscription.push(name, data)
+                        pushed += 1
+        return pushed
+    
+    def start(self, app):
+        """Start this process's publisher thread unless it is already running.
+
+        Called per request rather than at import, so a --preload master
+        never runs one and each forked worker starts its own.
+        """
+        if self._publisher_pid == os.getpid():
+            return
+        with self._publisher_lock:
+            if self._publisher_pid == os.getpid():
+                return
+            self._publisher_pid = os.getpid()
+            threading.Thread(target=self._publish_forever, args=(app,), name='event-publisher', daemon=True).start()
+    
+    def _publish_forever(self, app):
+        while True:
+            listener = None
+            try:
+                with app.app_context():
+                    listener = listen()
+                while True:
+                    # Changes made while (re)connecting are picked up here too
+                    with app.app_context():
+                        try:
+                            self.refresh()
+                        finally:
+                            db.session.remove()
+                    self._wait(listener)
+            except Exception:
+                app.logger.exception('Event publisher failed; reconnecting')
+                time.sleep(EVENTS_RETRY_SECONDS)
+            finally:
+                if listener is not None:
+                    listener.close()
+    
+    def _wait(self, listener):
+        if listener is None:
+            self._wake.wait()
+            self._wake.clear()
+            return
+        while True:
+            select.select([listener], [], [], LISTEN_POLL_SECONDS)
+            # Raises on a dropped connection, which reconnects
+            listener.poll()
+            if listener.notifies:
+                # Notifications that arrive together are read once
+                listener.notifies.clear()
+                return
+
+def listen():
+    """A dedicated psycopg2 connection LISTENing on EVENTS_CHANNEL, or None off Postgres."""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    connection = db.engine.raw_connection()
+    # Held for the life of the thread, so it does not count against the pool
+    connection.detach()
+    listener = connection.driver_connection
+    listener.autocommit = True
+    listener.cursor().execute(f'LISTEN {EVENTS_CHANNEL}')
+    return listener
+
+def notify_user_changes():
+    """Tell every worker's publisher that ranks or portfolios changed once this transaction commits."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(db.select(db.func.pg_notify(EVENTS_CHANNEL, '')))
+    else:
+        db.session.info['notify_user_changes'] = True
+
+@event.listens_for(Session, 'after_commit')
+def wake_publisher(session):
+    if session.info.pop('notify_user_changes', False) and has_app_context():
+        publisher = current_app.extensions.get('event_publisher')
+        if publisher is not None:
+            publisher.wake()
+
+def event_stream(publisher, subscription, heartbeat, duration):
+    """Yield SSE frames for subscription until duration passes or the client goes away.
+
+    Uses no app or request context, so nothing is held while it waits.
+    """
+    try:
+        yield f'retry: {EVENTS_RETRY_SECONDS * 1000}\n\n'
+        ends_at = time.monotonic() + duration
+        while time.monotonic() < ends_at:
+            events = subscription.wait(min(heartbeat, ends_at - time.monotonic()))
+            if not events:
+                # Lets proxies and the server notice a client that has gone away
+                yield ': keep-alive\n\n'
+            for name, data in events.items():
+                yield f'event: {name}\ndata: {json.dumps(data)}\n\n'
+    finally:
+        publisher.unsubscribe(subscription)
+
+def init_app(app):
+    app.extensions['event_publisher'] = EventPublisher()
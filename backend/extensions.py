@@ -0,0 +1,10 @@
+"""Flask extensions, created unbound and attached to an app by create_app."""
+from flask_cors import CORS
+from flask_migrate import Migrate
+from flask_sqlalchemy import SQLAlchemy
+
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
+cors = CORS()
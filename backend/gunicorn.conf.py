@@ -0,0 +1,38 @@
+"""gunicorn settings, picked up automatically from the working directory.
+
+The worker class and the multi-process metrics housekeeping live here;
+bind, workers and --preload stay on the command line (Procfile, Dockerfile).
+"""
+import glob
+import os
+import tempfile
+
+# GET /events streams wait on the event publisher rather than a thread of
+# their own, so gevent workers each hold thousands of them. Patch before
+# --preload imports the app, so its locks, sockets and threads cooperate;
+# GUNICORN_WORKER_CLASS=sync skips it. C calls that block without the patched
+# library (the write-behind journal's sqlite3 and flock) stall the whole
+# worker, so writebehind.off_hub moves them to gevent's thread pool; NumPy
+# valuation runs only in `flask value-portfolios`, outside the workers
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+if worker_class.startswith('gevent'):
+    from gevent import monkey
+    monkey.patch_all()
+    # psycopg2 is a C extension; this makes its waits yield to other greenlets
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+# Set up before --preload imports the app, so every worker shares one sample
+# directory; samples left by a previous run would be added to this one's
+multiproc_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'fyh-prometheus')
+)
+os.makedirs(multiproc_dir, exist_ok=True)
+for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+    os.remove(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
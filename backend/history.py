@@ -0,0 +1,140 @@
+"""History downsampling, paging and export helpers shared by the history endpoints."""
+from datetime import datetime, timedelta
+import base64
+import csv
+import io
+import json
+
+from flask import Response, request, stream_with_context
+
+from apptime import sql_week_start, week_bounds
+from extensions import db
+
+
+def encode_cursor(*values):
+    """Opaque keyset cursor holding the sort key of the last row returned."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, size):
+    """Decode a cursor into its list of values; raises ValueError if malformed."""
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+def sql_bucket_start(column, bucket):
+    """First day of the day/week/month bucket containing column."""
+    if bucket == 'week':
+        return sql_week_start(column)
+    if bucket == 'month':
+        if db.session.get_bind().dialect.name == 'sqlite':
+            return db.type_coerce(db.func.date(column, 'start of month'), db.Date)
+        return db.cast(db.func.date_trunc('month', column), db.Date)
+    return column
+
+def bucket_start_of(date, bucket):
+    """First day of the bucket containing date, as sql_bucket_start computes it."""
+    if bucket == 'week':
+        return week_bounds(date)[0]
+    if bucket == 'month':
+        return date.replace(day=1)
+    return date
+
+HISTORY_BUCKETS = ('day', 'week', 'month')
+HISTORY_PAGE_MAX = 1000
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def read_history_page_args():
+    """Return (limit, cursor) for a paged history read, or (None, None)."""
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return None, None
+    limit = max(1, min(limit or HISTORY_PAGE_MAX, HISTORY_PAGE_MAX))
+    return limit, cursor
+
+def export_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def stream_export(statements, columns, fmt, filename):
+    """Stream the rows of statements, one after another, as NDJSON or CSV.
+
+    Rows are fetched through a server-side cursor in EXPORT_BATCH_SIZE
+    partitions, so memory per request stays constant however long the
+    history is.
+    """
+    def partitions():
+        for statement in statements:
+            result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            yield from result.partitions()
+    
+    def generate():
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for partition in partitions():
+                writer.writerows([export_value(v) for v in row] for row in partition)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            for partition in partitions():
+                yield ''.join(
+                    json.dumps(dict(zip(columns, map(export_value, row)))) + '\n'
+                    for row in partition
+                )
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'}
+    )
+
+def read_export_args():
+    """Return (format, start_date) for an export; start_date is None for all history."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    days = request.args.get('days', type=int)
+    start_date = datetime.now().date() - timedelta(days=days) if days is not None else None
+    return fmt, start_date
+
+def bucket_count(start_date, end_date, bucket):
+    """Number of day/week/month buckets the dates from start_date to end_date fall in."""
+    if bucket == 'week':
+        return (week_bounds(end_date)[0] - week_bounds(start_date)[0]).days // 7 + 1
+    if bucket == 'month':
+        return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+    return (end_date - start_date).days + 1
+
+def resolve_history_bucket(start_date, end_date):
+    """Read ?bucket= or ?points= into (bucket name or None for raw rows, start_date).
+
+    points=N picks the finest bucket that keeps the range within N buckets.
+    When even months would give more, start_date moves up to the first day
+    of the last N months. Raises ValueError for an unknown bucket or
+    non-positive points.
+    """
+    bucket = request.args.get('bucket')
+    points = request.args.get('points', type=int)
+    
+    if bucket is not None:
+        if bucket not in HISTORY_BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(HISTORY_BUCKETS)}")
+        return bucket, start_date
+    if points is not None:
+        if points < 1:
+            raise ValueError('points must be positive')
+        for bucket in HISTORY_BUCKETS:
+            if bucket_count(start_date, end_date, bucket) <= points:
+                return bucket, start_date
+        months = end_date.year * 12 + end_date.month - points
+        return 'month', end_date.replace(year=months // 12, month=months % 12 + 1, day=1)
+    return None, start_date
@@ -0,0 +1,161 @@
+"""Idempotency-Key support for the user write endpoints.
+
+A client retrying a write sends the same Idempotency-Key header with the
+same request. The first response to finish (any status below 500) is kept
+for IDEMPOTENCY_TTL seconds in a per-worker LRU and, with
+IDEMPOTENCY_PERSIST on, in the idempotency_keys table so other workers see
+it too. A retry gets that response back, marked Idempotent-Replayed, without
+running the endpoint or touching its tables. Reusing a key for a different
+request is a 422.
+
+Two copies of a request racing on one key can both run; the endpoints only
+write absolute values, so the second repeats the first's write and its
+response is not stored.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import threading
+import time
+
+from flask import current_app, jsonify, request
+from sqlalchemy.exc import IntegrityError
+
+from apptime import dialect_insert
+from extensions import db
+from models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+StoredResponse = namedtuple('StoredResponse', 'fingerprint status_code body mimetype')
+
+
+class ResponseCache:
+    """Per-worker LRU of stored responses keyed by (user_id, key), each kept for ttl seconds."""
+    
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id, key):
+        if not self.max_size:
+            return None
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            stored, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[(user_id, key)]
+                return None
+            self._entries.move_to_end((user_id, key))
+            return stored
+    
+    def put(self, user_id, key, stored, ttl=None):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries.pop((user_id, key), None)
+            self._entries[(user_id, key)] = (stored, time.monotonic() + (self.ttl if ttl is None else ttl))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def init_app(app):
+    app.extensions['idempotency_cache'] = ResponseCache(
+        app.config['IDEMPOTENCY_CACHE_SIZE'], app.config['IDEMPOTENCY_TTL']
+    )
+
+def request_fingerprint():
+    """Hash of what makes two requests the same: method, path and body."""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def find_response(user_id, key):
+    """The stored response for a key, from this worker's cache or the table, or None."""
+    cache = current_app.extensions['idempotency_cache']
+    stored = cache.get(user_id, key)
+    if stored is not None or not current_app.config['IDEMPOTENCY_PERSIST']:
+        return stored
+    
+    row = db.session.get(IdempotencyKey, (user_id, key))
+    if row is None:
+        return None
+    remaining = current_app.config['IDEMPOTENCY_TTL'] - (datetime.utcnow() - row.created_at).total_seconds()
+    if remaining <= 0:
+        return None
+    stored = StoredResponse(row.fingerprint, row.status_code, row.body, row.mimetype)
+    cache.put(user_id, key, stored, ttl=remaining)
+    return stored
+
+def store_response(user_id, key, stored):
+    current_app.extensions['idempotency_cache'].put(user_id, key, stored)
+    if not current_app.config['IDEMPOTENCY_PERSIST']:
+        return
+    
+    values = {'user_id': user_id, 'key': key, 'created_at': datetime.utcnow(), **stored._asdict()}
+    insert = dialect_insert()
+    try:
+        if insert is None:
+            db.session.execute(db.insert(IdempotencyKey).values(values))
+        else:
+            # An expired row for the same key is replaced; a live one means a
+            # concurrent copy of this request got there first
+            expired = datetime.utcnow() - timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+            stmt = insert(IdempotencyKey).values(values)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['user_id', 'key'],
+                set_={column: stmt.excluded[column] for column in values if column not in ('user_id', 'key')},
+                where=IdempotencyKey.created_at < expired
+            ))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+def replay(stored):
+    response = current_app.response_class(stored.body, status=stored.status_code, mimetype=stored.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(f):
+    """Replay the stored response for a repeated Idempotency-Key; use after verify_token."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return f(*args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters'}), 400
+        
+        fingerprint = request_fingerprint()
+        stored = find_response(request.user_id, key)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+            return replay(stored)
+        
+        response = current_app.make_response(f(*args, **kwargs))
+        # Server errors may be transient, so their retries run again
+        if response.status_code < 500:
+            store_response(request.user_id, key, StoredResponse(
+                fingerprint, response.status_code, response.get_data(as_text=True), response.mimetype
+            ))
+        return response
+    return decorated_function
+
+def purge_idempotency_keys():
+    """Delete stored responses older than IDEMPOTENCY_TTL; returns the number removed."""
+    expired = datetime.utcnow() - timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+    return db.session.execute(
+        db.delete(IdempotencyKey)
+        .where(IdempotencyKey.created_at < expired)
+        .execution_options(synchronize_session=False)
+    ).rowcount
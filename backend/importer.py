@@ -0,0 +1,340 @@
+"""Bulk import of historical app time from screen-time export files.
+
+`flask import-apptime` reads CSV, NDJSON or JSON array exports record by
+record, validates and normalizes each one and stages the good ones in
+app_time_import_rows, a chunk per transaction (COPY on PostgreSQL, one
+executemany elsewhere). Each chunk commits together with its file's
+records_read, so an interrupted import picks up after the last committed
+chunk. Once a file is staged, one transaction merges it into
+app_time_history, recomputes the affected weeks, moves the per-app days of
+the imported keys by what changed and drops the staged rows.
+
+Records for the same user, day and app within a file are added together,
+since exports often split a day into sessions. Days that already have app
+time are kept unless the import replaces them. Rows for unknown users are
+skipped at the merge.
+"""
+import csv
+from datetime import datetime
+import hashlib
+import io
+from itertools import chain, islice
+import json
+import math
+import os
+import re
+
+from apptime import (
+    APP_NAME_MAX_LENGTH, CHARGE_PER_HOUR, MAX_HOURS_PER_DAY, apply_usage_deltas, dialect_insert, lock_users,
+    rebuild_weekly_totals, reopen_settled_weeks, sql_usage_bucket, sql_week_start
+)
+from extensions import db
+from models import AppTimeHistory, AppTimeImport, AppTimeImportRow, User
+from retention import check_writable
+
+IMPORT_CHUNK_SIZE = 10000
+
+# Export spellings and package / bundle ids of the targeted apps, casefolded
+APP_NAME_ALIASES = {
+    'tiktok': 'TikTok',
+    'tik tok': 'TikTok',
+    'com.zhiliaoapp.musically': 'TikTok',
+    'com.ss.android.ugc.trill': 'TikTok',
+    'instagram': 'Instagram',
+    'com.instagram.android': 'Instagram',
+    'com.burbn.instagram': 'Instagram',
+    'youtube': 'YouTube',
+    'you tube': 'YouTube',
+    'com.google.android.youtube': 'YouTube',
+    'com.google.ios.youtube': 'YouTube',
+    'reddit': 'Reddit',
+    'com.reddit.frontpage': 'Reddit',
+    'com.reddit.reddit': 'Reddit',
+}
+# Field names each value is taken from, first match wins
+APP_NAME_FIELDS = ('app_name', 'app', 'package', 'bundle_id')
+HOURS_FIELDS = (('time_spent_hours', 1.0), ('hours', 1.0), ('minutes', 60.0), ('seconds', 3600.0))
+
+
+def normalize_app_name(name):
+    """Collapse whitespace and map known aliases to the app's display name."""
+    name = re.sub(r'\s+', ' ', str(name)).strip()
+    return APP_NAME_ALIASES.get(name.casefold(), name)[:APP_NAME_MAX_LENGTH]
+
+def first_field(record, fields):
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ''):
+            return field, value
+    return None, None
+
+def parse_import_record(record, user_id=None):
+    """Validate one export record, returning (user_id, date, app_name, hours).
+
+    user_id is used for records without one of their own. Raises ValueError
+    for anything that would not be accepted by POST /user/apptime.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+    
+    user_id = record.get('user_id') or user_id
+    if not user_id:
+        raise ValueError('user_id required')
+    
+    date_str = record.get('date')
+    if not date_str:
+        raise ValueError('date required')
+    # Timestamps count towards their calendar day
+    date = datetime.strptime(str(date_str)[:10], '%Y-%m-%d').date()
+    if date > datetime.now().date():
+        raise ValueError('date is in the future')
+    check_writable(date)
+    
+    _, app_name = first_field(record, APP_NAME_FIELDS)
+    app_name = normalize_app_name(app_name) if app_name is not None else ''
+    if not app_name:
+        raise ValueError('app_name required')
+    
+    field, value = first_field(record, [field for field, _ in HOURS_FIELDS])
+    if field is None:
+        raise ValueError('time_spent_hours required')
+    if isinstance(value, bool):
+        raise ValueError(f'{field} must be a number')
+    hours = float(value) / dict(HOURS_FIELDS)[field]
+    if not math.isfinite(hours) or not 0 <= hours <= MAX_HOURS_PER_DAY:
+        raise ValueError(f'{field} must be between 0 and {MAX_HOURS_PER_DAY:g} hours')
+    
+    return str(user_id), date, app_name, hours
+
+def read_records(file):
+    """Yield the records of a CSV, NDJSON or JSON export, one dict at a time.
+
+    CSV and NDJSON are streamed; a JSON array, or an object with an
+    "entries" array as POST /user/apptime/batch takes, is parsed whole, so
+    very large exports should be CSV or NDJSON.
+    """
+    first = file.readline()
+    while first and not first.strip():
+        first = file.readline()
+    start = first.lstrip()[:1]
+    if start == '[':
+        yield from json.loads(first + file.read())
+    elif start == '{':
+        try:
+            record = json.loads(first)
+        except ValueError:
+            # A pretty-printed object spread over several lines
+            record = json.loads(first + file.read())
+        if isinstance(record.get('entries'), list):
+            yield from record['entries']
+            return
+        yield record
+        for line in file:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Rejected by parse_import_record like any other bad record
+                    yield line
+    elif first:
+        yield from csv.DictReader(chain([first], file))
+
+def file_import_id(path):
+    """An import id that stays the same for an unchanged file."""
+    stat = os.stat(path)
+    return hashlib.sha1(f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()
+
+def stage_rows(rows):
+    """Append validated rows to app_time_import_rows with COPY, or executemany elsewhere."""
+    if not rows:
+        return
+    if db.session.get_bind().dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow((row['import_id'], row['seq'], row['user_id'], row['date'].isoformat(),
+                             row['app_name'], repr(row['time_spent_hours'])))
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            'COPY app_time_import_rows (import_id, seq, user_id, date, app_name, time_spent_hours) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        return
+    db.session.execute(db.insert(AppTimeImportRow), rows)
+
+def stage_import(progress_row, records, user_id=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Stage records after the ones progress_row has already read, chunk_size per transaction."""
+    records = islice(records, progress_row.records_read, None)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        rows = []
+        rejected = 0
+        for seq, record in enumerate(chunk, start=progress_row.records_read):
+            try:
+                row_user_id, date, app_name, hours = parse_import_record(record, user_id)
+            except (TypeError, ValueError):
+                rejected += 1
+                continue
+            rows.append({
+                'import_id': progress_row.import_id,
+                'seq': seq,
+                'user_id': row_user_id,
+                'date': date,
+                'app_name': app_name,
+                'time_spent_hours': hours
+            })
+        stage_rows(rows)
+        progress_row.records_read += len(chunk)
+        progress_row.rows_staged += len(rows)
+        progress_row.rows_rejected += rejected
+        db.session.commit()
+        
+        if progress:
+            progress(progress_row.records_read, progress_row.rows_staged, progress_row.rows_rejected)
+
+def import_usage_deltas(imported, replace):
+    """AppUsageDaily deltas, shaped like usage_deltas(), of merging the imported rows.
+
+    imported is a subquery of the (user_id, date, app_name,
+    time_spent_hours, amount_charged) rows about to be merged. The rows are
+    summed per (date, app_name, bucket) in the database, so only those
+    groups come back however large the import.
+    """
+    def changes(rows, sign):
+        return db.select(
+            rows.c.date,
+            rows.c.app_name,
+            sql_usage_bucket(rows.c.time_spent_hours).label('bucket'),
+            db.literal(sign).label('user_days'),
+            (rows.c.time_spent_hours * sign).label('time_spent_hours'),
+            (rows.c.amount_charged * sign).label('amount_charged')
+        )
+    
+    stored = db.select(AppTimeHistory).join(imported, db.and_(
+        AppTimeHistory.user_id == imported.c.user_id,
+        AppTimeHistory.date == imported.c.date,
+        AppTimeHistory.app_name == imported.c.app_name
+    )).subquery()
+    if replace:
+        # Replaced rows leave their bucket, every imported row joins one
+        parts = [changes(imported, 1), changes(stored, -1)]
+    else:
+        parts = [changes(imported, 1).where(~db.select(stored.c.history_id).where(
+            stored.c.user_id == imported.c.user_id,
+            stored.c.date == imported.c.date,
+            stored.c.app_name == imported.c.app_name
+        ).exists())]
+    rows = (db.union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+    grouped = db.select(
+        rows.c.date,
+        rows.c.app_name,
+        rows.c.bucket,
+        db.func.sum(rows.c.user_days),
+        db.func.sum(rows.c.time_spent_hours),
+        db.func.sum(rows.c.amount_charged)
+    ).group_by(rows.c.date, rows.c.app_name, rows.c.bucket)
+    return {
+        (date, app_name, bucket): [user_days, hours, charged]
+        for date, app_name, bucket, user_days, hours, charged in db.session.execute(grouped)
+    }
+
+def merge_import(progress_row, replace=False):
+    """Merge an import's staged rows into app_time_history and its summaries; returns rows written.
+
+    The history insert, the rebuild of the affected weeks, the per-app
+    day changes and the staged rows' removal are left for the caller to
+    commit as one transaction. The affected users are locked first, as
+    write_app_time() locks its user, so live writes to them wait for the
+    merge instead of racing the weekly rebuild.
+    """
+    import_id = progress_row.import_id
+    staged = [AppTimeImportRow.import_id == import_id]
+    bounds = db.session.execute(
+        db.select(db.func.min(AppTimeImportRow.date), db.func.max(AppTimeImportRow.date)).where(*staged)
+    ).one()
+    merged = 0
+    if bounds[0] is not None:
+        lock_users(db.select(AppTimeImportRow.user_id).where(*staged).distinct())
+        hours = db.func.sum(AppTimeImportRow.time_spent_hours)
+        source = db.select(
+            AppTimeImportRow.user_id,
+            AppTimeImportRow.date,
+            AppTimeImportRow.app_name,
+            hours.label('time_spent_hours'),
+            (hours * CHARGE_PER_HOUR).label('amount_charged')
+        ).where(
+            *staged,
+            AppTimeImportRow.user_id.in_(db.select(User.user_id))
+        ).group_by(AppTimeImportRow.user_id, AppTimeImportRow.date, AppTimeImportRow.app_name)
+        columns = ['user_id', 'date', 'app_name', 'time_spent_hours', 'amount_charged']
+        # Taken before the merge overwrites the stored rows they compare against
+        usage = import_usage_deltas(source.subquery(), replace)
+        
+        insert = dialect_insert()
+        if insert is None:
+            # No native upsert: drop or skip the days that already have app time
+            existing = db.select(AppTimeImportRow.seq).where(
+                *staged,
+                AppTimeImportRow.user_id == AppTimeHistory.user_id,
+                AppTimeImportRow.date == AppTimeHistory.date,
+                AppTimeImportRow.app_name == AppTimeHistory.app_name
+            ).exists()
+            if replace:
+                db.session.execute(db.delete(AppTimeHistory).where(existing).execution_options(synchronize_session=False))
+            else:
+                source = source.where(~db.select(AppTimeHistory.history_id).where(
+                    AppTimeHistory.user_id == AppTimeImportRow.user_id,
+                    AppTimeHistory.date == AppTimeImportRow.date,
+                    AppTimeHistory.app_name == AppTimeImportRow.app_name
+                ).exists())
+            merged = db.session.execute(db.insert(AppTimeHistory).from_select(columns, source)).rowcount
+        else:
+            stmt = insert(AppTimeHistory).from_select(columns, source)
+            if replace:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['user_id', 'date', 'app_name'],
+                    set_={
+                        'time_spent_hours': stmt.excluded.time_spent_hours,
+                        'amount_charged': stmt.excluded.amount_charged
+                    }
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=['user_id', 'date', 'app_name'])
+            merged = db.session.execute(stmt).rowcount
+        
+        rebuild_weekly_totals(
+            db.select(AppTimeImportRow.user_id, sql_week_start(AppTimeImportRow.date)).where(*staged).distinct()
+        )
+        reopen_settled_weeks(db.select(sql_week_start(AppTimeImportRow.date)).where(*staged).distinct())
+        apply_usage_deltas(usage)
+    
+    db.session.execute(db.delete(AppTimeImportRow).where(*staged).execution_options(synchronize_session=False))
+    progress_row.rows_merged = merged
+    progress_row.merged_at = datetime.utcnow()
+    return merged
+
+def import_app_time(path, user_id=None, import_id=None, replace=False, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Stage and merge one export file, resuming an earlier run of the same import.
+
+    Returns the file's AppTimeImport row; a file that was already merged is
+    left alone.
+    """
+    import_id = import_id or file_import_id(path)
+    progress_row = db.session.get(AppTimeImport, import_id)
+    if progress_row is None:
+        progress_row = AppTimeImport(import_id=import_id, path=str(path)[:1024],
+                                     records_read=0, rows_staged=0, rows_rejected=0)
+        db.session.add(progress_row)
+        db.session.commit()
+    if progress_row.merged_at is not None:
+        return progress_row
+    
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        stage_import(progress_row, read_records(file), user_id, chunk_size, progress)
+    merge_import(progress_row, replace)
+    db.session.commit()
+    return progress_row
@@ -1,14 +1,25 @@
-from app import app, db, User, AppTimeHistory, InvestmentHistory
+import os
+
+from flask_migrate import stamp
+
+from analytics import rebuild_app_usage
+from app import create_app
+from apptime import rebuild_weekly_totals
+from extensions import db
+from models import User, AppTimeHistory, InvestmentHistory
+from portfolio import rebuild_portfolio_summaries
 from datetime import datetime, timedelta
 import random
 
 def seed_dummy_data():
     """Seed the database with 3 dummy accounts"""
     
-    with app.app_context():
+    with create_app().app_context():
         # Clear existing data (optional - comment out if you want to keep existing data)
         db.drop_all()
         db.create_all()
+        # create_all builds the latest schema, so mark every migration as applied
+        stamp(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
         
         # Account 1 - Sarah Chen
         sarah = User(
@@ -167,6 +178,11 @@ def seed_dummy_data():
         
         db.session.commit()
         
+        # Build the weekly and per-app summaries the app time endpoints maintain on write
+        rebuild_weekly_totals()
+        rebuild_app_usage()
+        db.session.commit()
+        
         # Generate InvestmentHistory for last 30 days
         # Sarah (medium risk): Starting at £650, ending at £784 (+20.6% growth)
         sarah_start = 650.0
@@ -221,7 +237,10 @@ def seed_dummy_data():
                 date=date,
                 portfolio_value=round(value, 2)
             ))
+        db.session.flush()
         
+        # Build the portfolio summaries the valuation job maintains on write
+        rebuild_portfolio_summaries()
         db.session.commit()
         print("✅ Database seeded with dummy data!")
 
@@ -0,0 +1,79 @@
+"""In-process cache of an Auth0 tenant's JSON Web Key Set.
+
+Keys are fetched once, parsed into public key objects up front and reused
+until the TTL expires, so verifying an RS256 token needs no network call.
+A token signed with an unknown kid (key rotation) triggers one refresh,
+shared by every thread that asks at the same time.
+"""
+import json
+import threading
+import time
+
+import jwt
+import requests
+
+
+class JWKSCache:
+    """Signing keys from a JWKS URL or local file, keyed by kid.
+
+    source is an https:// URL, a file:// URL or a filesystem path. Unknown
+    kids trigger a refresh at most once every min_refresh_interval seconds,
+    so tokens with made-up kids cannot force a fetch per request.
+    on_keys_removed, if given, is called with the kids a refresh dropped.
+    """
+    
+    def __init__(self, source, ttl=600, min_refresh_interval=30, timeout=5, logger=None,
+                 on_keys_removed=None):
+        self.source = source
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.logger = logger
+        self.on_keys_removed = on_keys_removed
+        self._keys = {}
+        self._fetched_at = None
+        self._generation = 0
+        self._refresh_lock = threading.Lock()
+    
+    def get_key(self, kid):
+        """Return the public key for kid, or None if the set does not have it."""
+        fetched_at = self._fetched_at
+        if fetched_at is None or time.monotonic() - fetched_at >= self.ttl:
+            self.refresh()
+        elif kid not in self._keys and time.monotonic() - fetched_at >= self.min_refresh_interval:
+            self.refresh()
+        return self._keys.get(kid)
+    
+    def refresh(self):
+        """Fetch the key set, unless another thread did so while we waited."""
+        generation = self._generation
+        with self._refresh_lock:
+            if self._generation != generation:
+                return
+            try:
+                keys = {
+                    key.key_id: key.key
+                    for key in jwt.PyJWKSet.from_dict(self._fetch()).keys
+                    if key.key_id
+                }
+            except (OSError, ValueError, requests.RequestException, jwt.PyJWKSetError) as e:
+                # Keep serving the previous keys and retry after min_refresh_interval
+                if self.logger:
+                    self.logger.warning('JWKS refresh from %s failed: %s', self.source, e)
+                self._fetched_at = time.monotonic() - self.ttl + self.min_refresh_interval
+            else:
+                removed = self._keys.keys() - keys.keys()
+                self._keys = keys
+                self._fetched_at = time.monotonic()
+                if removed and self.on_keys_removed:
+                    self.on_keys_removed(removed)
+            self._generation += 1
+    
+    def _fetch(self):
+        if self.source.startswith(('http://', 'https://')):
+            response = requests.get(self.source, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        path = self.source[len('file://'):] if self.source.startswith('file://') else self.source
+        with open(path) as f:
+            return json.load(f)
@@ -0,0 +1,236 @@
+"""Leaderboard ranking, ordered by total_invested DESC, user_id ASC.
+
+Users with the same total_invested share a position, one plus the number of
+users with more, so a new user at zero moves nobody. user_id only orders ties
+within pages. The global leaderboard ranks every user; group leaderboards
+rank the users sharing a leaderboard_id, on ix_users_group_leaderboard.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from extensions import db
+from history import decode_cursor, encode_cursor
+from models import AppTimeWeekly, User
+
+
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 100
+LEADERBOARD_GROUP_MAX_LENGTH = 255
+
+
+class GroupLeaderboardCache:
+    """Per-worker LRU of each group's top (user_id, row_version, total_invested) rows, best first.
+
+    Entries hold enough rows for any first page and live for at most ttl
+    seconds, so a group's order lags changes made by other workers and
+    commands by at most that long. Writes in this worker drop the entry.
+    """
+    
+    def __init__(self, max_groups, ttl, top_size=LEADERBOARD_MAX_PAGE_SIZE + 1):
+        self.max_groups = max_groups
+        self.ttl = ttl
+        self.top_size = top_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, group_id):
+        if not self.max_groups:
+            return None
+        with self._lock:
+            entry = self._entries.get(group_id)
+            if entry is None:
+                return None
+            top, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[group_id]
+                return None
+            self._entries.move_to_end(group_id)
+            return top
+    
+    def put(self, group_id, top):
+        if not self.max_groups:
+            return
+        with self._lock:
+            self._entries.pop(group_id, None)
+            self._entries[group_id] = (top, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_groups:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, group_id):
+        with self._lock:
+            self._entries.pop(group_id, None)
+
+def init_app(app):
+    app.extensions['group_leaderboard_cache'] = GroupLeaderboardCache(
+        app.config['LEADERBOARD_GROUP_CACHE_SIZE'], app.config['LEADERBOARD_GROUP_CACHE_TTL']
+    )
+
+@event.listens_for(User, 'after_update')
+def invalidate_group_leaderboards(mapper, connection, target):
+    # Only ORM writes are seen here; bulk updates such as settlement are
+    # picked up when the cached entry expires
+    cache = current_app.extensions.get('group_leaderboard_cache') if has_app_context() else None
+    if cache is None:
+        return
+    state = db.inspect(target)
+    moved = state.attrs.leaderboard_id.history
+    if moved.has_changes():
+        for group_id in [*moved.deleted, *moved.added]:
+            cache.invalidate(group_id)
+    elif state.attrs.total_invested.history.has_changes():
+        cache.invalidate(target.leaderboard_id)
+
+def load_group_top(group_id):
+    """The group's first GroupLeaderboardCache.top_size (user_id, row_version, total_invested) rows."""
+    cache = current_app.extensions['group_leaderboard_cache']
+    top = cache.get(group_id)
+    if top is None:
+        top = [tuple(row) for row in db.session.query(User.user_id, User.row_version, User.total_invested).filter(
+            User.leaderboard_id == group_id
+        ).order_by(User.total_invested.desc(), User.user_id).limit(cache.top_size)]
+        cache.put(group_id, top)
+    return top
+
+def group_position(group_id, total_invested):
+    """1-based rank of total_invested within a group, counted on its index."""
+    return db.session.query(db.func.count(User.user_id)).filter(
+        User.leaderboard_id == group_id,
+        User.total_invested > total_invested
+    ).scalar() + 1
+
+def group_rows_ahead(group_id, total_invested, user_id):
+    """How many group members come before (total_invested, user_id) in page order."""
+    return db.session.query(db.func.count(User.user_id)).filter(
+        User.leaderboard_id == group_id,
+        ranked_ahead_of(total_invested, user_id)
+    ).scalar()
+
+def group_weekly_average(group_id, week_start):
+    """Average (hours, charge) of a group's members for one week, members without app time counting as zero."""
+    members, hours, charged = db.session.execute(
+        db.select(
+            db.func.count(User.user_id),
+            db.func.coalesce(db.func.sum(AppTimeWeekly.time_spent_hours), 0.0),
+            db.func.coalesce(db.func.sum(AppTimeWeekly.amount_charged), 0.0)
+        ).outerjoin(AppTimeWeekly, db.and_(
+            AppTimeWeekly.user_id == User.user_id,
+            AppTimeWeekly.week_start == week_start
+        )).where(User.leaderboard_id == group_id)
+    ).one()
+    if not members:
+        return 0.0, 0.0
+    return hours / members, charged / members
+
+def page_positions(totals, first_position, offset):
+    """Shared positions of a page of totals, best first.
+
+    first_position is the first row's position and offset the number of
+    rows before the page; a row below the one before it is ranked by its
+    place in the whole order.
+    """
+    positions = []
+    for index, total in enumerate(totals):
+        if not index:
+            positions.append(first_position)
+        elif total == totals[index - 1]:
+            positions.append(positions[-1])
+        else:
+            positions.append(offset + index + 1)
+    return positions
+
+def ranked_ahead_of(total_invested, user_id):
+    # The leading range predicate keeps the comparison on ix_users_leaderboard
+    return db.and_(
+        User.total_invested >= total_invested,
+        db.or_(User.total_invested > total_invested, User.user_id < user_id)
+    )
+
+def ranked_behind(total_invested, user_id):
+    return db.and_(
+        User.total_invested <= total_invested,
+        db.or_(User.total_invested < total_invested, User.user_id > user_id)
+    )
+
+def shift_leaderboard_positions(criteria, delta):
+    db.session.execute(
+        db.update(User)
+        .where(*criteria)
+        .values(
+            leaderboard_position=User.leaderboard_position + delta,
+            row_version=User.row_version + 1
+        )
+        # Shift users already loaded in the session too; a stale position there
+        # could equal a later rank and make the ORM skip writing it
+        .execution_options(synchronize_session='evaluate')
+    )
+
+def update_leaderboard_rank(user):
+    """Give a user that is not ranked yet the position matching its total_invested.
+
+    Only users with a smaller total move back one, so a new user at zero
+    shifts no one. Later changes to total_invested are ranked in bulk by
+    rebuild_leaderboard.
+    """
+    new_total = user.total_invested or 0.0
+    user.total_invested = new_total
+    shift_leaderboard_positions([User.total_invested < new_total, User.user_id != user.user_id], 1)
+    
+    ahead = db.session.query(db.func.count(User.user_id)).filter(
+        User.total_invested > new_total
+    ).scalar()
+    user.leaderboard_position = ahead + 1
+
+def rebuild_leaderboard():
+    """Recompute every leaderboard_position in one set-based UPDATE.
+
+    Used after every change to total_invested, such as settlement, and to
+    repair any drift left by concurrent signups.
+    """
+    db.session.execute(
+        db.update(User)
+        .where(User.total_invested.is_(None))
+        .values(total_invested=0.0)
+        .execution_options(synchronize_session=False)
+    )
+    ranked = db.select(
+        User.user_id,
+        db.func.rank().over(order_by=User.total_invested.desc()).label('position')
+    ).subquery()
+    db.session.execute(
+        db.update(User)
+        .where(
+            User.user_id == ranked.c.user_id,
+            User.leaderboard_position.is_distinct_from(ranked.c.position)
+        )
+        .values(leaderboard_position=ranked.c.position, row_version=User.row_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def encode_leaderboard_cursor(user):
+    return encode_cursor(user.total_invested or 0.0, user.user_id)
+
+def decode_leaderboard_cursor(cursor):
+    total_invested, user_id = decode_cursor(cursor, 2)
+    return float(total_invested), str(user_id)
+
+def load_leaderboard_users(user_ids):
+    """Load full rows for user_ids in one query, keeping the given order."""
+    users = {user.user_id: user for user in User.query.filter(User.user_id.in_(user_ids))}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+def serialize_leaderboard_entry(user, weekly_totals):
+    hours, charged = weekly_totals[user.user_id]
+    return {
+        'user_id': user.user_id,
+        'name': user.name,
+        'pfp': user.pfp,
+        'targeted_apps_time_weekly': hours,
+        'amount_charged_weekly': charged,
+        'total_invested': user.total_invested,
+        'leaderboard_position': user.leaderboard_position,
+        'tracked_apps': user.tracked_apps or []
+    }
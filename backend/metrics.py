@@ -0,0 +1,134 @@
+"""Prometheus instrumentation for requests, SQL and the connection pool.
+
+Every request records its duration per route and status, and how many SQL
+statements it sent and how long they took. Set METRICS_ENABLED=false to
+install no hooks at all. /metrics answers only requests bearing
+METRICS_TOKEN, and is not served at all until one is set.
+
+Under gunicorn each worker writes its samples to PROMETHEUS_MULTIPROC_DIR and
+/metrics aggregates all of them. gunicorn.conf.py sets a default directory,
+clears it on start and cleans up after dead workers; the variable has to be
+set before this module is imported, which is when the metrics are created.
+"""
+import hmac
+import os
+import time
+
+from flask import Response, current_app, has_request_context, jsonify, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from extensions import db
+
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request',
+    ['method', 'route', 'status']
+)
+REQUEST_STATEMENTS = Histogram(
+    'http_request_db_statements', 'SQL statements sent while handling a request',
+    ['method', 'route'], buckets=STATEMENT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL statements while handling a request',
+    ['method', 'route']
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection'
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited.
+
+    The wait includes opening a new connection when the pool has room to
+    grow, and the time blocked on a full pool otherwise.
+    """
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+def init_app(app):
+    """Install the hooks and /metrics; call before db.init_app."""
+    if not app.config['METRICS_ENABLED']:
+        return
+    
+    # SQLite keeps Flask-SQLAlchemy's own pool (in-memory databases need it)
+    if make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        options.setdefault('poolclass', TimedQueuePool)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    binds = {}
+    for key, value in (app.config.get('SQLALCHEMY_BINDS') or {}).items():
+        options = dict(value) if isinstance(value, dict) else {'url': value}
+        if make_url(options['url']).get_backend_name() != 'sqlite':
+            options.setdefault('poolclass', TimedQueuePool)
+        binds[key] = options
+    app.config['SQLALCHEMY_BINDS'] = binds
+    
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', render_metrics)
+    app.extensions['metrics'] = True
+
+def init_engines(app):
+    """Time SQL statements on the app's engines; call after db.init_app."""
+    if not app.extensions.get('metrics'):
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def start_request():
+    request.metrics_started = time.perf_counter()
+    request.db_statements = 0
+    request.db_seconds = 0.0
+
+def finish_request(response):
+    started = getattr(request, 'metrics_started', None)
+    if started is None:
+        return response
+    # The rule, not the path, so /user/<id> style routes share one series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_DURATION.labels(request.method, route, str(response.status_code)).observe(
+        time.perf_counter() - started
+    )
+    REQUEST_STATEMENTS.labels(request.method, route).observe(request.db_statements)
+    REQUEST_DB_TIME.labels(request.method, route).observe(request.db_seconds)
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_started', None)
+    if started is None or not has_request_context() or not hasattr(request, 'db_statements'):
+        return
+    request.db_statements += 1
+    request.db_seconds += time.perf_counter() - started
+
+def render_metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        # Fresh registry per scrape: it reads every worker's files
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
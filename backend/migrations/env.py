@@ -8,7 +8,11 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from app import app, db
+from flask import current_app, has_app_context
+
+from config import Config
+from extensions import db
+import models  # noqa: F401 - registers the tables on db.metadata
 
 # this is the Alembic Config object
 config = context.config
@@ -17,8 +21,10 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
-# Set SQLAlchemy URL from app config
-config.set_main_option('sqlalchemy.url', app.config['SQLALCHEMY_DATABASE_URI'])
+# Set SQLAlchemy URL from the running app under `flask db`, else from the environment
+config.set_main_option('sqlalchemy.url', (
+    current_app.config['SQLALCHEMY_DATABASE_URI'] if has_app_context() else Config.SQLALCHEMY_DATABASE_URI
+))
 
 target_metadata = db.metadata
 
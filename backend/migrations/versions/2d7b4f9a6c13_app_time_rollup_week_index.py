@@ -0,0 +1,25 @@
+"""index app_time_rollup by week
+
+Lets retention find the newest compacted week without scanning the rollups.
+
+Revision ID: 2d7b4f9a6c13
+Revises: 7c3e9b5f1d84
+Create Date: 2026-10-18 16:41:09.204518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7b4f9a6c13'
+down_revision = '7c3e9b5f1d84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_app_time_rollup_week_start', 'app_time_rollup', ['week_start'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_app_time_rollup_week_start', table_name='app_time_rollup')
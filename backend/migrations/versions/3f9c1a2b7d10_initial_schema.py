@@ -0,0 +1,86 @@
+"""initial schema
+
+Databases created by init_db.py or db.create_all() already have these
+tables, so each one is only created when it is missing. Run
+`flask rebuild-weekly-totals` after upgrading a database that predates
+app_time_weekly.
+
+Revision ID: 3f9c1a2b7d10
+Revises: 
+Create Date: 2026-10-17 09:12:44.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c1a2b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('email', sa.String(length=255), nullable=False),
+            sa.Column('pfp', sa.String(length=500), nullable=True),
+            sa.Column('targeted_apps_time_weekly', sa.Float(), nullable=True),
+            sa.Column('amount_charged_weekly', sa.Float(), nullable=True),
+            sa.Column('total_invested', sa.Float(), nullable=True),
+            sa.Column('leaderboard_id', sa.String(length=255), nullable=True),
+            sa.Column('leaderboard_position', sa.Integer(), nullable=True),
+            sa.Column('investment_risk_level', sa.String(length=50), nullable=True),
+            sa.Column('tracked_apps', sa.JSON(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('user_id'),
+            sa.UniqueConstraint('email')
+        )
+
+    if 'app_time_history' not in existing:
+        op.create_table(
+            'app_time_history',
+            sa.Column('history_id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('app_name', sa.String(length=255), nullable=False),
+            sa.Column('time_spent_hours', sa.Float(), nullable=False),
+            sa.Column('amount_charged', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+            sa.PrimaryKeyConstraint('history_id')
+        )
+
+    if 'investment_history' not in existing:
+        op.create_table(
+            'investment_history',
+            sa.Column('investment_id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('portfolio_value', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+            sa.PrimaryKeyConstraint('investment_id')
+        )
+
+    if 'app_time_weekly' not in existing:
+        op.create_table(
+            'app_time_weekly',
+            sa.Column('user_id', sa.String(length=255), nullable=False),
+            sa.Column('week_start', sa.Date(), nullable=False),
+            sa.Column('time_spent_hours', sa.Float(), nullable=False),
+            sa.Column('amount_charged', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+            sa.PrimaryKeyConstraint('user_id', 'week_start')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('app_time_weekly')
+    op.drop_table('investment_history')
+    op.drop_table('app_time_history')
+    op.drop_table('users')
@@ -0,0 +1,34 @@
+"""weekly per-app rollup of compacted app time
+
+Revision ID: 4c8e1f6a9b23
+Revises: 9d2f7a4c6e15
+Create Date: 2026-10-17 22:20:11.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e1f6a9b23'
+down_revision = '9d2f7a4c6e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'app_time_rollup',
+        sa.Column('user_id', sa.String(length=255), nullable=False),
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column('app_name', sa.String(length=255), nullable=False),
+        sa.Column('time_spent_hours', sa.Float(), nullable=False),
+        sa.Column('amount_charged', sa.Float(), nullable=False),
+        sa.Column('days', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('user_id', 'week_start', 'app_name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('app_time_rollup')
@@ -0,0 +1,25 @@
+"""record contributions on investment history rows
+
+Revision ID: 5a0e7c3b9d62
+Revises: c71d5e9a2f48
+Create Date: 2026-10-17 12:20:14.873305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a0e7c3b9d62'
+down_revision = 'c71d5e9a2f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('investment_history', sa.Column('contributed', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('investment_history') as batch_op:
+        batch_op.drop_column('contributed')
@@ -0,0 +1,53 @@
+"""shard app_usage_daily counters
+
+Each (date, app_name, bucket) key becomes up to apptime.APP_USAGE_SHARDS
+rows that readers sum, so concurrent app time writes stop queueing on one
+row. Existing rows become shard 0.
+
+Revision ID: 6e1a8c4d2f97
+Revises: 2d7b4f9a6c13
+Create Date: 2026-10-18 18:22:47.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1a8c4d2f97'
+down_revision = '2d7b4f9a6c13'
+branch_labels = None
+depends_on = None
+
+
+def drop_primary_key(batch_op):
+    # SQLite's primary key is unnamed; the batch copy replaces it instead
+    if op.get_bind().dialect.name != 'sqlite':
+        batch_op.drop_constraint('app_usage_daily_pkey', type_='primary')
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('app_usage_daily') as batch_op:
+        batch_op.add_column(sa.Column('shard', sa.Integer(), nullable=False, server_default='0'))
+        drop_primary_key(batch_op)
+        batch_op.create_primary_key('app_usage_daily_pkey', ['date', 'app_name', 'bucket', 'shard'])
+
+
+def downgrade() -> None:
+    # Fold every key's shards into one row before dropping the column
+    op.execute(
+        'CREATE TABLE app_usage_daily_totals AS '
+        'SELECT date, app_name, bucket, SUM(user_days) AS user_days, '
+        'SUM(time_spent_hours) AS time_spent_hours, SUM(amount_charged) AS amount_charged '
+        'FROM app_usage_daily GROUP BY date, app_name, bucket'
+    )
+    op.execute('DELETE FROM app_usage_daily')
+    with op.batch_alter_table('app_usage_daily') as batch_op:
+        drop_primary_key(batch_op)
+        batch_op.drop_column('shard')
+        batch_op.create_primary_key('app_usage_daily_pkey', ['date', 'app_name', 'bucket'])
+    op.execute(
+        'INSERT INTO app_usage_daily (date, app_name, bucket, user_days, time_spent_hours, amount_charged) '
+        'SELECT date, app_name, bucket, user_days, time_spent_hours, amount_charged FROM app_usage_daily_totals'
+    )
+    op.drop_table('app_usage_daily_totals')
@@ -0,0 +1,40 @@
+"""settle late changes to settled weeks
+
+settlement_ledger.applied becomes applied_amount, the part of the week's
+charge already added to total_invested, and weekly_settlements.reopened
+marks weeks changed since their settlement started.
+
+Revision ID: 7c3e9b5f1d84
+Revises: f1b6d3e8a275
+Create Date: 2026-10-18 14:06:51.330947
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9b5f1d84'
+down_revision = 'f1b6d3e8a275'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('weekly_settlements') as batch_op:
+        batch_op.add_column(sa.Column('reopened', sa.Boolean(), nullable=False, server_default=sa.false()))
+    with op.batch_alter_table('settlement_ledger') as batch_op:
+        batch_op.add_column(sa.Column('applied_amount', sa.Float(), nullable=False, server_default='0'))
+    op.execute('UPDATE settlement_ledger SET applied_amount = amount WHERE applied')
+    with op.batch_alter_table('settlement_ledger') as batch_op:
+        batch_op.drop_column('applied')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('settlement_ledger') as batch_op:
+        batch_op.add_column(sa.Column('applied', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.execute('UPDATE settlement_ledger SET applied = (applied_amount = amount)')
+    with op.batch_alter_table('settlement_ledger') as batch_op:
+        batch_op.drop_column('applied_amount')
+    with op.batch_alter_table('weekly_settlements') as batch_op:
+        batch_op.drop_column('reopened')
@@ -0,0 +1,58 @@
+"""indexes and uniqueness for history tables and the leaderboard
+
+Duplicate (user_id, date, app_name) app time rows and duplicate
+(user_id, date) portfolio rows are removed first, keeping the most
+recently inserted row, so the unique indexes can be built.
+
+Revision ID: 8b4e2d6f0a31
+Revises: 3f9c1a2b7d10
+Create Date: 2026-10-17 09:31:05.402671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e2d6f0a31'
+down_revision = '3f9c1a2b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        'DELETE FROM app_time_history WHERE history_id NOT IN ('
+        'SELECT keep_id FROM (SELECT MAX(history_id) AS keep_id FROM app_time_history '
+        'GROUP BY user_id, date, app_name) AS latest)'
+    )
+    op.execute(
+        'DELETE FROM investment_history WHERE investment_id NOT IN ('
+        'SELECT keep_id FROM (SELECT MAX(investment_id) AS keep_id FROM investment_history '
+        'GROUP BY user_id, date) AS latest)'
+    )
+    op.execute('UPDATE users SET total_invested = 0 WHERE total_invested IS NULL')
+
+    op.create_index(
+        'ix_app_time_history_user_date_app',
+        'app_time_history',
+        ['user_id', 'date', 'app_name'],
+        unique=True
+    )
+    op.create_index(
+        'ix_investment_history_user_date',
+        'investment_history',
+        ['user_id', 'date'],
+        unique=True
+    )
+    op.create_index(
+        'ix_users_leaderboard',
+        'users',
+        [sa.text('total_invested DESC'), 'user_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_leaderboard', table_name='users')
+    op.drop_index('ix_investment_history_user_date', table_name='investment_history')
+    op.drop_index('ix_app_time_history_user_date_app', table_name='app_time_history')
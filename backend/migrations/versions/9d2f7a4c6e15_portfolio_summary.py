@@ -0,0 +1,61 @@
+"""store each user's latest two portfolio values on the user row
+
+Revision ID: 9d2f7a4c6e15
+Revises: e3a96f14c2b7
+Create Date: 2026-10-17 15:02:37.514920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2f7a4c6e15'
+down_revision = 'e3a96f14c2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('portfolio_value', sa.Float(), nullable=True))
+    op.add_column('users', sa.Column('portfolio_date', sa.Date(), nullable=True))
+    op.add_column('users', sa.Column('portfolio_previous_value', sa.Float(), nullable=True))
+    op.add_column('users', sa.Column('portfolio_previous_date', sa.Date(), nullable=True))
+
+    # Backfill from existing history; the second UPDATE reads the dates set by the first
+    op.execute("""
+        UPDATE users SET
+            portfolio_date = (
+                SELECT MAX(date) FROM investment_history
+                WHERE investment_history.user_id = users.user_id
+            ),
+            portfolio_previous_date = (
+                SELECT MAX(date) FROM investment_history
+                WHERE investment_history.user_id = users.user_id
+                AND investment_history.date < (
+                    SELECT MAX(date) FROM investment_history latest
+                    WHERE latest.user_id = users.user_id
+                )
+            )
+    """)
+    op.execute("""
+        UPDATE users SET
+            portfolio_value = (
+                SELECT portfolio_value FROM investment_history
+                WHERE investment_history.user_id = users.user_id
+                AND investment_history.date = users.portfolio_date
+            ),
+            portfolio_previous_value = (
+                SELECT portfolio_value FROM investment_history
+                WHERE investment_history.user_id = users.user_id
+                AND investment_history.date = users.portfolio_previous_date
+            )
+    """)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('portfolio_previous_date')
+        batch_op.drop_column('portfolio_previous_value')
+        batch_op.drop_column('portfolio_date')
+        batch_op.drop_column('portfolio_value')
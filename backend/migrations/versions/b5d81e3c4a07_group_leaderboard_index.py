@@ -0,0 +1,32 @@
+"""index for per-group leaderboards
+
+Users without a leaderboard_id are put in a group of their own, as login
+does for new users.
+
+Revision ID: b5d81e3c4a07
+Revises: 4c8e1f6a9b23
+Create Date: 2026-10-17 23:04:37.518290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d81e3c4a07'
+down_revision = '4c8e1f6a9b23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('UPDATE users SET leaderboard_id = user_id WHERE leaderboard_id IS NULL')
+    op.create_index(
+        'ix_users_group_leaderboard',
+        'users',
+        ['leaderboard_id', sa.text('total_invested DESC'), 'user_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_group_leaderboard', table_name='users')
@@ -0,0 +1,45 @@
+"""weekly settlement tables
+
+Revision ID: c71d5e9a2f48
+Revises: 8b4e2d6f0a31
+Create Date: 2026-10-17 11:02:37.550912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71d5e9a2f48'
+down_revision = '8b4e2d6f0a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'weekly_settlements',
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column('users_settled', sa.Integer(), nullable=True),
+        sa.Column('amount_settled', sa.Float(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('settled_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('week_start')
+    )
+    op.create_table(
+        'settlement_ledger',
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column('user_id', sa.String(length=255), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('applied', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.ForeignKeyConstraint(['week_start'], ['weekly_settlements.week_start']),
+        sa.PrimaryKeyConstraint('week_start', 'user_id')
+    )
+    op.create_index('ix_app_time_weekly_week_start', 'app_time_weekly', ['week_start'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_app_time_weekly_week_start', table_name='app_time_weekly')
+    op.drop_table('settlement_ledger')
+    op.drop_table('weekly_settlements')
@@ -0,0 +1,25 @@
+"""add users.row_version for conditional GETs
+
+Revision ID: e3a96f14c2b7
+Revises: 5a0e7c3b9d62
+Create Date: 2026-10-17 14:05:51.260418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a96f14c2b7'
+down_revision = '5a0e7c3b9d62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('row_version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('row_version')
@@ -0,0 +1,47 @@
+"""daily per-app usage aggregates
+
+Filled from the existing app time, bucketed by hours per user-day with the
+edges apptime.USAGE_BUCKET_EDGES had when this migration was written.
+
+Revision ID: e8c4b2a19f36
+Revises: d2a7f93b1c58
+Create Date: 2026-10-18 00:12:26.604913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4b2a19f36'
+down_revision = 'd2a7f93b1c58'
+branch_labels = None
+depends_on = None
+
+BUCKET_EDGES = (0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0, 12.0)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'app_usage_daily',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('app_name', sa.String(length=255), nullable=False),
+        sa.Column('bucket', sa.Integer(), nullable=False),
+        sa.Column('user_days', sa.Integer(), nullable=False),
+        sa.Column('time_spent_hours', sa.Float(), nullable=False),
+        sa.Column('amount_charged', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('date', 'app_name', 'bucket')
+    )
+    bucket = 'CASE {} ELSE {} END'.format(
+        ' '.join(f'WHEN time_spent_hours < {edge} THEN {index}' for index, edge in enumerate(BUCKET_EDGES)),
+        len(BUCKET_EDGES)
+    )
+    op.execute(
+        'INSERT INTO app_usage_daily (date, app_name, bucket, user_days, time_spent_hours, amount_charged) '
+        f'SELECT date, app_name, {bucket}, COUNT(*), SUM(time_spent_hours), SUM(amount_charged) '
+        f'FROM app_time_history GROUP BY date, app_name, {bucket}'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('app_usage_daily')
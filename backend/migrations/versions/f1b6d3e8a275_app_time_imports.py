@@ -0,0 +1,47 @@
+"""staging tables for bulk app time imports
+
+Revision ID: f1b6d3e8a275
+Revises: e8c4b2a19f36
+Create Date: 2026-10-18 09:37:14.218406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6d3e8a275'
+down_revision = 'e8c4b2a19f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'app_time_imports',
+        sa.Column('import_id', sa.String(length=64), nullable=False),
+        sa.Column('path', sa.String(length=1024), nullable=False),
+        sa.Column('records_read', sa.Integer(), nullable=False),
+        sa.Column('rows_staged', sa.Integer(), nullable=False),
+        sa.Column('rows_rejected', sa.Integer(), nullable=False),
+        sa.Column('rows_merged', sa.Integer(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('merged_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('import_id')
+    )
+    op.create_table(
+        'app_time_import_rows',
+        sa.Column('import_id', sa.String(length=64), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(length=255), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('app_name', sa.String(length=255), nullable=False),
+        sa.Column('time_spent_hours', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['import_id'], ['app_time_imports.import_id']),
+        sa.PrimaryKeyConstraint('import_id', 'seq')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('app_time_import_rows')
+    op.drop_table('app_time_imports')
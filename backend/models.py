@@ -0,0 +1,171 @@
+from datetime import datetime
+
+from sqlalchemy import event
+
+from extensions import db
+
+
+class User(db.Model):
+    __tablename__ = 'users'
+    
+    user_id = db.Column(db.String(255), primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    email = db.Column(db.String(255), unique=True, nullable=False)
+    pfp = db.Column(db.String(500))
+    targeted_apps_time_weekly = db.Column(db.Float, default=0.0)
+    amount_charged_weekly = db.Column(db.Float, default=0.0)
+    total_invested = db.Column(db.Float, default=0.0)
+    leaderboard_id = db.Column(db.String(255))
+    leaderboard_position = db.Column(db.Integer)
+    investment_risk_level = db.Column(db.String(50), default='standard')
+    tracked_apps = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Latest two InvestmentHistory rows, kept current by record_investment_history
+    portfolio_value = db.Column(db.Float)
+    portfolio_date = db.Column(db.Date)
+    portfolio_previous_value = db.Column(db.Float)
+    portfolio_previous_date = db.Column(db.Date)
+    # Bumped on every write to the row; ETags for the user's reads are built from it
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    app_time_history = db.relationship('AppTimeHistory', backref='user', lazy=True)
+    investment_history = db.relationship('InvestmentHistory', backref='user', lazy=True)
+
+# Leaderboard order is total_invested DESC, user_id ASC; this index serves both
+# the keyset pages and the range updates that keep leaderboard_position current
+db.Index('ix_users_leaderboard', User.total_invested.desc(), User.user_id)
+# The same order within one leaderboard_id group, so a group's ranking reads
+# only its own members
+db.Index('ix_users_group_leaderboard', User.leaderboard_id, User.total_invested.desc(), User.user_id)
+
+class AppTimeHistory(db.Model):
+    __tablename__ = 'app_time_history'
+    __table_args__ = (
+        # Serves per-user date range reads and the upsert conflict target
+        db.Index('ix_app_time_history_user_date_app', 'user_id', 'date', 'app_name', unique=True),
+    )
+    
+    history_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.String(255), db.ForeignKey('users.user_id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    app_name = db.Column(db.String(255), nullable=False)
+    time_spent_hours = db.Column(db.Float, nullable=False)
+    amount_charged = db.Column(db.Float, nullable=False)
+
+class AppTimeWeekly(db.Model):
+    __tablename__ = 'app_time_weekly'
+    __table_args__ = (
+        db.Index('ix_app_time_weekly_week_start', 'week_start'),
+    )
+    
+    user_id = db.Column(db.String(255), db.ForeignKey('users.user_id'), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    time_spent_hours = db.Column(db.Float, nullable=False, default=0.0)
+    amount_charged = db.Column(db.Float, nullable=False, default=0.0)
+
+class AppTimeRollup(db.Model):
+    # Weekly per-app totals of daily rows compacted out of app_time_history
+    __tablename__ = 'app_time_rollup'
+    __table_args__ = (
+        # Finds the newest compacted week (retention.compacted_through)
+        db.Index('ix_app_time_rollup_week_start', 'week_start'),
+    )
+    
+    user_id = db.Column(db.String(255), db.ForeignKey('users.user_id'), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    app_name = db.Column(db.String(255), primary_key=True)
+    time_spent_hours = db.Column(db.Float, nullable=False)
+    amount_charged = db.Column(db.Float, nullable=False)
+    days = db.Column(db.Integer, nullable=False)
+
+class AppUsageDaily(db.Model):
+    # Usage of each app across all users per day, split by hours-per-user-day
+    # bucket (apptime.USAGE_BUCKET_EDGES); kept current by every app time write.
+    # Each key is spread over shards (apptime.APP_USAGE_SHARDS) that readers sum
+    __tablename__ = 'app_usage_daily'
+    
+    date = db.Column(db.Date, primary_key=True)
+    app_name = db.Column(db.String(255), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0, server_default='0')
+    user_days = db.Column(db.Integer, nullable=False)
+    time_spent_hours = db.Column(db.Float, nullable=False)
+    amount_charged = db.Column(db.Float, nullable=False)
+
+class AppTimeImport(db.Model):
+    # Progress of each file loaded by `flask import-apptime`; records_read
+    # moves with every committed chunk of staged rows, so a rerun resumes
+    __tablename__ = 'app_time_imports'
+    
+    import_id = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(1024), nullable=False)
+    records_read = db.Column(db.Integer, nullable=False, default=0)
+    rows_staged = db.Column(db.Integer, nullable=False, default=0)
+    rows_rejected = db.Column(db.Integer, nullable=False, default=0)
+    rows_merged = db.Column(db.Integer)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    merged_at = db.Column(db.DateTime)
+
+class AppTimeImportRow(db.Model):
+    # Validated rows of an import waiting to be merged into app_time_history;
+    # seq is the record's position in its file
+    __tablename__ = 'app_time_import_rows'
+    
+    import_id = db.Column(db.String(64), db.ForeignKey('app_time_imports.import_id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(255), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    app_name = db.Column(db.String(255), nullable=False)
+    time_spent_hours = db.Column(db.Float, nullable=False)
+
+class WeeklySettlement(db.Model):
+    __tablename__ = 'weekly_settlements'
+    
+    week_start = db.Column(db.Date, primary_key=True)
+    users_settled = db.Column(db.Integer)
+    amount_settled = db.Column(db.Float)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    settled_at = db.Column(db.DateTime)
+    # Set by app time writes to the week once its settlement has started, so
+    # the next settle-week run settles what they changed
+    reopened = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+class SettlementLedger(db.Model):
+    __tablename__ = 'settlement_ledger'
+    
+    week_start = db.Column(db.Date, db.ForeignKey('weekly_settlements.week_start'), primary_key=True)
+    user_id = db.Column(db.String(255), db.ForeignKey('users.user_id'), primary_key=True)
+    # The user's charge for the week, and how much of it is in total_invested
+    amount = db.Column(db.Float, nullable=False)
+    applied_amount = db.Column(db.Float, nullable=False, default=0.0)
+
+class InvestmentHistory(db.Model):
+    __tablename__ = 'investment_history'
+    __table_args__ = (
+        db.Index('ix_investment_history_user_date', 'user_id', 'date', unique=True),
+    )
+    
+    investment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.String(255), db.ForeignKey('users.user_id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    portfolio_value = db.Column(db.Float, nullable=False)
+    # total_invested at valuation time, so the next valuation can add new contributions
+    contributed = db.Column(db.Float)
+
+class IdempotencyKey(db.Model):
+    # Responses to write requests sent with an Idempotency-Key header; not tied
+    # to users by a foreign key, so error responses for unknown users are kept too
+    __tablename__ = 'idempotency_keys'
+    
+    user_id = db.Column(db.String(255), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+@event.listens_for(User, 'before_update')
+def bump_row_version(mapper, connection, target):
+    if db.session.is_modified(target, include_collections=False):
+        target.row_version = User.row_version + 1
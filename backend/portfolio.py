@@ -0,0 +1,96 @@
+"""Per-user portfolio summaries kept alongside InvestmentHistory."""
+from extensions import db
+from models import InvestmentHistory, User
+
+
+def record_investment_history(rows):
+    """Insert InvestmentHistory rows and fold them into their users' portfolio summaries.
+
+    rows are dicts of InvestmentHistory column values. Both the insert and
+    the summary update are single executemany statements.
+    """
+    if not rows:
+        return
+    db.session.execute(db.insert(InvestmentHistory), rows)
+    
+    users = User.__table__.c
+    date = db.bindparam('summary_date', type_=db.Date)
+    value = db.bindparam('summary_value', type_=db.Float)
+    # A row dated before the latest one but not before the previous one replaces the previous
+    replaces_previous = db.and_(
+        date < users.portfolio_date,
+        db.or_(users.portfolio_previous_date.is_(None), date >= users.portfolio_previous_date)
+    )
+    db.session.execute(
+        db.update(User.__table__)
+        .where(users.user_id == db.bindparam('summary_user_id'))
+        .values(
+            portfolio_value=db.case(
+                (db.or_(users.portfolio_date.is_(None), date >= users.portfolio_date), value),
+                else_=users.portfolio_value
+            ),
+            portfolio_date=db.case(
+                (db.or_(users.portfolio_date.is_(None), date > users.portfolio_date), date),
+                else_=users.portfolio_date
+            ),
+            portfolio_previous_value=db.case(
+                (date > users.portfolio_date, users.portfolio_value),
+                (replaces_previous, value),
+                else_=users.portfolio_previous_value
+            ),
+            portfolio_previous_date=db.case(
+                (date > users.portfolio_date, users.portfolio_date),
+                (replaces_previous, date),
+                else_=users.portfolio_previous_date
+            ),
+            row_version=users.row_version + 1
+        ),
+        [{
+            'summary_user_id': row['user_id'],
+            'summary_date': row['date'],
+            'summary_value': row['portfolio_value']
+        } for row in rows]
+    )
+
+def rebuild_portfolio_summaries():
+    """Recompute every user's portfolio summary from InvestmentHistory."""
+    def value_on(date_column):
+        return db.select(InvestmentHistory.portfolio_value).where(
+            InvestmentHistory.user_id == User.user_id,
+            InvestmentHistory.date == date_column
+        ).scalar_subquery()
+    
+    def latest_date(history):
+        return db.select(db.func.max(history.date)).where(history.user_id == User.user_id).correlate(User)
+    
+    # The second UPDATE reads the dates written by the first
+    db.session.execute(
+        db.update(User)
+        .values(
+            portfolio_date=latest_date(InvestmentHistory).scalar_subquery(),
+            portfolio_previous_date=latest_date(InvestmentHistory).where(
+                InvestmentHistory.date < latest_date(db.aliased(InvestmentHistory)).scalar_subquery()
+            ).scalar_subquery()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        db.update(User)
+        .values(
+            portfolio_value=value_on(User.portfolio_date),
+            portfolio_previous_value=value_on(User.portfolio_previous_date),
+            row_version=User.row_version + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def serialize_portfolio(user):
+    change_24h = 0
+    if user.portfolio_value is not None and user.portfolio_previous_value:
+        change_24h = ((user.portfolio_value - user.portfolio_previous_value) / user.portfolio_previous_value) * 100
+    return {
+        'total_value': user.portfolio_value if user.portfolio_value is not None else 0,
+        'change_24h': round(change_24h, 2),
+        'risk_level': user.investment_risk_level,
+        'total_invested': user.total_invested
+    }
@@ -0,0 +1,121 @@
+"""Development aid: record every SQL statement a request sends.
+
+With QUERY_DEBUG on, each request's statements are kept in a QueryLog and,
+once the request (or its streamed body) is finished:
+
+- statements sent QUERY_REPEAT_THRESHOLD or more times with the same SQL
+  (an N+1 pattern such as a lazy relationship loaded per row) are logged
+- statements slower than SLOW_QUERY_MS are logged with their EXPLAIN plan
+
+Tests marked @pytest.mark.query_budget(n) fail when any request sends more
+than n statements (see tests/conftest.py).
+"""
+from collections import Counter, deque
+import re
+import time
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+
+QUERY_LOG_SIZE = 100
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+# Expanded IN lists differ in length per call but are the same query
+IN_LIST = re.compile(r'\bIN \((?:[^()]|\([^()]*\))*\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(statement):
+    return IN_LIST.sub('IN (...)', WHITESPACE.sub(' ', statement).strip())
+
+class RequestQueries:
+    """The statements one request sent, as (statement, parameters, seconds, engine)."""
+    
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.statements = []
+    
+    def __len__(self):
+        return len(self.statements)
+    
+    def repeated(self, threshold):
+        """Return [(normalized statement, count)] for statements sent threshold or more times."""
+        counts = Counter(normalize(statement) for statement, _, _, _ in self.statements)
+        return [(statement, count) for statement, count in counts.most_common() if count >= threshold]
+    
+    def slow(self, threshold_seconds):
+        return [entry for entry in self.statements if entry[2] >= threshold_seconds]
+
+class QueryLog:
+    """The most recent requests' statements, newest last."""
+    
+    def __init__(self, max_size=QUERY_LOG_SIZE):
+        self.requests = deque(maxlen=max_size)
+    
+    def clear(self):
+        self.requests.clear()
+    
+    def over_budget(self, budget):
+        return [queries for queries in self.requests if len(queries) > budget]
+
+def init_app(app):
+    """Record statements per request when QUERY_DEBUG is set; call after db.init_app."""
+    if not app.config['QUERY_DEBUG']:
+        return
+    app.extensions['query_log'] = QueryLog()
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(start_request)
+    app.teardown_request(finish_request)
+
+def start_request():
+    request.sql_statements = RequestQueries(request.method, request.full_path.rstrip('?'))
+
+def finish_request(exc):
+    # Teardown runs after a streamed body is exhausted, so its queries count too
+    queries = getattr(request, 'sql_statements', None)
+    if queries is None:
+        return
+    current_app.extensions['query_log'].requests.append(queries)
+    report(current_app, queries)
+
+def report(app, queries):
+    label = f'{queries.method} {queries.path}'
+    for statement, count in queries.repeated(app.config['QUERY_REPEAT_THRESHOLD']):
+        app.logger.warning('Possible N+1 on %s: %d x %s', label, count, statement)
+    
+    for statement, parameters, seconds, engine in queries.slow(app.config['SLOW_QUERY_MS'] / 1000):
+        app.logger.warning(
+            'Slow query on %s (%.1f ms): %s\n%s',
+            label, seconds * 1000, normalize(statement), explain(engine, statement, parameters)
+        )
+
+def explain(engine, statement, parameters):
+    """Return the database's plan for a statement as text."""
+    if not statement.lstrip().upper().startswith(EXPLAINABLE) or isinstance(parameters, list):
+        return '(no plan for this statement)'
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+    except SQLAlchemyError as e:
+        return f'(EXPLAIN failed: {e})'
+    return '\n'.join(str(row[-1]) for row in rows)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_debug_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'query_debug_started', None)
+    if started is None or not has_request_context():
+        return
+    queries = getattr(request, 'sql_statements', None)
+    # EXPLAINs sent while reporting are not part of the request
+    if queries is not None and not statement.startswith('EXPLAIN'):
+        queries.statements.append((statement, parameters, time.perf_counter() - started, conn.engine))
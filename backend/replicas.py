@@ -0,0 +1,113 @@
+"""Route reads to a read replica and everything else to the primary.
+
+With a 'replica' bind configured (DATABASE_REPLICA_URL), statements in a
+GET or HEAD request run on the replica; writes, flushes, SELECT ... FOR
+UPDATE and any request with another method use the primary, as does work
+outside a request (commands, the write-behind flusher).
+
+A user who has just written reads from the primary for
+REPLICA_STICKY_SECONDS, so replication lag never hides their own change.
+The worker that took the write remembers it, and the response carries a
+signed X-Last-Write token; clients send it back on their reads, so every
+other worker honours the window too.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+STICKY_USERS_MAX = 100000
+LAST_WRITE_HEADER = 'X-Last-Write'
+
+
+class RecentWriters:
+    """Users who wrote in the last window seconds, oldest first."""
+    
+    def __init__(self, window, max_size=STICKY_USERS_MAX):
+        self.window = window
+        self.max_size = max_size
+        self._until = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def add(self, user_id):
+        with self._lock:
+            self._until.pop(user_id, None)
+            self._until[user_id] = time.monotonic() + self.window
+            while len(self._until) > self.max_size:
+                self._until.popitem(last=False)
+    
+    def __contains__(self, user_id):
+        with self._lock:
+            until = self._until.get(user_id)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._until[user_id]
+                return False
+            return True
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends a read request's queries to the replica."""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and reads_from_replica(clause):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def reads_from_replica(clause=None):
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None) is not None:
+        return False
+    writers = current_app.extensions.get('recent_writers')
+    if writers is None:
+        return False
+    # Only known once verify_token has run; anonymous reads can use the replica
+    user_id = getattr(request, 'user_id', None)
+    if user_id is None:
+        return True
+    if not hasattr(request, 'reads_replica'):
+        request.reads_replica = user_id not in writers and last_write_user() != user_id
+    return request.reads_replica
+
+def last_write_serializer():
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET'], salt='replica-last-write')
+
+def last_write_user():
+    """The user of a request's X-Last-Write token, if it is still inside the sticky window."""
+    token = request.headers.get(LAST_WRITE_HEADER)
+    if not token:
+        return None
+    try:
+        return last_write_serializer().loads(token, max_age=current_app.config['REPLICA_STICKY_SECONDS'])
+    except BadSignature:
+        return None
+
+def stick_to_primary(user_id):
+    """Send user_id's reads to the primary for the next REPLICA_STICKY_SECONDS."""
+    writers = current_app.extensions.get('recent_writers')
+    if writers is not None and user_id:
+        writers.add(user_id)
+        g.last_write_user = user_id
+
+def init_app(app):
+    if REPLICA_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return
+    app.extensions['recent_writers'] = RecentWriters(app.config['REPLICA_STICKY_SECONDS'])
+    
+    @app.after_request
+    def remember_writers(response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            stick_to_primary(getattr(request, 'user_id', None))
+        user_id = g.get('last_write_user')
+        if user_id:
+            response.headers[LAST_WRITE_HEADER] = last_write_serializer().dumps(user_id)
+        return response
@@ -0,0 +1,156 @@
+"""Compaction of old daily app time into weekly per-app rollups.
+
+With APPTIME_RETENTION_DAYS set, daily rows from whole weeks before the
+retention boundary can be rolled into app_time_rollup by
+`flask compact-apptime`, so app_time_history only holds recent days. Reads
+that reach past the boundary take those weeks from the rollup, dated by
+their Monday, and writes before the boundary are refused so a compacted
+week never gets daily rows again. Every rolled-up row is older than every
+daily row of the same user, so the two read back-to-back in date order.
+
+The boundary never moves back over weeks already compacted: a longer
+retention, or none, leaves them read-only rollups instead of re-opening
+them to daily writes.
+"""
+from datetime import datetime, timedelta
+import time
+
+from flask import current_app
+
+from apptime import dialect_insert, sql_week_start, week_bounds
+from extensions import db
+from models import AppTimeHistory, AppTimeRollup, User
+
+RETENTION_CHUNK_SIZE = 1000
+# Seconds a worker reuses its reading of the newest compacted week
+COMPACTED_THROUGH_TTL = 60
+
+
+def retention_boundary():
+    """Monday of the oldest week kept as daily rows, or None when everything is kept."""
+    days = current_app.config['APPTIME_RETENTION_DAYS']
+    if not days:
+        return None
+    return week_bounds(datetime.now().date() - timedelta(days=days))[0]
+
+def compacted_through():
+    """Monday after the newest compacted week, or None before any compaction."""
+    cached = current_app.extensions.get('compacted_through')
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    newest = db.session.execute(db.select(db.func.max(AppTimeRollup.week_start))).scalar()
+    through = newest + timedelta(days=7) if newest is not None else None
+    current_app.extensions['compacted_through'] = (through, time.monotonic() + COMPACTED_THROUGH_TTL)
+    return through
+
+def daily_boundary():
+    """Monday of the oldest week held as daily rows and open to writes, or None for all of them.
+
+    The later of the retention boundary and the end of the compacted weeks.
+    """
+    boundaries = [boundary for boundary in (retention_boundary(), compacted_through()) if boundary is not None]
+    return max(boundaries) if boundaries else None
+
+def check_writable(date):
+    """Raise ValueError for a date in a compacted week or before the retention boundary."""
+    boundary = daily_boundary()
+    if boundary and date < boundary:
+        raise ValueError(f'App time before {boundary.isoformat()} is past retention and read-only')
+
+def rolled_up_app_time(user_id, start_date=None, after=None, limit=None):
+    """Rolled-up weeks from start_date on, as rows shaped like AppTimeHistory.
+
+    Returns [] without a query when the range is within the daily rows.
+    """
+    statement = rollup_statement(user_id, start_date, after)
+    if statement is None:
+        return []
+    if limit:
+        statement = statement.limit(limit)
+    return db.session.execute(statement).all()
+
+def rollup_statement(user_id, start_date=None, after=None):
+    """SELECT of a user's rolled-up weeks overlapping start_date onwards, by (date, app_name).
+
+    after is an optional (date, app_name) keyset position to start past.
+    Returns None when nothing was compacted or the range starts after the boundary.
+    """
+    boundary = daily_boundary()
+    if boundary is None:
+        return None
+    if (start_date is not None and start_date >= boundary) or (after and after[0] >= boundary):
+        return None
+    statement = db.select(
+        AppTimeRollup.week_start.label('date'),
+        AppTimeRollup.app_name,
+        AppTimeRollup.time_spent_hours,
+        AppTimeRollup.amount_charged
+    ).where(AppTimeRollup.user_id == user_id)
+    if start_date is not None:
+        statement = statement.where(AppTimeRollup.week_start >= week_bounds(start_date)[0])
+    if after:
+        statement = statement.where(
+            AppTimeRollup.week_start >= after[0],
+            db.or_(AppTimeRollup.week_start > after[0], AppTimeRollup.app_name > after[1])
+        )
+    return statement.order_by(AppTimeRollup.week_start, AppTimeRollup.app_name)
+
+def compact_app_time(cutoff, chunk_size=RETENTION_CHUNK_SIZE, progress=None):
+    """Roll daily app time before cutoff (a Monday) into weekly per-app rows.
+
+    Users are processed in user_id order, chunk_size per transaction; each
+    chunk's rollup upsert and delete commit together, so an interrupted run
+    loses nothing and simply continues on the next run. Returns the number
+    of daily rows removed.
+    """
+    week_start = sql_week_start(AppTimeHistory.date)
+    removed = 0
+    last_user_id = ''
+    while True:
+        user_ids = db.session.execute(
+            db.select(User.user_id)
+            .where(User.user_id > last_user_id)
+            .order_by(User.user_id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not user_ids:
+            break
+        
+        old = [AppTimeHistory.user_id.in_(user_ids), AppTimeHistory.date < cutoff]
+        weeks = db.select(
+            AppTimeHistory.user_id,
+            week_start,
+            AppTimeHistory.app_name,
+            db.func.sum(AppTimeHistory.time_spent_hours),
+            db.func.sum(AppTimeHistory.amount_charged),
+            db.func.count()
+        ).where(*old).group_by(AppTimeHistory.user_id, week_start, AppTimeHistory.app_name)
+        columns = ['user_id', 'week_start', 'app_name', 'time_spent_hours', 'amount_charged', 'days']
+        
+        insert = dialect_insert()
+        if insert is None:
+            # No native upsert: a week is only ever compacted once
+            db.session.execute(db.insert(AppTimeRollup).from_select(columns, weeks))
+        else:
+            # Adds to an existing rollup of the week rather than failing on it
+            stmt = insert(AppTimeRollup).from_select(columns, weeks)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['user_id', 'week_start', 'app_name'],
+                set_={
+                    'time_spent_hours': AppTimeRollup.time_spent_hours + stmt.excluded.time_spent_hours,
+                    'amount_charged': AppTimeRollup.amount_charged + stmt.excluded.amount_charged,
+                    'days': AppTimeRollup.days + stmt.excluded.days
+                }
+            ))
+        chunk_removed = db.session.execute(
+            db.delete(AppTimeHistory).where(*old).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        
+        current_app.extensions.pop('compacted_through', None)
+        
+        removed += chunk_removed
+        last_user_id = user_ids[-1]
+        if progress:
+            progress(chunk_removed, last_user_id)
+    return removed
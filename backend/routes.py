@@ -0,0 +1,855 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+
+from flask import Blueprint, Response, current_app, jsonify, request
+import jwt
+
+from analytics import ANALYTICS_MAX_DAYS, app_usage
+from apptime import (
+    APPTIME_BATCH_MAX_ENTRIES, CHARGE_PER_HOUR, current_week_start, current_weekly_totals,
+    parse_apptime_entry, week_bounds, write_app_time
+)
+from auth import current_user, verify_token
+from events import SNAPSHOT_COLUMNS, event_stream, notify_user_changes, user_snapshot
+from extensions import db
+from history import (
+    bucket_start_of, decode_cursor, encode_cursor, read_export_args, read_history_page_args,
+    resolve_history_bucket, sql_bucket_start, stream_export
+)
+from idempotency import idempotent
+from leaderboard import (
+    LEADERBOARD_GROUP_MAX_LENGTH, LEADERBOARD_MAX_PAGE_SIZE, LEADERBOARD_PAGE_SIZE,
+    decode_leaderboard_cursor, encode_leaderboard_cursor, group_position, group_rows_ahead,
+    group_weekly_average, load_group_top, load_leaderboard_users, page_positions, ranked_ahead_of,
+    ranked_behind, serialize_leaderboard_entry, update_leaderboard_rank
+)
+from models import AppTimeHistory, InvestmentHistory, User
+from portfolio import serialize_portfolio
+from replicas import stick_to_primary
+from retention import check_writable, rolled_up_app_time, rollup_statement
+from writebehind import merge_pending, pending_deltas
+
+api = Blueprint('api', __name__)
+
+# Response helpers
+DASHBOARD_LEADERBOARD_SIZE = 10
+
+def serialize_profile(user, weekly_totals):
+    hours, charged = weekly_totals[user.user_id]
+    return {
+        'user_id': user.user_id,
+        'name': user.name,
+        'email': user.email,
+        'pfp': user.pfp,
+        'targeted_apps_time_weekly': hours,
+        'amount_charged_weekly': charged,
+        'total_invested': user.total_invested,
+        'leaderboard_position': user.leaderboard_position,
+        'leaderboard_id': user.leaderboard_id,
+        'investment_risk_level': user.investment_risk_level,
+        'tracked_apps': user.tracked_apps or []
+    }
+
+def serialize_apptime_entry(entry):
+    return {
+        'date': entry.date.isoformat(),
+        'app_name': entry.app_name,
+        'time_spent_hours': entry.time_spent_hours,
+        'amount_charged': entry.amount_charged
+    }
+
+# Conditional GET helpers
+def make_etag(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Let clients keep the body but revalidate it on every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag):
+    """Return a 304 response if If-None-Match already holds etag, else None.
+
+    If-None-Match uses weak comparison, so a W/ tag from a proxy that
+    compressed the body still matches.
+    """
+    if request.if_none_match.contains_weak(etag):
+        return with_etag(current_app.response_class(status=304), etag)
+    return None
+
+# Routes
+@api.route('/', methods=['GET'])
+def root():
+    return jsonify({
+        'message': 'Screen Time Investment Tracker API',
+        'version': '1.0.0',
+        'endpoints': {
+            'health': '/health',
+            'auth': '/auth/login',
+            'user': {
+                'profile': '/user/profile',
+                'apps': '/user/apps',
+                'apptime': '/user/apptime',
+                'apptime_batch': '/user/apptime/batch',
+                'leaderboard': '/user/leaderboard'
+            },
+            'leaderboard': '/leaderboard',
+            'group_leaderboard': '/leaderboard/<group_id>',
+            'events': '/events',
+            'analytics': '/analytics/apps',
+            'dashboard': '/dashboard',
+            'investments': {
+                'portfolio': '/investments/portfolio',
+                'setup': '/investments/setup',
+                'history': '/investments/history'
+            }
+        }
+    }), 200
+
+@api.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'healthy'}), 200
+
+@api.route('/auth/login', methods=['POST'])
+def login():
+    data = request.json
+    email = data.get('email')
+    name = data.get('name')
+    user_id = data.get('user_id') or data.get('sub')
+    pfp = data.get('picture')
+    
+    if not email or not name:
+        return jsonify({'error': 'Email and name required'}), 400
+    
+    user = User.query.filter_by(email=email).first()
+    
+    if not user:
+        user = User(
+            user_id=user_id or email,
+            name=name,
+            email=email,
+            pfp=pfp,
+            tracked_apps=[],
+            leaderboard_id=user_id or email
+        )
+        db.session.add(user)
+        update_leaderboard_rank(user)
+        # Everyone ranked behind the new user moved down one
+        notify_user_changes()
+        db.session.commit()
+        stick_to_primary(user.user_id)
+    
+    # Generate JWT token
+    token = jwt.encode({
+        'sub': user.user_id,
+        'email': user.email,
+        'exp': datetime.utcnow() + timedelta(days=7)
+    }, current_app.config['JWT_SECRET'], algorithm='HS256')
+    
+    return jsonify({
+        'token': token,
+        'user': {
+            'user_id': user.user_id,
+            'name': user.name,
+            'email': user.email,
+            'pfp': user.pfp
+        }
+    }), 200
+
+@api.route('/user/profile', methods=['GET'])
+@verify_token
+def get_profile():
+    user = current_user(User.row_version)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    etag = make_etag('profile', user.user_id, user.row_version, current_week_start())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Expired attributes reload together on first access, in one SELECT
+    db.session.expire(user)
+    weekly_totals = current_weekly_totals([user.user_id])
+    
+    return with_etag(jsonify(serialize_profile(user, weekly_totals)), etag), 200
+
+@api.route('/user/apps', methods=['GET'])
+@verify_token
+def get_apps():
+    user = current_user(User.row_version)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    etag = make_etag('apps', user.user_id, user.row_version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    return with_etag(jsonify({'tracked_apps': user.tracked_apps or []}), etag), 200
+
+@api.route('/user/apps', methods=['PUT'])
+@verify_token
+@idempotent
+def update_apps():
+    user = current_user(User.tracked_apps)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    data = request.json
+    tracked_apps = data.get('tracked_apps', [])
+    
+    user.tracked_apps = tracked_apps
+    db.session.commit()
+    
+    return jsonify({'tracked_apps': user.tracked_apps}), 200
+
+@api.route('/user/leaderboard', methods=['PUT'])
+@verify_token
+@idempotent
+def update_leaderboard_group():
+    user = current_user(User.leaderboard_id, User.total_invested)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    data = request.json or {}
+    # Leaving a group puts the user back in a group of their own
+    group_id = data.get('leaderboard_id') or user.user_id
+    if not isinstance(group_id, str) or len(group_id) > LEADERBOARD_GROUP_MAX_LENGTH:
+        return jsonify({'error': f'leaderboard_id must be a string of at most {LEADERBOARD_GROUP_MAX_LENGTH} characters'}), 400
+    
+    user.leaderboard_id = group_id
+    notify_user_changes()
+    db.session.commit()
+    
+    return jsonify({
+        'leaderboard_id': group_id,
+        'group_position': group_position(group_id, user.total_invested or 0.0)
+    }), 200
+
+@api.route('/user/apptime', methods=['GET'])
+@verify_token
+def get_apptime():
+    user = current_user(User.user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    days = request.args.get('days', 7, type=int)
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days)
+    
+    try:
+        bucket, start_date = resolve_history_bucket(start_date, end_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Updates still in the write-behind journal are merged into what is read
+    buffer = current_app.extensions.get('apptime_buffer')
+    
+    if bucket:
+        # Hours and charges are summed per app within each bucket
+        bucket_start = sql_bucket_start(AppTimeHistory.date, bucket).label('bucket_start')
+        rows = db.session.execute(
+            db.select(
+                bucket_start,
+                AppTimeHistory.app_name,
+                db.func.sum(AppTimeHistory.time_spent_hours),
+                db.func.sum(AppTimeHistory.amount_charged)
+            ).where(
+                AppTimeHistory.user_id == user.user_id,
+                AppTimeHistory.date >= start_date,
+                AppTimeHistory.date <= end_date
+            ).group_by(bucket_start, AppTimeHistory.app_name)
+            .order_by(bucket_start, AppTimeHistory.app_name)
+        ).all()
+        
+        # Weeks compacted past retention are added by their Monday
+        changes = [tuple(row) for row in rolled_up_app_time(user.user_id, start_date)]
+        if buffer is not None:
+            pending = buffer.pending(user.user_id, start_date, end_date)
+            changes += pending_deltas(user.user_id, pending)
+        if changes:
+            totals = {(date, app_name): [hours, charged] for date, app_name, hours, charged in rows}
+            for date, app_name, hours, charged in changes:
+                total = totals.setdefault((bucket_start_of(date, bucket), app_name), [0.0, 0.0])
+                total[0] += hours
+                total[1] += charged
+            rows = [(date, app_name, hours, charged) for (date, app_name), (hours, charged) in sorted(totals.items())]
+        
+        return jsonify({'bucket': bucket, 'history': [{
+            'date': date.isoformat(),
+            'app_name': app_name,
+            'time_spent_hours': hours,
+            'amount_charged': charged
+        } for date, app_name, hours, charged in rows]}), 200
+    
+    query = AppTimeHistory.query.filter(
+        AppTimeHistory.user_id == user.user_id,
+        AppTimeHistory.date >= start_date,
+        AppTimeHistory.date <= end_date
+    )
+    
+    limit, cursor = read_history_page_args()
+    after = None
+    if cursor:
+        try:
+            after_date, after_app = decode_cursor(cursor, 2)
+            after_date = datetime.strptime(after_date, '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(
+            AppTimeHistory.date >= after_date,
+            db.or_(AppTimeHistory.date > after_date, AppTimeHistory.app_name > after_app)
+        )
+        after = (after_date, after_app)
+    
+    query = query.order_by(AppTimeHistory.date, AppTimeHistory.app_name)
+    # Rolled-up weeks all precede the daily rows, so they come first
+    history = rolled_up_app_time(user.user_id, start_date, after=after, limit=limit + 1 if limit else None)
+    if not limit:
+        history += query.all()
+    elif len(history) <= limit:
+        history += query.limit(limit + 1 - len(history)).all()
+    if buffer is not None:
+        pending = buffer.pending(user.user_id, start_date, end_date, after=after)
+        history = merge_pending(history, pending, limit + 1 if limit else None)
+    
+    next_cursor = None
+    if limit and len(history) > limit:
+        history = history[:limit]
+        next_cursor = encode_cursor(history[-1].date.isoformat(), history[-1].app_name)
+    
+    result = [serialize_apptime_entry(entry) for entry in history]
+    
+    if limit:
+        return jsonify({'history': result, 'next_cursor': next_cursor}), 200
+    return jsonify({'history': result}), 200
+
+@api.route('/user/apptime/export', methods=['GET'])
+@verify_token
+def export_apptime():
+    try:
+        fmt, start_date = read_export_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    statement = db.select(
+        AppTimeHistory.date,
+        AppTimeHistory.app_name,
+        AppTimeHistory.time_spent_hours,
+        AppTimeHistory.amount_charged
+    ).where(AppTimeHistory.user_id == request.user_id)
+    if start_date:
+        statement = statement.where(AppTimeHistory.date >= start_date)
+    statement = statement.order_by(AppTimeHistory.date, AppTimeHistory.app_name)
+    rollups = rollup_statement(request.user_id, start_date)
+    
+    return stream_export(
+        [statement] if rollups is None else [rollups, statement],
+        ['date', 'app_name', 'time_spent_hours', 'amount_charged'],
+        fmt,
+        'apptime'
+    )
+
+@api.route('/user/apptime', methods=['POST'])
+@verify_token
+@idempotent
+def update_apptime():
+    user = current_user(User.targeted_apps_time_weekly, User.amount_charged_weekly)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    data = request.json
+    
+    buffer = current_app.extensions.get('apptime_buffer')
+    if buffer is not None:
+        # Accepted into the write-behind journal; the database catches up on flush
+        try:
+            date, app_name, time_spent_hours = parse_apptime_entry(data)
+            check_writable(date)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        amount_charged = time_spent_hours * CHARGE_PER_HOUR
+        buffer.put([{
+            'user_id': user.user_id,
+            'date': date,
+            'app_name': app_name,
+            'time_spent_hours': time_spent_hours,
+            'amount_charged': amount_charged
+        }])
+        return jsonify({
+            'date': date.isoformat(),
+            'app_name': app_name,
+            'time_spent_hours': time_spent_hours,
+            'amount_charged': amount_charged,
+            'pending': True
+        }), 202
+    
+    try:
+        date, app_name, time_spent_hours = parse_apptime_entry(data)
+        check_writable(date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    amount_charged = time_spent_hours * CHARGE_PER_HOUR
+    write_app_time(user, [{
+        'user_id': user.user_id,
+        'date': date,
+        'app_name': app_name,
+        'time_spent_hours': time_spent_hours,
+        'amount_charged': amount_charged
+    }])
+    db.session.commit()
+    
+    return jsonify({
+        'date': date.isoformat(),
+        'app_name': app_name,
+        'time_spent_hours': time_spent_hours,
+        'amount_charged': amount_charged
+    }), 200
+
+@api.route('/user/apptime/batch', methods=['POST'])
+@verify_token
+@idempotent
+def update_apptime_batch():
+    user = current_user(User.targeted_apps_time_weekly, User.amount_charged_weekly)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    data = request.json or {}
+    entries = data.get('entries')
+    
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'entries must be a non-empty list'}), 400
+    if len(entries) > APPTIME_BATCH_MAX_ENTRIES:
+        return jsonify({'error': f'At most {APPTIME_BATCH_MAX_ENTRIES} entries per batch'}), 400
+    
+    results = []
+    rows = {}
+    for index, entry in enumerate(entries):
+        try:
+            date, app_name, time_spent_hours = parse_apptime_entry(entry)
+            check_writable(date)
+        except ValueError as e:
+            results.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        
+        key = (date, app_name)
+        if key in rows:
+            # A later entry for the same day and app wins
+            results[rows[key]['index']]['status'] = 'superseded'
+        
+        amount_charged = time_spent_hours * CHARGE_PER_HOUR
+        rows[key] = {'index': index, 'row': {
+            'user_id': user.user_id,
+            'date': date,
+            'app_name': app_name,
+            'time_spent_hours': time_spent_hours,
+            'amount_charged': amount_charged
+        }}
+        results.append({
+            'index': index,
+            'status': 'ok',
+            'date': date.isoformat(),
+            'app_name': app_name,
+            'time_spent_hours': time_spent_hours,
+            'amount_charged': amount_charged
+        })
+    
+    # With write-behind on, batches join the journal too so the latest write wins
+    buffer = current_app.extensions.get('apptime_buffer')
+    if buffer is not None:
+        buffer.put([item['row'] for item in rows.values()])
+        return jsonify({'results': results, 'pending': True}), 202
+    
+    write_app_time(user, [item['row'] for item in rows.values()])
+    db.session.commit()
+    
+    return jsonify({'results': results}), 200
+
+@api.route('/leaderboard', methods=['GET'])
+@verify_token
+def get_leaderboard():
+    limit = request.args.get('limit', LEADERBOARD_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, LEADERBOARD_MAX_PAGE_SIZE))
+    around = request.args.get('around', type=int)
+    cursor = request.args.get('cursor')
+    
+    ordering = (User.total_invested.desc(), User.user_id)
+    
+    versioned = (User.user_id, User.row_version)
+    
+    # "My rank and the N users around me" mode
+    if around is not None:
+        user = current_user(User.total_invested, User.row_version)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        around = max(0, min(around, LEADERBOARD_MAX_PAGE_SIZE))
+        total_invested = user.total_invested or 0.0
+        ahead = db.session.query(*versioned).filter(
+            ranked_ahead_of(total_invested, user.user_id)
+        ).order_by(User.total_invested, User.user_id.desc()).limit(around).all()
+        behind = db.session.query(*versioned).filter(
+            ranked_behind(total_invested, user.user_id)
+        ).order_by(*ordering).limit(around).all()
+        versions = list(reversed(ahead)) + [(user.user_id, user.row_version)] + behind
+        
+        etag = make_etag('leaderboard', 'around', around, current_week_start(), versions)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        users = load_leaderboard_users([user_id for user_id, _ in versions])
+        weekly_totals = current_weekly_totals([u.user_id for u in users])
+        return with_etag(jsonify({
+            'leaderboard': [serialize_leaderboard_entry(u, weekly_totals) for u in users],
+            'leaderboard_position': user.leaderboard_position
+        }), etag), 200
+    
+    query = db.session.query(*versioned)
+    if cursor:
+        try:
+            total_invested, user_id = decode_leaderboard_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(ranked_behind(total_invested, user_id))
+    
+    # Fetch one extra row to know whether another page exists
+    versions = query.order_by(*ordering).limit(limit + 1).all()
+    has_more = len(versions) > limit
+    versions = versions[:limit]
+    
+    etag = make_etag('leaderboard', cursor, limit, current_week_start(), versions)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    users = load_leaderboard_users([user_id for user_id, _ in versions])
+    next_cursor = encode_leaderboard_cursor(users[-1]) if has_more else None
+    
+    weekly_totals = current_weekly_totals([u.user_id for u in users])
+    return with_etag(jsonify({
+        'leaderboard': [serialize_leaderboard_entry(u, weekly_totals) for u in users],
+        'next_cursor': next_cursor
+    }), etag), 200
+
+@api.route('/leaderboard/<group_id>', methods=['GET'])
+@verify_token
+def get_group_leaderboard(group_id):
+    user = current_user(User.leaderboard_id, User.total_invested)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    if user.leaderboard_id != group_id:
+        return jsonify({'error': 'Not a member of this leaderboard'}), 403
+    
+    limit = request.args.get('limit', LEADERBOARD_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, LEADERBOARD_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    
+    if cursor:
+        try:
+            total_invested, user_id = decode_leaderboard_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        versions = db.session.query(User.user_id, User.row_version, User.total_invested).filter(
+            User.leaderboard_id == group_id,
+            ranked_behind(total_invested, user_id)
+        ).order_by(User.total_invested.desc(), User.user_id).limit(limit + 1).all()
+        # The cursor row ended the previous page
+        offset = group_rows_ahead(group_id, total_invested, user_id) + 1
+        top = []
+    else:
+        # First pages come from the per-worker top-N cache
+        top = load_group_top(group_id)
+        versions = top[:limit + 1]
+        offset = 0
+    has_more = len(versions) > limit
+    versions = versions[:limit]
+    
+    totals = [total or 0.0 for _, _, total in versions]
+    first_position = offset + 1
+    if totals and offset and totals[0] == total_invested:
+        # A tie carried over from the previous page
+        first_position = group_position(group_id, totals[0])
+    positions = page_positions(totals, first_position, offset)
+    
+    ranked = {user_id: total or 0.0 for user_id, _, total in top}
+    if user.user_id in ranked:
+        # Everyone with a larger total is in the top rows too
+        position = 1 + sum(1 for total in ranked.values() if total > ranked[user.user_id])
+    else:
+        position = group_position(group_id, user.total_invested or 0.0)
+    
+    etag = make_etag('leaderboard', group_id, cursor, limit, current_week_start(), versions, positions, position)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    users = load_leaderboard_users([user_id for user_id, _, _ in versions])
+    next_cursor = encode_leaderboard_cursor(users[-1]) if has_more else None
+    
+    weekly_totals = current_weekly_totals([u.user_id for u in users])
+    group_positions = {user_id: positions[index] for index, (user_id, _, _) in enumerate(versions)}
+    return with_etag(jsonify({
+        'leaderboard': [
+            {**serialize_leaderboard_entry(u, weekly_totals), 'group_position': group_positions[u.user_id]}
+            for u in users
+        ],
+        'group_position': position,
+        'next_cursor': next_cursor
+    }), etag), 200
+
+@api.route('/events', methods=['GET'])
+@verify_token
+def stream_events():
+    """Server-sent rank and portfolio events for the current user, current values first."""
+    row = db.session.execute(db.select(*SNAPSHOT_COLUMNS).where(User.user_id == request.user_id)).first()
+    if not row:
+        return jsonify({'error': 'User not found'}), 404
+    
+    publisher = current_app.extensions['event_publisher']
+    publisher.start(current_app._get_current_object())
+    subscription = publisher.subscribe(row.user_id, user_snapshot(row))
+    # The stream runs after the request context is gone, holding no connection
+    return Response(
+        event_stream(
+            publisher,
+            subscription,
+            current_app.config['EVENTS_HEARTBEAT_SECONDS'],
+            current_app.config['EVENTS_STREAM_SECONDS']
+        ),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/investments/portfolio', methods=['GET'])
+@verify_token
+def get_portfolio():
+    # The portfolio summary lives on the user row, so this is one primary key read
+    user = current_user(
+        User.row_version,
+        User.investment_risk_level,
+        User.total_invested,
+        User.portfolio_value,
+        User.portfolio_previous_value
+    )
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    etag = make_etag('portfolio', user.user_id, user.row_version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    return with_etag(jsonify(serialize_portfolio(user)), etag), 200
+
+@api.route('/investments/setup', methods=['POST'])
+@verify_token
+@idempotent
+def setup_investments():
+    user = current_user(User.investment_risk_level)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    data = request.json
+    risk_level = data.get('risk_level', 'standard')
+    
+    if risk_level not in ['standard', 'low', 'medium', 'high']:
+        return jsonify({'error': 'Invalid risk level'}), 400
+    
+    user.investment_risk_level = risk_level
+    notify_user_changes()
+    db.session.commit()
+    
+    return jsonify({'risk_level': user.investment_risk_level}), 200
+
+@api.route('/investments/history', methods=['GET'])
+@verify_token
+def get_investment_history():
+    user = current_user(User.user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    days = request.args.get('days', 30, type=int)
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days)
+    
+    try:
+        bucket, start_date = resolve_history_bucket(start_date, end_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if bucket:
+        # portfolio_value is the bucket's last value, alongside its avg/min/max
+        bucket_start = sql_bucket_start(InvestmentHistory.date, bucket).label('bucket_start')
+        buckets = db.select(
+            bucket_start,
+            db.func.max(InvestmentHistory.date).label('last_date'),
+            db.func.avg(InvestmentHistory.portfolio_value).label('avg_value'),
+            db.func.min(InvestmentHistory.portfolio_value).label('min_value'),
+            db.func.max(InvestmentHistory.portfolio_value).label('max_value')
+        ).where(
+            InvestmentHistory.user_id == user.user_id,
+            InvestmentHistory.date >= start_date,
+            InvestmentHistory.date <= end_date
+        ).group_by(bucket_start).subquery()
+        rows = db.session.execute(
+            db.select(
+                buckets.c.bucket_start,
+                InvestmentHistory.portfolio_value,
+                buckets.c.avg_value,
+                buckets.c.min_value,
+                buckets.c.max_value
+            ).join(InvestmentHistory, db.and_(
+                InvestmentHistory.user_id == user.user_id,
+                InvestmentHistory.date == buckets.c.last_date
+            )).order_by(buckets.c.bucket_start)
+        ).all()
+        
+        return jsonify({'bucket': bucket, 'history': [{
+            'date': date.isoformat(),
+            'portfolio_value': last_value,
+            'avg_value': round(avg_value, 2),
+            'min_value': min_value,
+            'max_value': max_value
+        } for date, last_value, avg_value, min_value, max_value in rows]}), 200
+    
+    query = InvestmentHistory.query.filter(
+        InvestmentHistory.user_id == user.user_id,
+        InvestmentHistory.date >= start_date,
+        InvestmentHistory.date <= end_date
+    )
+    
+    limit, cursor = read_history_page_args()
+    if cursor:
+        try:
+            after_date, = decode_cursor(cursor, 1)
+            after_date = datetime.strptime(after_date, '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(InvestmentHistory.date > after_date)
+    
+    query = query.order_by(InvestmentHistory.date)
+    history = query.limit(limit + 1).all() if limit else query.all()
+    
+    next_cursor = None
+    if limit and len(history) > limit:
+        history = history[:limit]
+        next_cursor = encode_cursor(history[-1].date.isoformat())
+    
+    result = []
+    for entry in history:
+        result.append({
+            'date': entry.date.isoformat(),
+            'portfolio_value': entry.portfolio_value
+        })
+    
+    if limit:
+        return jsonify({'history': result, 'next_cursor': next_cursor}), 200
+    return jsonify({'history': result}), 200
+
+@api.route('/investments/history/export', methods=['GET'])
+@verify_token
+def export_investment_history():
+    try:
+        fmt, start_date = read_export_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    statement = db.select(
+        InvestmentHistory.date,
+        InvestmentHistory.portfolio_value
+    ).where(InvestmentHistory.user_id == request.user_id)
+    if start_date:
+        statement = statement.where(InvestmentHistory.date >= start_date)
+    statement = statement.order_by(InvestmentHistory.date)
+    
+    return stream_export([statement], ['date', 'portfolio_value'], fmt, 'investment_history')
+
+@api.route('/dashboard', methods=['GET'])
+@verify_token
+def get_dashboard():
+    """Profile, rank, app time, portfolio and investment history in one response."""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    apptime_days = request.args.get('apptime_days', 7, type=int)
+    history_days = request.args.get('history_days', 30, type=int)
+    leaderboard_size = request.args.get('leaderboard_limit', DASHBOARD_LEADERBOARD_SIZE, type=int)
+    leaderboard_size = max(0, min(leaderboard_size, LEADERBOARD_MAX_PAGE_SIZE))
+    end_date = datetime.now().date()
+    
+    # Rank is one plus the users with more invested, counted on the leaderboard index
+    total_invested = user.total_invested or 0.0
+    rank = db.session.query(db.func.count(User.user_id)).filter(
+        User.total_invested > total_invested
+    ).scalar() + 1
+    leaders = User.query.order_by(
+        User.total_invested.desc(), User.user_id
+    ).limit(leaderboard_size).all() if leaderboard_size else []
+    
+    weekly_totals = current_weekly_totals(list({user.user_id, *(u.user_id for u in leaders)}))
+    
+    apptime_start = end_date - timedelta(days=apptime_days)
+    apptime = rolled_up_app_time(user.user_id, apptime_start) + AppTimeHistory.query.filter(
+        AppTimeHistory.user_id == user.user_id,
+        AppTimeHistory.date >= apptime_start,
+        AppTimeHistory.date <= end_date
+    ).order_by(AppTimeHistory.date, AppTimeHistory.app_name).all()
+    
+    investments = InvestmentHistory.query.filter(
+        InvestmentHistory.user_id == user.user_id,
+        InvestmentHistory.date >= end_date - timedelta(days=history_days),
+        InvestmentHistory.date <= end_date
+    ).order_by(InvestmentHistory.date).all()
+    
+    # The team average is over every member of the user's group, not just the leaders shown
+    group_average = None
+    if user.leaderboard_id:
+        hours, charged = group_weekly_average(user.leaderboard_id, current_week_start())
+        group_average = {
+            'leaderboard_id': user.leaderboard_id,
+            'targeted_apps_time_weekly': hours,
+            'amount_charged_weekly': charged
+        }
+    
+    profile = serialize_profile(user, weekly_totals)
+    profile['rank'] = rank
+    return jsonify({
+        'profile': profile,
+        'apptime': [serialize_apptime_entry(entry) for entry in apptime],
+        'portfolio': serialize_portfolio(user),
+        'investment_history': [{
+            'date': entry.date.isoformat(),
+            'portfolio_value': entry.portfolio_value
+        } for entry in investments],
+        'leaderboard': [serialize_leaderboard_entry(u, weekly_totals) for u in leaders],
+        'group_average': group_average
+    }), 200
+
+@api.route('/analytics/apps', methods=['GET'])
+@verify_token
+def get_app_analytics():
+    """Usage and charges per app across all users, from the daily per-app aggregates."""
+    today = datetime.now().date()
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else week_bounds(today)[0]
+        end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else today
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+    if start_date > end_date:
+        return jsonify({'error': 'start must not be after end'}), 400
+    if (end_date - start_date).days >= ANALYTICS_MAX_DAYS:
+        return jsonify({'error': f'At most {ANALYTICS_MAX_DAYS} days per request'}), 400
+    limit = request.args.get('limit', type=int)
+    
+    return jsonify({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'apps': app_usage(start_date, end_date, max(1, limit) if limit else None)
+    }), 200
@@ -0,0 +1,163 @@
+"""Weekly settlement of app time charges into total_invested."""
+from datetime import datetime
+
+from apptime import week_bounds
+from events import notify_user_changes
+from extensions import db
+from leaderboard import rebuild_leaderboard
+from models import AppTimeWeekly, SettlementLedger, User, WeeklySettlement
+
+
+SETTLEMENT_CHUNK_SIZE = 10000
+# First key of the per-week advisory lock; the second is the week's ordinal
+SETTLEMENT_LOCK_ID = 5871
+
+def settle_week(week_start, chunk_size=SETTLEMENT_CHUNK_SIZE, progress=None):
+    """Add a week's app time charges to every user's total_invested.
+
+    The week's charges are copied from app_time_weekly into settlement_ledger
+    with one UPDATE and one INSERT ... SELECT, then applied to users in
+    user_id order, one committed chunk at a time. Each user gets the
+    difference between their ledger amount and what was applied before, and
+    the ledger records it in the same transaction, so an interrupted run
+    resumes where it stopped and no charge is applied twice. Every
+    transaction starts by taking the week's lock, so concurrent runs for one
+    week take turns and each sees what the other applied.
+
+    App time written to the week after its settlement started reopens it
+    (see apptime.reopen_settled_weeks); running again settles the change.
+    Returns the WeeklySettlement row, or None if the week was already
+    settled and has not changed since.
+    """
+    lock_week(week_start)
+    settlement = db.session.get(WeeklySettlement, week_start)
+    if settlement and settlement.settled_at and not settlement.reopened:
+        db.session.commit()
+        return None
+    
+    if not settlement:
+        # Committed first, so writes to the week from here on reopen it
+        settlement = WeeklySettlement(week_start=week_start)
+        db.session.add(settlement)
+        db.session.commit()
+        lock_week(week_start)
+    # A write landing after this copy of the charges reopens the week again
+    settlement.reopened = False
+    copy_charges(week_start)
+    db.session.commit()
+    
+    last_user_id = ''
+    while True:
+        lock_week(week_start)
+        # Upper user_id bound of the next chunk; None means the rest of the week
+        upper = db.session.execute(
+            db.select(SettlementLedger.user_id)
+            .where(
+                SettlementLedger.week_start == week_start,
+                SettlementLedger.user_id > last_user_id
+            )
+            .order_by(SettlementLedger.user_id)
+            .offset(chunk_size - 1)
+            .limit(1)
+        ).scalar()
+        
+        chunk = [
+            SettlementLedger.week_start == week_start,
+            SettlementLedger.user_id > last_user_id,
+            SettlementLedger.applied_amount != SettlementLedger.amount
+        ]
+        if upper is not None:
+            chunk.append(SettlementLedger.user_id <= upper)
+        
+        applied = db.session.execute(
+            db.update(User)
+            .where(User.user_id == SettlementLedger.user_id, *chunk)
+            .values(
+                total_invested=db.func.coalesce(User.total_invested, 0.0)
+                + SettlementLedger.amount - SettlementLedger.applied_amount,
+                row_version=User.row_version + 1
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.execute(
+            db.update(SettlementLedger)
+            .where(*chunk)
+            .values(applied_amount=SettlementLedger.amount)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        
+        if progress:
+            progress(applied, upper)
+        if upper is None:
+            break
+        last_user_id = upper
+    
+    lock_week(week_start)
+    users_settled, amount_settled = db.session.query(
+        db.func.count(SettlementLedger.user_id),
+        db.func.coalesce(db.func.sum(SettlementLedger.amount), 0.0)
+    ).filter(SettlementLedger.week_start == week_start, SettlementLedger.amount != 0).one()
+    
+    settlement.users_settled = users_settled
+    settlement.amount_settled = amount_settled
+    settlement.settled_at = datetime.utcnow()
+    rebuild_leaderboard()
+    notify_user_changes()
+    db.session.commit()
+    return settlement
+
+def lock_week(week_start):
+    """Lock the week's settlement until commit.
+
+    A transaction-level advisory lock rather than a lock on the
+    WeeklySettlement row, which app time writers update while holding their
+    user's row lock. SQLite serializes writers on its database lock instead.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(db.select(db.func.pg_advisory_xact_lock(SETTLEMENT_LOCK_ID, week_start.toordinal())))
+
+def copy_charges(week_start):
+    """Bring the week's ledger amounts up to date with app_time_weekly."""
+    weekly = db.select(AppTimeWeekly.amount_charged).where(
+        AppTimeWeekly.week_start == SettlementLedger.week_start,
+        AppTimeWeekly.user_id == SettlementLedger.user_id
+    ).scalar_subquery()
+    db.session.execute(
+        db.update(SettlementLedger)
+        .where(SettlementLedger.week_start == week_start, SettlementLedger.amount != db.func.coalesce(weekly, 0.0))
+        .values(amount=db.func.coalesce(weekly, 0.0))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        db.insert(SettlementLedger).from_select(
+            ['week_start', 'user_id', 'amount', 'applied_amount'],
+            db.select(
+                AppTimeWeekly.week_start,
+                AppTimeWeekly.user_id,
+                AppTimeWeekly.amount_charged,
+                db.literal(0.0)
+            ).where(
+                AppTimeWeekly.week_start == week_start,
+                AppTimeWeekly.amount_charged != 0,
+                ~db.select(SettlementLedger.user_id).where(
+                    SettlementLedger.week_start == week_start,
+                    SettlementLedger.user_id == AppTimeWeekly.user_id
+                ).exists()
+            )
+        )
+    )
+
+def reopened_weeks():
+    """Mondays of settled weeks whose app time changed since, oldest first."""
+    return db.session.execute(
+        db.select(WeeklySettlement.week_start)
+        .where(WeeklySettlement.reopened == db.true(), WeeklySettlement.settled_at.isnot(None))
+        .order_by(WeeklySettlement.week_start)
+    ).scalars().all()
+
+def parse_week(value):
+    """Parse an ISO week (2025-W07) or any date within it to its Monday."""
+    if 'W' in value.upper():
+        return datetime.strptime(f'{value.upper()}-1', '%G-W%V-%u').date()
+    return week_bounds(datetime.strptime(value, '%Y-%m-%d').date())[0]
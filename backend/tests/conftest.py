@@ -0,0 +1,62 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from app import create_app
+from extensions import db
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'query_budget(n): fail if any request in the test sends more than n SQL statements'
+    )
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    # Only reached when the test itself passed
+    result = yield
+    marker = item.get_closest_marker('query_budget')
+    app = item.funcargs.get('app')
+    if marker is None or app is None:
+        return result
+    over = app.extensions['query_log'].over_budget(marker.args[0])
+    if over:
+        pytest.fail('Query budget of %d exceeded:\n%s' % (marker.args[0], '\n'.join(
+            f'  {queries.method} {queries.path}: {len(queries)} statements' for queries in over
+        )))
+    return result
+
+
+@pytest.fixture
+def app():
+    # Each test gets its own app on a private in-memory SQLite database, with
+    # every request's statements recorded for query_budget and N+1 warnings
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'QUERY_DEBUG': True})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    def make_headers(user_id):
+        token = jwt.encode({
+            'sub': user_id,
+            'exp': datetime.utcnow() + timedelta(hours=1)
+        }, app.config['JWT_SECRET'], algorithm='HS256')
+        return {'Authorization': f'Bearer {token}'}
+    return make_headers
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from analytics import bucket_percentile, rebuild_app_usage
+from extensions import db
+from models import AppUsageDaily, User
+
+TODAY = datetime.now().date()
+
+
+def usage_rows():
+    # Summed over shards, which is all that readers see
+    key = (AppUsageDaily.date, AppUsageDaily.app_name, AppUsageDaily.bucket)
+    rows = db.session.execute(
+        db.select(*key, db.func.sum(AppUsageDaily.user_days), db.func.sum(AppUsageDaily.time_spent_hours))
+        .group_by(*key)
+    ).all()
+    return sorted((date, app_name, bucket, user_days, round(hours, 6))
+                  for date, app_name, bucket, user_days, hours in rows if user_days)
+
+
+def test_writes_keep_the_daily_aggregates_current(app, client, auth_headers):
+    db.session.add_all(User(user_id=f'user-{i}', email=f'user-{i}@example.com', name=f'User {i}') for i in range(4))
+    db.session.commit()
+
+    for i in range(4):
+        client.post('/user/apptime/batch', headers=auth_headers(f'user-{i}'), json={'entries': [
+            {'date': TODAY.isoformat(), 'app_name': 'TikTok', 'time_spent_hours': 1.0 + i},
+            {'date': TODAY.isoformat(), 'app_name': 'Reddit', 'time_spent_hours': 0.5}
+        ]})
+    # An overwrite moves the user-day to another bucket rather than adding one
+    client.post('/user/apptime', headers=auth_headers('user-0'), json={
+        'date': TODAY.isoformat(), 'app_name': 'TikTok', 'time_spent_hours': 9.0
+    })
+
+    # Four users' writes spread over the shards
+    assert len({row.shard for row in AppUsageDaily.query}) > 1
+    incremental = usage_rows()
+    rebuild_app_usage()
+    assert usage_rows() == incremental
+
+    body = client.get(
+        f'/analytics/apps?start={TODAY.isoformat()}&end={TODAY.isoformat()}', headers=auth_headers('user-1')
+    ).get_json()
+    tiktok, reddit = body['apps']
+    assert tiktok['app_name'] == 'TikTok' and reddit['app_name'] == 'Reddit'
+    assert tiktok['user_days'] == 4
+    assert tiktok['total_hours'] == 18.0 and tiktok['total_charged'] == 36.0
+    assert tiktok['avg_hours'] == 4.5
+    assert reddit['total_hours'] == 2.0 and reddit['percentiles']['p50']['time_spent_hours'] <= 1.0
+
+    statements = app.extensions['query_log'].requests[-1].statements
+    assert not any('app_time_history' in statement for statement, _, _, _ in statements)
+
+
+def test_range_is_validated(app, client, auth_headers):
+    db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1'))
+    db.session.commit()
+    headers = auth_headers('user-1')
+    assert client.get('/analytics/apps?start=yesterday', headers=headers).status_code == 400
+    assert client.get(
+        f'/analytics/apps?start={TODAY.isoformat()}&end={(TODAY - timedelta(days=1)).isoformat()}', headers=headers
+    ).status_code == 400
+    assert client.get('/analytics/apps', headers=headers).get_json()['apps'] == []
+
+
+def test_bucket_percentiles_interpolate_within_a_bucket():
+    # 10 user-days below 0.25h and 10 between 2h and 3h
+    counts = {0: 10, 5: 10}
+    assert bucket_percentile(counts, 25) == 0.125
+    assert bucket_percentile(counts, 50) == 0.25
+    assert bucket_percentile(counts, 75) == 2.5
+    assert bucket_percentile({}, 50) == 0.0
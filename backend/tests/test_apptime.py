@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+from apptime import rebuild_weekly_totals
+from extensions import db
+from models import AppTimeHistory, AppTimeWeekly, User
+
+TODAY = datetime.now().date()
+
+
+def add_user():
+    db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1'))
+    db.session.commit()
+
+
+def test_batch_reports_each_entry(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    day = TODAY.isoformat()
+    response = client.post('/user/apptime/batch', headers=headers, json={'entries': [
+        {'date': day, 'app_name': 'TikTok', 'time_spent_hours': 1.0},
+        {'date': day, 'app_name': 'Reddit', 'time_spent_hours': 'lots'},
+        {'date': 'today', 'app_name': 'Reddit', 'time_spent_hours': 1.0},
+        {'date': day, 'app_name': 'TikTok', 'time_spent_hours': 2.5},
+    ]})
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == ['superseded', 'error', 'error', 'ok']
+
+    entry = AppTimeHistory.query.one()
+    assert (entry.app_name, entry.time_spent_hours, entry.amount_charged) == ('TikTok', 2.5, 5.0)
+    profile = client.get('/user/profile', headers=headers).get_json()
+    assert profile['targeted_apps_time_weekly'] == 2.5
+
+
+def test_batch_rejects_bad_envelopes(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    assert client.post('/user/apptime/batch', headers=headers, json={'entries': []}).status_code == 400
+    assert client.post('/user/apptime/batch', headers=headers, json={'entries': {}}).status_code == 400
+    entries = [{'date': TODAY.isoformat(), 'app_name': f'App {i}', 'time_spent_hours': 1} for i in range(501)]
+    assert client.post('/user/apptime/batch', headers=headers, json={'entries': entries}).status_code == 400
+
+
+def test_single_write_validates_like_the_batch(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    yesterday = (TODAY - timedelta(days=1)).isoformat()
+    for body in (
+        {'date': 'yesterday', 'app_name': 'TikTok', 'time_spent_hours': 1},
+        {'date': yesterday, 'app_name': 'TikTok', 'time_spent_hours': 'an hour'},
+        {'date': yesterday, 'app_name': 'TikTok', 'time_spent_hours': -1},
+        {'date': 20240101, 'app_name': 'TikTok', 'time_spent_hours': 1},
+        {'app_name': 'TikTok', 'time_spent_hours': 1},
+    ):
+        assert client.post('/user/apptime', headers=headers, json=body).status_code == 400, body
+    assert AppTimeHistory.query.count() == 0
+
+
+def out_of_range_entries(day):
+    return [
+        {'date': day, 'app_name': 'TikTok', 'time_spent_hours': float('nan')},
+        {'date': day, 'app_name': 'TikTok', 'time_spent_hours': 1e308},
+        {'date': day, 'app_name': 'TikTok', 'time_spent_hours': 24.5},
+        {'date': day, 'app_name': 'x' * 300, 'time_spent_hours': 1},
+    ]
+
+
+def test_single_write_rejects_out_of_range_entries(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    for body in out_of_range_entries(TODAY.isoformat()):
+        assert client.post('/user/apptime', headers=headers, json=body).status_code == 400, body
+    assert AppTimeHistory.query.count() == 0
+
+
+def test_batch_rejects_out_of_range_entries(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    day = TODAY.isoformat()
+    entries = out_of_range_entries(day) + [{'date': day, 'app_name': 'x' * 255, 'time_spent_hours': 24}]
+    response = client.post('/user/apptime/batch', headers=headers, json={'entries': entries})
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == ['error'] * 4 + ['ok']
+    assert AppTimeHistory.query.one().amount_charged == 48.0
+
+
+def weekly_rows():
+    return sorted((row.user_id, row.week_start, round(row.time_spent_hours, 6), round(row.amount_charged, 6))
+                  for row in AppTimeWeekly.query)
+
+
+def test_weekly_totals_move_by_each_change(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    for days_ago, hours in ((0, 1.0), (0, 3.0), (8, 2.0), (8, 0.5), (15, 4.0)):
+        client.post('/user/apptime', headers=headers, json={
+            'date': (TODAY - timedelta(days=days_ago)).isoformat(), 'app_name': 'TikTok', 'time_spent_hours': hours
+        })
+    client.post('/user/apptime/batch', headers=headers, json={'entries': [
+        {'date': TODAY.isoformat(), 'app_name': 'TikTok', 'time_spent_hours': 2.0},
+        {'date': TODAY.isoformat(), 'app_name': 'Reddit', 'time_spent_hours': 1.0},
+    ]})
+
+    incremental = weekly_rows()
+    user = db.session.get(User, 'user-1')
+    assert (user.targeted_apps_time_weekly, user.amount_charged_weekly) == (3.0, 6.0)
+    rebuild_weekly_totals()
+    assert weekly_rows() == incremental
+
+
+def test_writers_of_one_user_take_turns(app, client, auth_headers):
+    add_user()
+    client.post('/user/apptime', headers=auth_headers('user-1'), json={
+        'date': TODAY.isoformat(), 'app_name': 'TikTok', 'time_spent_hours': 1.0
+    })
+
+    # The user row is locked before the history read that the deltas come
+    # from, so a concurrent first write of the same key is seen once it commits
+    statements = [statement for statement, _, _, _ in app.extensions['query_log'].requests[-1].statements]
+    lock = next(i for i, statement in enumerate(statements) if statement.startswith('SELECT users.user_id \nFROM users'))
+    read = next(i for i, statement in enumerate(statements) if 'FROM app_time_history' in statement)
+    assert lock < read
@@ -0,0 +1,55 @@
+from datetime import date
+
+from benchmark import dataset, runner
+from extensions import db
+from models import AppTimeHistory, AppTimeWeekly, User
+
+TODAY = date(2026, 3, 18)
+
+
+def test_seed_is_reproducible(app):
+    counts = dataset.seed(users=6, days=14, apps=3, seed=7, today=TODAY)
+    assert counts['users'] == 6
+    assert counts['app_time_history'] == 6 * 14 * 3
+    first = db.session.execute(
+        db.select(AppTimeHistory.user_id, AppTimeHistory.date, AppTimeHistory.app_name,
+                  AppTimeHistory.time_spent_hours).order_by(AppTimeHistory.history_id)
+    ).all()
+
+    dataset.seed(users=6, days=14, apps=3, seed=7, today=TODAY)
+    second = db.session.execute(
+        db.select(AppTimeHistory.user_id, AppTimeHistory.date, AppTimeHistory.app_name,
+                  AppTimeHistory.time_spent_hours).order_by(AppTimeHistory.history_id)
+    ).all()
+    assert first == second
+
+    # Derived summaries are built as part of the seed
+    assert db.session.query(AppTimeWeekly).count() > 0
+    positions = db.session.execute(
+        db.select(User.leaderboard_position).order_by(User.leaderboard_position)
+    ).scalars().all()
+    assert positions == list(range(1, 7))
+
+
+def test_run_reports_every_scenario(app):
+    dataset.seed(users=4, days=10, apps=3, seed=1)
+    results = runner.run(runner.AppTarget(app), user_count=4, requests_count=3, concurrency=1, warmup=0)
+
+    assert set(results['endpoints']) == set(runner.scenarios(TODAY))
+    for name, result in results['endpoints'].items():
+        assert result['requests'] == 3, name
+        assert result['errors'] == 0, name
+        assert result['latency_ms']['p50'] <= result['latency_ms']['p99']
+        assert result['queries'] is not None
+
+    rows, regressions = runner.compare(results, results)
+    assert len(rows) == len(results['endpoints'])
+    assert regressions == []
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert runner.percentile(values, 0.50) == 50
+    assert runner.percentile(values, 0.95) == 95
+    assert runner.percentile(values, 0.99) == 99
+    assert runner.percentile([3.0], 0.99) == 3.0
@@ -0,0 +1,60 @@
+from extensions import db
+from models import User
+
+
+def seed_users():
+    for i in range(5):
+        db.session.add(User(
+            user_id=f'user-{i}',
+            email=f'user-{i}@example.com',
+            name=f'User {i}',
+            total_invested=float(i * 10),
+            leaderboard_position=5 - i
+        ))
+    db.session.commit()
+
+
+def revalidate(client, path, headers):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    return etag, client.get(path, headers={**headers, 'If-None-Match': etag})
+
+
+def test_unchanged_resources_return_304(app, client, auth_headers):
+    seed_users()
+    headers = auth_headers('user-2')
+    for path in ['/user/profile', '/user/apps', '/leaderboard', '/leaderboard?around=1',
+                 '/investments/portfolio']:
+        etag, response = revalidate(client, path, headers)
+        assert response.status_code == 304, path
+        assert response.headers['ETag'] == etag
+        assert response.get_data() == b''
+
+
+def test_writes_change_the_etag(app, client, auth_headers):
+    seed_users()
+    headers = auth_headers('user-2')
+    etags = {path: revalidate(client, path, headers)[0]
+             for path in ['/user/apps', '/user/profile', '/leaderboard']}
+
+    response = client.put('/user/apps', json={'tracked_apps': ['Chess']}, headers=headers)
+    assert response.status_code == 200
+    assert db.session.get(User, 'user-2').row_version == 2
+
+    for path, etag in etags.items():
+        response = client.get(path, headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == 200, path
+        assert response.headers['ETag'] != etag
+
+
+def test_weak_and_wildcard_validators_match(app, client, auth_headers):
+    seed_users()
+    headers = auth_headers('user-2')
+    etag = client.get('/user/profile', headers=headers).headers['ETag']
+    for validator in (f'W/{etag}', f'"other", W/{etag}', '*'):
+        response = client.get('/user/profile', headers={**headers, 'If-None-Match': validator})
+        assert response.status_code == 304, validator
+        assert response.headers['ETag'] == etag
+    assert client.get('/user/profile', headers={**headers, 'If-None-Match': 'W/"other"'}).status_code == 200
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from events import notify_user_changes
+from extensions import db
+from models import User
+
+
+@pytest.fixture
+def app(tmp_path):
+    # A file database, so the publisher thread reads through its own connection
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+        'EVENTS_HEARTBEAT_SECONDS': 0.05,
+        # Streams end, failing the test, rather than wait for an event that never comes
+        'EVENTS_STREAM_SECONDS': 5,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            User(user_id=f'user-{i}', email=f'user-{i}@example.com', name=f'User {i}',
+                 total_invested=10.0 * i, leaderboard_position=3 - i)
+            for i in range(3)
+        )
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def next_event(frames):
+    """The (name, data) of the next event frame, skipping keep-alives."""
+    for frame in frames:
+        frame = frame.decode()
+        if frame.startswith('event: '):
+            name, data = frame.strip().split('\n')
+            return name[len('event: '):], json.loads(data[len('data: '):])
+    raise AssertionError('stream ended')
+
+
+def test_stream_sends_current_values_then_changes(app, client, auth_headers):
+    response = client.get('/events', headers=auth_headers('user-1'), buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    frames = response.iter_encoded()
+    assert next(frames) == b'retry: 5000\n\n'
+    assert next_event(frames) == ('rank', {'leaderboard_position': 2, 'leaderboard_id': None, 'total_invested': 10.0})
+    assert next_event(frames)[0] == 'portfolio'
+
+    user = db.session.get(User, 'user-1')
+    user.total_invested, user.leaderboard_position = 50.0, 1
+    notify_user_changes()
+    db.session.commit()
+
+    # Only the changed event is sent
+    assert next_event(frames) == ('rank', {'leaderboard_position': 1, 'leaderboard_id': None, 'total_invested': 50.0})
+    response.close()
+    assert len(app.extensions['event_publisher']) == 0
+
+
+def test_joining_a_group_is_streamed(app, client, auth_headers):
+    headers = auth_headers('user-1')
+    response = client.get('/events', headers=headers, buffered=False)
+    frames = response.iter_encoded()
+    next(frames)
+    assert next_event(frames)[1]['leaderboard_id'] is None
+    next_event(frames)
+
+    assert client.put('/user/leaderboard', headers=headers, json={'leaderboard_id': 'office'}).status_code == 200
+    assert next_event(frames) == ('rank', {'leaderboard_position': 2, 'leaderboard_id': 'office', 'total_invested': 10.0})
+    response.close()
+
+
+def test_one_read_per_change_for_every_subscriber(app):
+    publisher = app.extensions['event_publisher']
+    rows = db.session.execute(db.select(User)).scalars().all()
+    subscriptions = [
+        publisher.subscribe(user.user_id, {'rank': {'leaderboard_position': user.leaderboard_position,
+                                                    'leaderboard_id': user.leaderboard_id,
+                                                    'total_invested': user.total_invested}})
+        for user in rows + rows
+    ]
+    for subscription in subscriptions:
+        subscription.wait(0)
+
+    db.session.get(User, 'user-2').leaderboard_position = 3
+    db.session.commit()
+
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    pushed = publisher.refresh()
+    # Both of user-2's streams get the new rank and everyone gets a first
+    # portfolio event, from a single query
+    assert len(statements) == 1
+    assert pushed == 2 + len(subscriptions)
+    changed = [subscription.wait(0) for subscription in subscriptions if subscription.user_id == 'user-2']
+    assert [events['rank']['leaderboard_position'] for events in changed] == [3, 3]
+    assert publisher.refresh() == 0
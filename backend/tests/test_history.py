@@ -0,0 +1,127 @@
+import csv
+from datetime import datetime, timedelta
+import io
+import json
+
+from extensions import db
+import history
+from history import encode_cursor
+from models import AppTimeHistory, InvestmentHistory, User
+
+TODAY = datetime.now().date()
+
+
+def test_points_never_returns_more_buckets_than_asked(app, client, auth_headers):
+    db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1', total_invested=10.0))
+    db.session.add_all(
+        InvestmentHistory(user_id='user-1', date=TODAY - timedelta(days=offset), portfolio_value=float(offset))
+        for offset in range(800)
+    )
+    db.session.add_all(
+        AppTimeHistory(user_id='user-1', date=TODAY - timedelta(days=offset), app_name='TikTok',
+                       time_spent_hours=1.0, amount_charged=2.0)
+        for offset in range(800)
+    )
+    db.session.commit()
+    headers = auth_headers('user-1')
+
+    for days in (6, 13, 20, 45, 61, 365, 799):
+        for points in (1, 2, 3, 7, 12):
+            body = client.get(f'/investments/history?days={days}&points={points}', headers=headers).get_json()
+            assert 1 <= len(body['history']) <= points, (days, points)
+            apptime = client.get(f'/user/apptime?days={days}&points={points}', headers=headers).get_json()
+            assert len(apptime['history']) == len(body['history']) and apptime['bucket'] == body['bucket']
+
+    # The finest bucket that fits is used, and the newest buckets are kept
+    body = client.get('/investments/history?days=6&points=7', headers=headers).get_json()
+    assert (body['bucket'], len(body['history'])) == ('day', 7)
+    body = client.get('/investments/history?days=799&points=2', headers=headers).get_json()
+    assert body['bucket'] == 'month'
+    assert [entry['date'] for entry in body['history']][-1] == TODAY.replace(day=1).isoformat()
+    assert body['history'][-1]['portfolio_value'] == 0.0
+
+
+def add_history(days, apps=('Instagram', 'Reddit', 'TikTok')):
+    db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1', total_invested=10.0))
+    # Added newest first, so the order returned comes from the queries
+    for offset in range(days):
+        day = TODAY - timedelta(days=offset)
+        db.session.add(InvestmentHistory(user_id='user-1', date=day, portfolio_value=float(offset)))
+        db.session.add_all(
+            AppTimeHistory(user_id='user-1', date=day, app_name=app_name,
+                           time_spent_hours=float(offset), amount_charged=2.0 * offset)
+            for app_name in reversed(apps)
+        )
+    db.session.commit()
+
+
+def test_exports_stream_every_row_in_order_across_batches(app, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(history, 'EXPORT_BATCH_SIZE', 3)
+    add_history(7, apps=('Reddit', 'TikTok'))
+    headers = auth_headers('user-1')
+    days = [(TODAY - timedelta(days=offset)).isoformat() for offset in reversed(range(7))]
+
+    response = client.get('/investments/history/export?format=csv', headers=headers)
+    assert response.mimetype == 'text/csv'
+    chunks = list(response.response)
+    # Seven rows in batches of three, the header going out with the first
+    assert len(chunks) == 3
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+    assert rows == [['date', 'portfolio_value']] + [[day, str(float(6 - i))] for i, day in enumerate(days)]
+
+    response = client.get('/user/apptime/export', headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    chunks = list(response.response)
+    assert len(chunks) == 5
+    entries = [json.loads(line) for line in b''.join(chunks).splitlines()]
+    assert [(entry['date'], entry['app_name']) for entry in entries] == [
+        (day, app_name) for day in days for app_name in ('Reddit', 'TikTok')
+    ]
+    assert entries[0] == {'date': days[0], 'app_name': 'Reddit', 'time_spent_hours': 6.0, 'amount_charged': 12.0}
+
+    response = client.get('/user/apptime/export?format=csv&days=2', headers=headers)
+    assert response.get_data(as_text=True).splitlines() == ['date,app_name,time_spent_hours,amount_charged'] + [
+        f'{day},{app_name},{hours},{2 * hours}'
+        for day, hours in zip(days[-3:], (2.0, 1.0, 0.0)) for app_name in ('Reddit', 'TikTok')
+    ]
+    assert client.get('/user/apptime/export?format=xml', headers=headers).status_code == 400
+
+
+def read_pages(client, headers, url, limit):
+    entries, cursor, pages = [], None, 0
+    while True:
+        body = client.get(url + f'&limit={limit}' + (f'&cursor={cursor}' if cursor else ''), headers=headers).get_json()
+        assert len(body['history']) <= limit
+        entries += body['history']
+        pages += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            return entries, pages
+
+
+def test_keyset_pages_have_no_gaps_or_duplicates(app, client, auth_headers):
+    add_history(25)
+    headers = auth_headers('user-1')
+
+    for limit in (1, 4, 7, 25, 100):
+        everything = client.get('/investments/history?days=30', headers=headers).get_json()['history']
+        paged, pages = read_pages(client, headers, '/investments/history?days=30', limit)
+        assert paged == everything and len(everything) == 25
+        assert pages == max(1, -(-25 // limit))
+
+        # Three apps a day, so most page edges fall inside a day
+        everything = client.get('/user/apptime?days=30', headers=headers).get_json()['history']
+        paged, pages = read_pages(client, headers, '/user/apptime?days=30', limit)
+        assert paged == everything and len(everything) == 75
+        assert [(entry['date'], entry['app_name']) for entry in paged] == sorted(
+            (entry['date'], entry['app_name']) for entry in paged
+        )
+
+
+def test_a_bad_cursor_is_rejected(app, client, auth_headers):
+    add_history(3)
+    headers = auth_headers('user-1')
+    for cursor in ('not-a-cursor', encode_cursor('2024-01-01', 'TikTok', 'extra'), encode_cursor('yesterday')):
+        assert client.get(f'/investments/history?cursor={cursor}', headers=headers).status_code == 400, cursor
+    for cursor in ('not-a-cursor', encode_cursor('2024-01-01'), encode_cursor('yesterday', 'TikTok')):
+        assert client.get(f'/user/apptime?cursor={cursor}', headers=headers).status_code == 400, cursor
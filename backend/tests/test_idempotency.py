@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+from extensions import db
+from idempotency import purge_idempotency_keys
+from models import AppTimeHistory, IdempotencyKey, User
+
+
+def add_user():
+    db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1'))
+    db.session.commit()
+
+
+def post_apptime(client, headers, hours, key='retry-1'):
+    return client.post('/user/apptime', headers={**headers, 'Idempotency-Key': key}, json={
+        'date': datetime.now().date().isoformat(), 'app_name': 'TikTok', 'time_spent_hours': hours
+    })
+
+
+def last_request_tables(app):
+    statements = app.extensions['query_log'].requests[-1].statements
+    return ' '.join(statement for statement, _, _, _ in statements)
+
+
+def test_retries_replay_the_stored_response(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    first = post_apptime(client, headers, 2.0)
+    assert first.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+
+    retry = post_apptime(client, headers, 2.0)
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert app.extensions['query_log'].requests[-1].statements == []
+
+    # Another worker finds it in the table, still without touching app time
+    app.extensions['idempotency_cache'].clear()
+    assert post_apptime(client, headers, 2.0).get_json() == first.get_json()
+    tables = last_request_tables(app)
+    assert 'idempotency_keys' in tables
+    assert 'app_time_history' not in tables and 'users' not in tables
+    assert AppTimeHistory.query.count() == 1
+
+
+def test_a_key_reused_for_another_request_is_rejected(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    post_apptime(client, headers, 2.0)
+    assert post_apptime(client, headers, 3.0).status_code == 422
+    assert AppTimeHistory.query.one().time_spent_hours == 2.0
+
+    # Keys are per user
+    db.session.add(User(user_id='user-2', email='user-2@example.com', name='User 2'))
+    db.session.commit()
+    assert post_apptime(client, auth_headers('user-2'), 3.0).status_code == 200
+
+
+def test_expired_keys_run_again_and_are_purged(app, client, auth_headers):
+    add_user()
+    headers = auth_headers('user-1')
+    post_apptime(client, headers, 2.0)
+    app.extensions['idempotency_cache'].clear()
+    row = db.session.get(IdempotencyKey, ('user-1', 'retry-1'))
+    row.created_at -= timedelta(seconds=app.config['IDEMPOTENCY_TTL'] + 1)
+    db.session.commit()
+
+    response = post_apptime(client, headers, 3.0)
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+    assert AppTimeHistory.query.one().time_spent_hours == 3.0
+
+    # The new response replaced the expired one, so nothing is left to purge
+    assert purge_idempotency_keys() == 0
+    row = db.session.get(IdempotencyKey, ('user-1', 'retry-1'))
+    row.created_at -= timedelta(seconds=app.config['IDEMPOTENCY_TTL'] + 1)
+    db.session.commit()
+    assert purge_idempotency_keys() == 1
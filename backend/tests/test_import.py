@@ -0,0 +1,155 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from analytics import rebuild_app_usage
+from apptime import rebuild_weekly_totals
+from extensions import db
+from importer import import_app_time, normalize_app_name, parse_import_record
+from models import AppTimeHistory, AppTimeImport, AppTimeImportRow, AppTimeWeekly, AppUsageDaily, User
+
+TODAY = datetime.now().date()
+
+
+def add_users():
+    db.session.add_all(User(user_id=f'user-{i}', email=f'user-{i}@example.com', name=f'User {i}') for i in range(2))
+    db.session.commit()
+
+
+def summaries():
+    weekly = sorted((row.user_id, row.week_start, round(row.time_spent_hours, 6), round(row.amount_charged, 6))
+                    for row in AppTimeWeekly.query)
+    key = (AppUsageDaily.date, AppUsageDaily.app_name, AppUsageDaily.bucket)
+    usage = sorted((date, app_name, bucket, user_days, round(hours, 6)) for date, app_name, bucket, user_days, hours
+                   in db.session.execute(db.select(*key, db.func.sum(AppUsageDaily.user_days),
+                                                   db.func.sum(AppUsageDaily.time_spent_hours)).group_by(*key))
+                   if user_days)
+    users = sorted((user.user_id, user.targeted_apps_time_weekly) for user in User.query)
+    return weekly, usage, users
+
+
+def test_records_are_normalized_and_validated(app):
+    assert normalize_app_name('  com.zhiliaoapp.musically ') == 'TikTok'
+    assert normalize_app_name('You\tTube') == 'YouTube'
+    assert normalize_app_name('Some  Game') == 'Some Game'
+
+    day = (TODAY - timedelta(days=1)).isoformat()
+    assert parse_import_record({'date': f'{day}T08:00:00', 'package': 'com.reddit.frontpage', 'minutes': '90'},
+                               'user-1') == ('user-1', TODAY - timedelta(days=1), 'Reddit', 1.5)
+    for record in (
+        {'date': day, 'app_name': 'TikTok', 'hours': 1},
+        {'user_id': 'user-1', 'date': 'yesterday', 'app_name': 'TikTok', 'hours': 1},
+        {'user_id': 'user-1', 'date': day, 'app_name': ' ', 'hours': 1},
+        {'user_id': 'user-1', 'date': day, 'app_name': 'TikTok', 'hours': 25},
+        {'user_id': 'user-1', 'date': day, 'app_name': 'TikTok', 'seconds': 'a lot'},
+        {'user_id': 'user-1', 'date': (TODAY + timedelta(days=1)).isoformat(), 'app_name': 'TikTok', 'hours': 1},
+    ):
+        with pytest.raises(ValueError):
+            parse_import_record(record)
+
+
+def test_import_merges_once_and_matches_a_full_rebuild(app, tmp_path):
+    add_users()
+    # An existing day is kept unless the import replaces it
+    db.session.add(AppTimeHistory(user_id='user-0', date=TODAY, app_name='TikTok',
+                                  time_spent_hours=5.0, amount_charged=10.0))
+    rebuild_weekly_totals()
+    rebuild_app_usage()
+    db.session.commit()
+
+    path = tmp_path / 'export.csv'
+    lines = ['user_id,date,app,minutes']
+    for offset in range(30):
+        day = (TODAY - timedelta(days=offset)).isoformat()
+        lines += [f'user-0,{day},TikTok,60', f'user-1,{day},com.instagram.android,30']
+    # Sessions of one day add up; unknown users and bad rows are left out
+    lines += [f'user-1,{TODAY.isoformat()},Instagram,30', f'ghost,{TODAY.isoformat()},TikTok,60', 'user-1,,TikTok,60']
+    path.write_text('\n'.join(lines) + '\n')
+
+    result = import_app_time(str(path), chunk_size=7)
+    assert (result.records_read, result.rows_staged, result.rows_rejected) == (63, 62, 1)
+    assert result.rows_merged == 59
+    assert AppTimeImportRow.query.count() == 0
+
+    assert AppTimeHistory.query.filter_by(user_id='user-0', date=TODAY).one().time_spent_hours == 5.0
+    assert AppTimeHistory.query.filter_by(user_id='user-1', date=TODAY).one().time_spent_hours == 1.0
+
+    imported = summaries()
+    rebuild_weekly_totals()
+    rebuild_app_usage()
+    assert summaries() == imported
+
+    # Running it again is a no-op
+    assert import_app_time(str(path)).merged_at == result.merged_at
+
+
+def test_interrupted_import_resumes_after_the_last_chunk(app, tmp_path):
+    add_users()
+    path = tmp_path / 'export.ndjson'
+    path.write_text('\n'.join(json.dumps({
+        'date': (TODAY - timedelta(days=offset)).isoformat(), 'app_name': 'reddit', 'time_spent_hours': 0.5
+    }) for offset in range(20)) + '\n{not json\n')
+
+    def interrupt(read, staged, rejected):
+        if read == 10:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        import_app_time(str(path), user_id='user-1', import_id='backfill', chunk_size=5, progress=interrupt)
+    progress = db.session.get(AppTimeImport, 'backfill')
+    assert progress.records_read == 10 and progress.merged_at is None
+    assert AppTimeHistory.query.count() == 0
+
+    reads = []
+    result = import_app_time(str(path), user_id='user-1', import_id='backfill', chunk_size=5,
+                             progress=lambda read, staged, rejected: reads.append(read))
+    assert reads == [15, 20, 21]
+    assert (result.rows_staged, result.rows_rejected, result.rows_merged) == (20, 1, 20)
+    assert {entry.app_name for entry in AppTimeHistory.query} == {'Reddit'}
+    assert db.session.get(AppTimeWeekly, ('user-1', TODAY - timedelta(days=TODAY.weekday()))).time_spent_hours \
+        == 0.5 * (TODAY.weekday() + 1)
+
+
+def test_replace_overwrites_existing_days(app, tmp_path):
+    add_users()
+    db.session.add(AppTimeHistory(user_id='user-0', date=TODAY, app_name='TikTok',
+                                  time_spent_hours=5.0, amount_charged=10.0))
+    db.session.commit()
+    path = tmp_path / 'export.json'
+    path.write_text(json.dumps({'entries': [{'date': TODAY.isoformat(), 'app_name': 'TikTok', 'hours': 2}]}))
+
+    rebuild_app_usage()
+    # Usage of keys the file does not touch is left alone, not recomputed
+    db.session.add(AppUsageDaily(date=TODAY, app_name='Reddit', bucket=3, user_days=4,
+                                 time_spent_hours=4.0, amount_charged=8.0))
+    db.session.commit()
+
+    import_app_time(str(path), user_id='user-0', replace=True)
+    assert AppTimeHistory.query.one().amount_charged == 4.0
+    assert db.session.get(User, 'user-0').targeted_apps_time_weekly == 2.0
+    assert sorted((row.app_name, row.bucket, row.user_days, row.time_spent_hours)
+                  for row in AppUsageDaily.query if row.user_days) == [('Reddit', 3, 4, 4.0), ('TikTok', 5, 1, 2.0)]
+
+
+def test_merge_locks_the_affected_users_in_order_first(app, tmp_path):
+    add_users()
+    path = tmp_path / 'export.csv'
+    path.write_text(f'user_id,date,app,minutes\nuser-1,{TODAY.isoformat()},TikTok,60\n'
+                    f'user-0,{TODAY.isoformat()},TikTok,60\n')
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        import_app_time(str(path))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    # Taken in user_id order, as live writes lock their user, before the
+    # merge reads or writes any of their app time
+    lock = next(i for i, statement in enumerate(statements) if statement.startswith('SELECT users.user_id \nFROM users'))
+    history = next(i for i, statement in enumerate(statements) if 'app_time_history' in statement)
+    assert 'ORDER BY users.user_id' in statements[lock]
+    assert lock < history
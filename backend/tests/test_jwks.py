@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import auth
+from jwks import JWKSCache
+
+
+def make_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    public_jwk.update({'kid': kid, 'use': 'sig', 'alg': 'RS256'})
+    return private_key, public_jwk
+
+
+def write_jwks(path, *jwks):
+    path.write_text(json.dumps({'keys': list(jwks)}))
+
+
+@pytest.fixture
+def signing_key(tmp_path):
+    private_key, public_jwk = make_key('key-1')
+    jwks_path = tmp_path / 'jwks.json'
+    write_jwks(jwks_path, public_jwk)
+    return private_key, jwks_path
+
+
+def test_keys_are_fetched_once_and_reused(signing_key):
+    _, jwks_path = signing_key
+    cache = JWKSCache(str(jwks_path))
+
+    assert cache.get_key('key-1') is not None
+    jwks_path.write_text('not json')
+    # Still served from memory until the TTL expires
+    assert cache.get_key('key-1') is not None
+
+
+def test_unknown_kid_triggers_refresh_for_rotated_keys(signing_key):
+    _, jwks_path = signing_key
+    cache = JWKSCache(f'file://{jwks_path}', min_refresh_interval=0)
+    assert cache.get_key('key-2') is None
+
+    _, rotated_jwk = make_key('key-2')
+    write_jwks(jwks_path, rotated_jwk)
+    assert cache.get_key('key-2') is not None
+    assert cache.get_key('key-1') is None
+
+
+def test_unknown_kid_refreshes_are_rate_limited(signing_key):
+    _, jwks_path = signing_key
+    cache = JWKSCache(str(jwks_path), min_refresh_interval=60)
+    cache.get_key('key-1')
+
+    _, rotated_jwk = make_key('key-2')
+    write_jwks(jwks_path, rotated_jwk)
+    assert cache.get_key('key-2') is None
+
+
+def test_concurrent_refreshes_share_one_fetch(signing_key, monkeypatch):
+    _, jwks_path = signing_key
+    cache = JWKSCache(str(jwks_path))
+    fetches = []
+    fetch = cache._fetch
+
+    def slow_fetch():
+        fetches.append(1)
+        time.sleep(0.05)
+        return fetch()
+
+    monkeypatch.setattr(cache, '_fetch', slow_fetch)
+    threads = [threading.Thread(target=cache.get_key, args=('key-1',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+
+
+def test_failed_refresh_keeps_previous_keys(signing_key):
+    _, jwks_path = signing_key
+    cache = JWKSCache(str(jwks_path), ttl=0, min_refresh_interval=0)
+    assert cache.get_key('key-1') is not None
+
+    jwks_path.unlink()
+    assert cache.get_key('key-1') is not None
+
+
+def test_rs256_tokens_verify_against_jwks(app, signing_key, monkeypatch):
+    private_key, jwks_path = signing_key
+    monkeypatch.setitem(app.extensions, 'jwks_cache', JWKSCache(str(jwks_path)))
+    monkeypatch.setitem(app.config, 'AUTH0_DOMAIN', 'tenant.example.com')
+    monkeypatch.setitem(app.config, 'AUTH0_AUDIENCE', 'https://api.example.com')
+
+    claims = {
+        'sub': 'auth0|123',
+        'iss': 'https://tenant.example.com/',
+        'aud': 'https://api.example.com',
+        'exp': int(time.time()) + 60
+    }
+    token = jwt.encode(claims, private_key, algorithm='RS256', headers={'kid': 'key-1'})
+    assert auth.decode_token(token)['sub'] == 'auth0|123'
+
+    wrong_audience = jwt.encode(
+        dict(claims, aud='https://other.example.com'), private_key,
+        algorithm='RS256', headers={'kid': 'key-1'}
+    )
+    with pytest.raises(jwt.InvalidTokenError):
+        auth.decode_token(wrong_audience)
+
+    unknown_kid = jwt.encode(claims, private_key, algorithm='RS256', headers={'kid': 'key-9'})
+    with pytest.raises(jwt.InvalidTokenError):
+        auth.decode_token(unknown_kid)
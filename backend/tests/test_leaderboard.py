@@ -0,0 +1,137 @@
+import random
+from datetime import timedelta
+
+from apptime import current_week_start
+from extensions import db
+from leaderboard import rebuild_leaderboard, update_leaderboard_rank
+from models import AppTimeWeekly, User
+
+
+def ranking_matches_totals():
+    # Tied totals share a position, one plus the number of users with more
+    db.session.flush()
+    rows = db.session.execute(db.select(User.total_invested, User.leaderboard_position)).all()
+    return all(position == 1 + sum(other > total for other, _ in rows) for total, position in rows)
+
+
+def test_new_users_rank_with_users_loaded_in_the_session(app):
+    rng = random.Random(2)
+    # Every user stays loaded across the signups, so earlier shifts must be
+    # reflected on the objects later signups compare against
+    for i in range(30):
+        user = User(user_id=f'u{i}@example.com', name=f'User {i}', email=f'u{i}@example.com',
+                    total_invested=float(rng.choice([0, 5, 10, 15, 20.5])))
+        db.session.add(user)
+        update_leaderboard_rank(user)
+        assert ranking_matches_totals(), user.user_id
+    db.session.commit()
+
+    positions = dict(db.session.execute(db.select(User.user_id, User.leaderboard_position)).all())
+    rebuild_leaderboard()
+    db.session.commit()
+    assert dict(db.session.execute(db.select(User.user_id, User.leaderboard_position)).all()) == positions
+
+
+def test_signing_up_at_zero_moves_nobody(app, client):
+    for i, total in enumerate([10.0, 0.0, 0.0]):
+        user = User(user_id=f'u{i}', name=f'User {i}', email=f'u{i}@example.com', total_invested=total)
+        db.session.add(user)
+        update_leaderboard_rank(user)
+    db.session.commit()
+    versions = dict(db.session.execute(db.select(User.user_id, User.row_version)).all())
+
+    # The new user's id sorts before the zero-balance users, but ties share a position
+    response = client.post('/auth/login', json={'user_id': 'a-new', 'email': 'new@example.com', 'name': 'New'})
+    assert response.status_code == 200
+    assert db.session.get(User, 'a-new').leaderboard_position == 2
+    assert {user_id: version for user_id, version in db.session.execute(
+        db.select(User.user_id, User.row_version).where(User.user_id != 'a-new')
+    ).all()} == versions
+    assert [user.leaderboard_position for user in User.query.order_by(User.user_id)] == [2, 1, 2, 2]
+
+
+def add_group(group_id, totals):
+    db.session.add_all(
+        User(user_id=f'{group_id}-{i}', name=f'User {i}', email=f'{group_id}-{i}@example.com',
+             leaderboard_id=group_id, total_invested=total)
+        for i, total in enumerate(totals)
+    )
+    db.session.commit()
+
+
+def test_group_leaderboard_ranks_members_only(app, client, auth_headers):
+    add_group('office', [10.0, 30.0, 20.0])
+    add_group('friends', [100.0, 5.0])
+    headers = auth_headers('office-0')
+
+    body = client.get('/leaderboard/office', headers=headers).get_json()
+    assert [(entry['user_id'], entry['group_position']) for entry in body['leaderboard']] == [
+        ('office-1', 1), ('office-2', 2), ('office-0', 3)
+    ]
+    assert body['group_position'] == 3
+
+    first = client.get('/leaderboard/office?limit=2', headers=headers).get_json()
+    second = client.get(f"/leaderboard/office?limit=2&cursor={first['next_cursor']}", headers=headers).get_json()
+    assert [(entry['user_id'], entry['group_position']) for entry in second['leaderboard']] == [('office-0', 3)]
+    assert second['group_position'] == 3 and second['next_cursor'] is None
+
+    assert client.get('/leaderboard/friends', headers=headers).status_code == 403
+
+
+def test_group_members_with_equal_totals_share_a_position(app, client, auth_headers):
+    add_group('office', [30.0, 20.0, 20.0, 20.0, 10.0])
+    headers = auth_headers('office-3')
+
+    body = client.get('/leaderboard/office', headers=headers).get_json()
+    assert [entry['group_position'] for entry in body['leaderboard']] == [1, 2, 2, 2, 5]
+    assert body['group_position'] == 2
+
+    # A tie carried across pages keeps its position
+    first = client.get('/leaderboard/office?limit=2', headers=headers).get_json()
+    second = client.get(f"/leaderboard/office?limit=2&cursor={first['next_cursor']}", headers=headers).get_json()
+    third = client.get(f"/leaderboard/office?limit=2&cursor={second['next_cursor']}", headers=headers).get_json()
+    assert [entry['group_position'] for page in (first, second, third) for entry in page['leaderboard']] == [
+        1, 2, 2, 2, 5
+    ]
+
+
+def test_joining_a_group_refreshes_its_cached_ranking(app, client, auth_headers):
+    add_group('office', [10.0, 30.0])
+    add_group('solo', [50.0])
+    client.get('/leaderboard/office', headers=auth_headers('office-0'))
+    assert 'office' in app.extensions['group_leaderboard_cache']._entries
+
+    response = client.put('/user/leaderboard', headers=auth_headers('solo-0'), json={'leaderboard_id': 'office'})
+    assert response.get_json() == {'leaderboard_id': 'office', 'group_position': 1}
+
+    body = client.get('/leaderboard/office', headers=auth_headers('office-0')).get_json()
+    assert [entry['user_id'] for entry in body['leaderboard']] == ['solo-0', 'office-1', 'office-0']
+
+    # Leaving returns the user to a group of their own
+    client.put('/user/leaderboard', headers=auth_headers('solo-0'), json={'leaderboard_id': None})
+    assert db.session.get(User, 'solo-0').leaderboard_id == 'solo-0'
+    body = client.get('/leaderboard/office', headers=auth_headers('office-0')).get_json()
+    assert [entry['user_id'] for entry in body['leaderboard']] == ['office-1', 'office-0']
+
+
+def test_dashboard_averages_the_whole_group(app, client, auth_headers):
+    week_start = current_week_start()
+    for i, group in enumerate(['team', 'team', 'team', 'other', None]):
+        db.session.add(User(user_id=f'user-{i}', email=f'user-{i}@example.com', name=f'User {i}',
+                            total_invested=float(i), leaderboard_id=group))
+    db.session.add_all([
+        AppTimeWeekly(user_id='user-0', week_start=week_start, time_spent_hours=6.0, amount_charged=12.0),
+        AppTimeWeekly(user_id='user-1', week_start=week_start, time_spent_hours=3.0, amount_charged=6.0),
+        # Other weeks and other groups are left out
+        AppTimeWeekly(user_id='user-1', week_start=week_start - timedelta(days=7), time_spent_hours=9.0,
+                      amount_charged=18.0),
+        AppTimeWeekly(user_id='user-3', week_start=week_start, time_spent_hours=30.0, amount_charged=60.0),
+    ])
+    db.session.commit()
+
+    body = client.get('/dashboard?leaderboard_limit=1', headers=auth_headers('user-2')).get_json()
+    assert body['group_average'] == {
+        'leaderboard_id': 'team', 'targeted_apps_time_weekly': 3.0, 'amount_charged_weekly': 6.0
+    }
+    body = client.get('/dashboard?leaderboard_limit=0', headers=auth_headers('user-4')).get_json()
+    assert body['group_average'] is None and body['leaderboard'] == []
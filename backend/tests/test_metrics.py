@@ -0,0 +1,59 @@
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from app import create_app
+from extensions import db
+from metrics import TimedQueuePool
+from models import User
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_requests_record_duration_and_statements(app, client, auth_headers):
+    db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1'))
+    db.session.commit()
+    labels = {'method': 'GET', 'route': '/user/profile'}
+    requests_before = sample('http_request_duration_seconds_count', status='200', **labels)
+    statements_before = sample('http_request_db_statements_sum', **labels)
+
+    assert client.get('/user/profile', headers=auth_headers('user-1')).status_code == 200
+
+    assert sample('http_request_duration_seconds_count', status='200', **labels) == requests_before + 1
+    assert sample('http_request_db_statements_sum', **labels) > statements_before
+
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert b'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/user/profile",status="200"}' in response.data
+
+
+def test_metrics_need_the_token(app, client):
+    assert client.get('/metrics').status_code == 404
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer other-token'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
+
+
+def test_unknown_paths_share_one_series(client):
+    before = sample('http_request_duration_seconds_count', method='GET', route='unmatched', status='404')
+    client.get('/no/such/path')
+    client.get('/another/missing/path')
+    assert sample('http_request_duration_seconds_count', method='GET', route='unmatched', status='404') == before + 2
+
+
+def test_pool_checkout_wait_is_recorded():
+    engine = create_engine('sqlite://', poolclass=TimedQueuePool)
+    before = sample('db_pool_checkout_wait_seconds_count')
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert sample('db_pool_checkout_wait_seconds_count') == before + 1
+
+
+def test_metrics_can_be_disabled():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'METRICS_ENABLED': False})
+    assert app.test_client().get('/metrics').status_code == 404
+    assert not app.before_request_funcs
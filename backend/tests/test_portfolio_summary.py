@@ -0,0 +1,67 @@
+import random
+from datetime import date, timedelta
+
+from extensions import db
+from models import User
+from portfolio import record_investment_history, rebuild_portfolio_summaries
+
+SUMMARY_COLUMNS = ('portfolio_value', 'portfolio_date', 'portfolio_previous_value', 'portfolio_previous_date')
+
+
+def summaries():
+    db.session.expire_all()
+    return {
+        user.user_id: tuple(getattr(user, column) for column in SUMMARY_COLUMNS)
+        for user in User.query.order_by(User.user_id)
+    }
+
+
+def test_incremental_summaries_match_a_rebuild(app):
+    rng = random.Random(13)
+    for i in range(4):
+        db.session.add(User(user_id=f'user-{i}', name=f'User {i}', email=f'user-{i}@example.com'))
+    db.session.commit()
+
+    # Backfills, out-of-order days and several rows per user in one batch
+    start = date(2026, 1, 1)
+    days = {user_id: rng.sample(range(20), 8) for user_id in ['user-0', 'user-1', 'user-2']}
+    pending = [
+        {'user_id': user_id, 'date': start + timedelta(days=day), 'portfolio_value': float(100 + day)}
+        for user_id, offsets in days.items() for day in offsets
+    ]
+    rng.shuffle(pending)
+    while pending:
+        batch, pending = pending[:5], pending[5:]
+        record_investment_history(batch)
+    db.session.commit()
+    incremental = summaries()
+
+    rebuild_portfolio_summaries()
+    db.session.commit()
+    assert summaries() == incremental
+
+    latest = max(days['user-0'])
+    previous = max(day for day in days['user-0'] if day < latest)
+    assert incremental['user-0'] == (
+        100.0 + latest, start + timedelta(days=latest),
+        100.0 + previous, start + timedelta(days=previous)
+    )
+    assert incremental['user-3'] == (None, None, None, None)
+
+
+def test_portfolio_reads_the_summary(app, client, auth_headers):
+    db.session.add(User(user_id='investor', name='Investor', email='investor@example.com', total_invested=50.0))
+    db.session.commit()
+    record_investment_history([
+        {'user_id': 'investor', 'date': date(2026, 3, 2), 'portfolio_value': 110.0},
+        {'user_id': 'investor', 'date': date(2026, 3, 1), 'portfolio_value': 100.0},
+    ])
+    db.session.commit()
+
+    response = client.get('/investments/portfolio', headers=auth_headers('investor'))
+    assert response.get_json() == {
+        'total_value': 110.0,
+        'change_24h': 10.0,
+        'risk_level': 'standard',
+        'total_invested': 50.0
+    }
@@ -0,0 +1,177 @@
+"""Fail if a hot-path endpoint issues a query that SQLite would answer with
+a full table scan or a temporary sort.
+
+Each request runs against a seeded database while every statement it sends
+is recorded; the statements are then replayed under EXPLAIN QUERY PLAN.
+"""
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from apptime import current_weekly_totals, rebuild_weekly_totals
+from extensions import db
+from leaderboard import rebuild_leaderboard
+from models import User, AppTimeHistory, InvestmentHistory
+from portfolio import rebuild_portfolio_summaries
+
+USERS = 200
+DAYS = 60
+APPS = ['Instagram', 'TikTok', 'YouTube', 'Reddit']
+TARGET_USER = 'user0042@example.com'
+
+# A plan line like "SCAN app_time_history" (without USING INDEX) reads every row
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+@pytest.fixture
+def seeded(app):
+    rng = random.Random(4)
+    today = datetime.now().date()
+
+    users = [{
+        'user_id': f'user{i:04d}@example.com',
+        'name': f'User {i}',
+        'email': f'user{i:04d}@example.com',
+        'total_invested': round(rng.uniform(0, 2000), 2),
+        'leaderboard_id': f'group{i % 20:02d}',
+        'investment_risk_level': 'standard',
+        'tracked_apps': APPS
+    } for i in range(USERS)]
+    db.session.execute(db.insert(User), users)
+
+    app_time = []
+    investments = []
+    for user in users:
+        for day in range(DAYS):
+            date = today - timedelta(days=day)
+            for app_name in APPS:
+                hours = round(rng.uniform(0, 3), 1)
+                app_time.append({
+                    'user_id': user['user_id'],
+                    'date': date,
+                    'app_name': app_name,
+                    'time_spent_hours': hours,
+                    'amount_charged': hours * 2.0
+                })
+            investments.append({
+                'user_id': user['user_id'],
+                'date': date,
+                'portfolio_value': round(rng.uniform(100, 2000), 2)
+            })
+    db.session.execute(db.insert(AppTimeHistory), app_time)
+    db.session.execute(db.insert(InvestmentHistory), investments)
+
+    rebuild_weekly_totals()
+    rebuild_portfolio_summaries()
+    rebuild_leaderboard()
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    return today
+
+
+@pytest.fixture
+def captured_statements(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.startswith('EXPLAIN'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def plan_problems(statement, parameters):
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+
+    problems = []
+    for row in plan:
+        detail = row[-1]
+        if FULL_SCAN.match(detail) or 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+
+def hot_paths(today):
+    yesterday = (today - timedelta(days=1)).isoformat()
+    return {
+        'get_profile': ('GET', '/user/profile', None),
+        'get_apptime': ('GET', '/user/apptime?days=30', None),
+        'get_apptime_page': ('GET', '/user/apptime?days=30&limit=20', None),
+        'export_apptime': ('GET', '/user/apptime/export?format=csv', None),
+        'update_apptime': ('POST', '/user/apptime', {
+            'date': yesterday, 'app_name': 'TikTok', 'time_spent_hours': 2.5
+        }),
+        'update_apptime_batch': ('POST', '/user/apptime/batch', {'entries': [
+            {'date': today.isoformat(), 'app_name': app_name, 'time_spent_hours': 1.0}
+            for app_name in APPS
+        ]}),
+        'get_leaderboard': ('GET', '/leaderboard?limit=20', None),
+        'get_leaderboard_around': ('GET', '/leaderboard?around=5', None),
+        'get_group_leaderboard': ('GET', '/leaderboard/group02?limit=5', None),
+        'get_portfolio': ('GET', '/investments/portfolio', None),
+        'get_investment_history': ('GET', '/investments/history?days=30', None),
+        'export_investment_history': ('GET', '/investments/history/export', None),
+        'get_dashboard': ('GET', '/dashboard', None),
+    }
+
+
+@pytest.mark.parametrize('endpoint', sorted(hot_paths(datetime.now().date())))
+def test_hot_path_queries_use_indexes(endpoint, seeded, client, auth_headers, captured_statements):
+    method, path, body = hot_paths(seeded)[endpoint]
+
+    response = client.open(path, method=method, json=body, headers=auth_headers(TARGET_USER))
+    assert response.status_code == 200
+    # Streamed exports only query the database as the body is read
+    response.get_data()
+
+    queries = [
+        (statement, parameters) for statement, parameters in captured_statements
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))
+    ]
+    assert queries, f'{endpoint} issued no queries'
+
+    for statement, parameters in queries:
+        problems = plan_problems(statement, parameters)
+        assert not problems, f'{endpoint}: {problems} for {statement}'
+
+
+def test_leaderboard_cursor_page_uses_index(seeded, client, auth_headers, captured_statements):
+    headers = auth_headers(TARGET_USER)
+    first = client.get('/leaderboard?limit=20', headers=headers).get_json()
+    captured_statements.clear()
+
+    response = client.get(f"/leaderboard?limit=20&cursor={first['next_cursor']}", headers=headers)
+    assert response.status_code == 200
+
+    for statement, parameters in captured_statements:
+        assert not plan_problems(statement, parameters), statement
+
+
+def test_dashboard_is_one_query_per_table(seeded, client, auth_headers, captured_statements):
+    # The first request also reads the newest compacted week, kept for a minute
+    client.get('/dashboard', headers=auth_headers(TARGET_USER))
+    captured_statements.clear()
+    response = client.get('/dashboard', headers=auth_headers(TARGET_USER))
+    assert response.status_code == 200
+    body = response.get_json()
+
+    # The current user, their rank count and the top of the leaderboard, then
+    # one statement each for weekly totals, app time, investment history and
+    # the group's average
+    selects = [s for s, _ in captured_statements if s.lstrip().upper().startswith('SELECT')]
+    assert len(selects) == 7, selects
+
+    user = db.session.get(User, TARGET_USER)
+    assert body['profile']['rank'] == user.leaderboard_position
+    members = User.query.filter_by(leaderboard_id=user.leaderboard_id).all()
+    weekly = current_weekly_totals([member.user_id for member in members])
+    assert body['group_average']['targeted_apps_time_weekly'] == pytest.approx(
+        sum(hours for hours, _ in weekly.values()) / len(members)
+    )
+    assert body['portfolio']['total_value'] == body['investment_history'][-1]['portfolio_value']
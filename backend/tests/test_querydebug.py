@@ -0,0 +1,68 @@
+import logging
+from datetime import date
+
+import pytest
+
+from extensions import db
+from models import AppTimeHistory, User
+from querydebug import normalize
+
+
+def seed_users(count=4):
+    for i in range(count):
+        db.session.add(User(user_id=f'user-{i}', email=f'user-{i}@example.com', name=f'User {i}'))
+        db.session.add(AppTimeHistory(
+            user_id=f'user-{i}', date=date(2025, 1, 6), app_name='TikTok', time_spent_hours=1.0, amount_charged=2.0
+        ))
+    db.session.commit()
+
+
+def test_repeated_statements_are_flagged(app, client, caplog):
+    seed_users()
+
+    @app.route('/debug/lazy-loop')
+    def lazy_loop():
+        # One lazy load of app_time_history per user
+        return {user.user_id: len(user.app_time_history) for user in User.query.all()}
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        assert client.get('/debug/lazy-loop').status_code == 200
+
+    warnings = [r.getMessage() for r in caplog.records if 'Possible N+1' in r.getMessage()]
+    assert len(warnings) == 1
+    assert 'GET /debug/lazy-loop: 4 x SELECT' in warnings[0]
+    assert 'FROM app_time_history' in warnings[0]
+
+
+def test_slow_statements_are_logged_with_their_plan(app, client, auth_headers, caplog):
+    seed_users(1)
+    app.config['SLOW_QUERY_MS'] = 0
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        assert client.get('/user/profile', headers=auth_headers('user-0')).status_code == 200
+
+    slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Slow query on GET /user/profile')]
+    assert slow
+    assert any('SEARCH users USING INDEX' in message for message in slow)
+
+
+@pytest.mark.query_budget(3)
+def test_profile_stays_within_its_query_budget(app, client, auth_headers):
+    seed_users(1)
+    assert client.get('/user/profile', headers=auth_headers('user-0')).status_code == 200
+    assert app.extensions['query_log'].requests[-1].path == '/user/profile'
+
+
+def test_over_budget_reports_each_request(app, client, auth_headers):
+    seed_users(1)
+    client.get('/health')
+    client.get('/user/profile', headers=auth_headers('user-0'))
+
+    over = app.extensions['query_log'].over_budget(0)
+    assert [queries.path for queries in over] == ['/user/profile']
+
+
+def test_expanded_in_lists_normalize_to_one_statement():
+    assert normalize('SELECT * FROM users\n WHERE user_id IN (?, ?, ?)') == \
+        normalize('SELECT * FROM users WHERE user_id IN (?)') == \
+        'SELECT * FROM users WHERE user_id IN (...)'
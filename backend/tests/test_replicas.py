@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from app import create_app
+from extensions import db
+from models import User
+from replicas import LAST_WRITE_HEADER
+
+
+@pytest.fixture
+def app(tmp_path):
+    # Two SQLite files stand in for a primary and a lagging replica
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'SQLALCHEMY_BINDS': {'replica': f"sqlite:///{tmp_path / 'replica.db'}"},
+    })
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica'])
+        for engine, name in [(db.engine, 'Primary'), (db.engines['replica'], 'Replica')]:
+            with engine.begin() as conn:
+                conn.execute(db.insert(User), [
+                    {'user_id': f'user-{i}', 'email': f'user-{i}@example.com', 'name': f'{name} {i}',
+                     'tracked_apps': ['TikTok']}
+                    for i in range(2)
+                ])
+        yield app
+        db.session.remove()
+    # init_app registered an empty 'replica' metadata on the shared db, which
+    # apps without the bind would otherwise trip over in create_all
+    db.metadatas.pop('replica', None)
+
+
+def test_reads_use_the_replica(client, auth_headers):
+    response = client.get('/user/profile', headers=auth_headers('user-0'))
+    assert response.get_json()['name'] == 'Replica 0'
+
+
+def test_writers_read_their_writes_from_the_primary(app, client, auth_headers):
+    headers = auth_headers('user-0')
+    response = client.put('/user/apps', headers=headers, json={'tracked_apps': ['YouTube']})
+    assert response.status_code == 200
+
+    assert db.session.get(User, 'user-0').tracked_apps == ['YouTube']
+    with db.engines['replica'].connect() as conn:
+        assert conn.execute(db.select(User.tracked_apps).where(User.user_id == 'user-0')).scalar() == ['TikTok']
+
+    # The writer is pinned to the primary; other users still read the replica
+    assert client.get('/user/apps', headers=headers).get_json()['tracked_apps'] == ['YouTube']
+    assert client.get('/user/profile', headers=auth_headers('user-1')).get_json()['name'] == 'Replica 1'
+
+
+def test_stickiness_expires(app, client, auth_headers, monkeypatch):
+    headers = auth_headers('user-0')
+    client.put('/user/apps', headers=headers, json={'tracked_apps': ['YouTube']})
+    assert client.get('/user/profile', headers=headers).get_json()['name'] == 'Primary 0'
+
+    later = time.monotonic() + app.config['REPLICA_STICKY_SECONDS'] + 1
+    monkeypatch.setattr(time, 'monotonic', lambda: later)
+    assert client.get('/user/profile', headers=headers).get_json()['name'] == 'Replica 0'
+
+
+def test_failed_writes_do_not_pin_the_user(client, auth_headers):
+    headers = auth_headers('user-0')
+    response = client.post('/investments/setup', headers=headers, json={'risk_level': 'reckless'})
+    assert response.status_code == 400
+    assert client.get('/user/profile', headers=headers).get_json()['name'] == 'Replica 0'
+
+
+def test_other_workers_honour_the_last_write_token(app, client, auth_headers, monkeypatch):
+    headers = auth_headers('user-0')
+    response = client.put('/user/apps', headers=headers, json={'tracked_apps': ['YouTube']})
+    token = response.headers[LAST_WRITE_HEADER]
+
+    # Another worker never saw the write, so it goes by the token the client sends back
+    other = create_app(dict(app.config)).test_client()
+    assert other.get('/user/apps', headers=headers).get_json()['tracked_apps'] == ['TikTok']
+    assert other.get('/user/apps', headers={**headers, LAST_WRITE_HEADER: token}).get_json()['tracked_apps'] \
+        == ['YouTube']
+
+    # Tokens are tied to their user, their signature and the sticky window
+    other_user = auth_headers('user-1')
+    assert other.get('/user/profile', headers={**other_user, LAST_WRITE_HEADER: token}).get_json()['name'] \
+        == 'Replica 1'
+    assert other.get('/user/apps', headers={**headers, LAST_WRITE_HEADER: token[:-2] + 'xx'}).get_json()[
+        'tracked_apps'] == ['TikTok']
+    later = time.time() + app.config['REPLICA_STICKY_SECONDS'] + 2
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert other.get('/user/apps', headers={**headers, LAST_WRITE_HEADER: token}).get_json()['tracked_apps'] \
+        == ['TikTok']
+
+
+def test_reads_do_not_get_a_last_write_token(client, auth_headers):
+    response = client.get('/user/profile', headers=auth_headers('user-0'))
+    assert LAST_WRITE_HEADER not in response.headers
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from apptime import rebuild_weekly_totals
+from extensions import db
+from models import AppTimeHistory, AppTimeRollup, AppTimeWeekly, User
+from retention import compact_app_time, daily_boundary, retention_boundary
+
+TODAY = datetime.now().date()
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'QUERY_DEBUG': True,
+        'APPTIME_RETENTION_DAYS': 14,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1'))
+        # 42 days of two apps, the oldest of which are past retention
+        db.session.add_all(
+            AppTimeHistory(user_id='user-1', date=TODAY - timedelta(days=offset), app_name=app_name,
+                           time_spent_hours=1.0, amount_charged=2.0)
+            for offset in range(42) for app_name in ('Reddit', 'TikTok')
+        )
+        db.session.commit()
+        rebuild_weekly_totals()
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def totals(history):
+    result = {}
+    for entry in history:
+        result[entry['app_name']] = result.get(entry['app_name'], 0.0) + entry['time_spent_hours']
+    return result
+
+
+def test_compaction_keeps_totals_and_recent_days(app, client, auth_headers):
+    headers = auth_headers('user-1')
+    before = client.get('/user/apptime?days=60', headers=headers).get_json()['history']
+    weekly = {row.week_start: row.time_spent_hours for row in AppTimeWeekly.query}
+
+    boundary = retention_boundary()
+    removed = compact_app_time(boundary, chunk_size=1)
+    assert removed == 2 * (boundary - (TODAY - timedelta(days=41))).days
+    assert AppTimeHistory.query.filter(AppTimeHistory.date < boundary).count() == 0
+    assert AppTimeHistory.query.count() == 84 - removed
+    assert {row.days for row in AppTimeRollup.query if row.week_start > TODAY - timedelta(days=41)} == {7}
+
+    after = client.get('/user/apptime?days=60', headers=headers).get_json()['history']
+    assert totals(after) == totals(before) == {'Reddit': 42.0, 'TikTok': 42.0}
+    recent = [entry for entry in after if entry['date'] >= boundary.isoformat()]
+    assert recent == [entry for entry in before if entry['date'] >= boundary.isoformat()]
+
+    # Paging walks the weekly rows, then the daily ones
+    pages, cursor = [], None
+    while True:
+        url = '/user/apptime?days=60&limit=5' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get(url, headers=headers).get_json()
+        pages += body['history']
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert pages == after
+
+    buckets = client.get('/user/apptime?days=60&bucket=week', headers=headers).get_json()['history']
+    assert totals(buckets) == totals(before)
+
+    export = client.get('/user/apptime/export', headers=headers).get_data(as_text=True).splitlines()
+    assert len(export) == len(after)
+
+    # Rebuilt weekly totals still count the compacted weeks
+    rebuild_weekly_totals()
+    assert {row.week_start: row.time_spent_hours for row in AppTimeWeekly.query} == weekly
+
+
+def test_compaction_is_repeatable(app):
+    boundary = retention_boundary()
+    removed = compact_app_time(boundary)
+    rollups = {(row.week_start, row.app_name): row.time_spent_hours for row in AppTimeRollup.query}
+    assert compact_app_time(boundary) == 0
+    assert {(row.week_start, row.app_name): row.time_spent_hours for row in AppTimeRollup.query} == rollups
+    assert sum(rollups.values()) == removed
+
+
+def test_writes_past_retention_are_rejected(app, client, auth_headers):
+    headers = auth_headers('user-1')
+    old = (retention_boundary() - timedelta(days=1)).isoformat()
+    response = client.post('/user/apptime', headers=headers, json={
+        'date': old, 'app_name': 'TikTok', 'time_spent_hours': 5.0
+    })
+    assert response.status_code == 400
+
+    response = client.post('/user/apptime/batch', headers=headers, json={'entries': [
+        {'date': old, 'app_name': 'TikTok', 'time_spent_hours': 5.0},
+        {'date': TODAY.isoformat(), 'app_name': 'TikTok', 'time_spent_hours': 5.0}
+    ]})
+    assert [result['status'] for result in response.get_json()['results']] == ['error', 'ok']
+    assert AppTimeHistory.query.filter_by(date=TODAY, app_name='TikTok').one().time_spent_hours == 5.0
+
+
+@pytest.mark.parametrize('longer_retention', [60, None])
+def test_a_longer_retention_keeps_compacted_weeks_closed(app, client, auth_headers, longer_retention):
+    headers = auth_headers('user-1')
+    boundary = retention_boundary()
+    compact_app_time(boundary)
+    before = client.get('/user/apptime?days=60', headers=headers).get_json()['history']
+
+    app.config['APPTIME_RETENTION_DAYS'] = longer_retention
+    assert daily_boundary() == boundary
+    compacted = (boundary - timedelta(days=3)).isoformat()
+    response = client.post('/user/apptime', headers=headers, json={
+        'date': compacted, 'app_name': 'TikTok', 'time_spent_hours': 5.0
+    })
+    assert response.status_code == 400
+    # The compacted weeks are still read from their rollups, once each
+    assert client.get('/user/apptime?days=60', headers=headers).get_json()['history'] == before
+
+
+def test_weeks_with_daily_rows_and_a_rollup_are_rebuilt_once(app, client, auth_headers):
+    boundary = retention_boundary()
+    compact_app_time(boundary)
+    week = boundary - timedelta(days=7)
+    # A daily row that landed in a compacted week before writes there were refused
+    db.session.add(AppTimeHistory(user_id='user-1', date=week, app_name='TikTok',
+                                  time_spent_hours=2.0, amount_charged=4.0))
+    db.session.commit()
+
+    rebuild_weekly_totals()
+    assert db.session.get(AppTimeWeekly, ('user-1', week)).time_spent_hours == 16.0
+    assert AppTimeWeekly.query.filter_by(week_start=week).count() == 1
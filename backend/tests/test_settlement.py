@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+from apptime import current_week_start
+from extensions import db
+from models import AppTimeWeekly, SettlementLedger, User, WeeklySettlement
+import settlement
+from settlement import settle_week
+
+LAST_WEEK = current_week_start() - timedelta(days=7)
+
+
+def add_charges(week_start, charges):
+    for i, charge in enumerate(charges):
+        if db.session.get(User, f'user-{i}') is None:
+            db.session.add(User(user_id=f'user-{i}', email=f'user-{i}@example.com', name=f'User {i}',
+                                total_invested=0.0))
+        db.session.add(AppTimeWeekly(user_id=f'user-{i}', week_start=week_start,
+                                     time_spent_hours=charge / 2, amount_charged=charge))
+    db.session.commit()
+
+
+def totals():
+    return {user.user_id: user.total_invested for user in User.query.order_by(User.user_id)}
+
+
+def test_a_settled_week_is_not_applied_twice(app):
+    add_charges(LAST_WEEK, [4.0, 0.0, 10.0])
+    settlement = settle_week(LAST_WEEK)
+    assert (settlement.users_settled, settlement.amount_settled) == (2, 14.0)
+    assert totals() == {'user-0': 4.0, 'user-1': 0.0, 'user-2': 10.0}
+    assert [user.leaderboard_position for user in User.query.order_by(User.user_id)] == [2, 3, 1]
+
+    assert settle_week(LAST_WEEK) is None
+    assert totals() == {'user-0': 4.0, 'user-1': 0.0, 'user-2': 10.0}
+
+
+def test_an_interrupted_run_resumes_without_reapplying(app):
+    add_charges(LAST_WEEK, [1.0, 2.0, 3.0, 4.0, 5.0])
+
+    def interrupt(applied, upper):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        settle_week(LAST_WEEK, chunk_size=2, progress=interrupt)
+    assert totals() == {'user-0': 1.0, 'user-1': 2.0, 'user-2': 0.0, 'user-3': 0.0, 'user-4': 0.0}
+    assert db.session.get(WeeklySettlement, LAST_WEEK).settled_at is None
+
+    chunks = []
+    settle_week(LAST_WEEK, chunk_size=2, progress=lambda applied, upper: chunks.append(applied))
+    # The first chunk was already applied, so it changes nobody this time
+    assert chunks == [0, 2, 1]
+    assert totals() == {'user-0': 1.0, 'user-1': 2.0, 'user-2': 3.0, 'user-3': 4.0, 'user-4': 5.0}
+
+
+def test_every_settlement_transaction_takes_the_week_lock(app, monkeypatch):
+    add_charges(LAST_WEEK, [1.0, 2.0, 3.0, 4.0, 5.0])
+    steps = []
+    lock_week = settlement.lock_week
+    monkeypatch.setattr(settlement, 'lock_week', lambda week_start: steps.append('lock') or lock_week(week_start))
+    record_commit = lambda session: steps.append('commit')
+    event.listen(db.session(), 'after_commit', record_commit)
+    try:
+        settle_week(LAST_WEEK, chunk_size=2)
+        settle_week(LAST_WEEK, chunk_size=2)
+    finally:
+        event.remove(db.session(), 'after_commit', record_commit)
+    # create, copy, three chunks and the summary; then the settled check
+    assert steps == ['lock', 'commit'] * 7
+
+
+def test_a_run_overlapping_another_applies_each_charge_once(app):
+    add_charges(LAST_WEEK, [1.0, 2.0, 3.0, 4.0, 5.0])
+    overlapped = []
+
+    def overlap(applied, upper):
+        # A second run for the week between the first run's chunks
+        if not overlapped:
+            overlapped.append(settle_week(LAST_WEEK, chunk_size=2))
+
+    settle_week(LAST_WEEK, chunk_size=2, progress=overlap)
+    assert overlapped[0].users_settled == 5
+    assert totals() == {'user-0': 1.0, 'user-1': 2.0, 'user-2': 3.0, 'user-3': 4.0, 'user-4': 5.0}
+
+
+def test_late_edits_are_settled_by_the_difference(app, client, auth_headers):
+    add_charges(LAST_WEEK, [2.0])
+    settle_week(LAST_WEEK)
+    assert totals() == {'user-0': 2.0}
+
+    # A back-dated write to the settled week is accepted and reopens it
+    response = client.post('/user/apptime', headers=auth_headers('user-0'), json={
+        'date': LAST_WEEK.isoformat(), 'app_name': 'TikTok', 'time_spent_hours': 9.0
+    })
+    assert response.status_code == 200
+    assert db.session.get(AppTimeWeekly, ('user-0', LAST_WEEK)).amount_charged == 20.0
+    assert db.session.get(WeeklySettlement, LAST_WEEK).reopened
+
+    # The next settle-week run, for any week, settles the change once
+    result = app.test_cli_runner().invoke(args=['settle-week', '--week', (LAST_WEEK - timedelta(days=7)).isoformat()])
+    assert result.exit_code == 0, result.output
+    assert 'Settling changes to the week of' in result.output
+    db.session.expire_all()
+    assert totals() == {'user-0': 20.0}
+    assert db.session.get(SettlementLedger, (LAST_WEEK, 'user-0')).applied_amount == 20.0
+    assert not db.session.get(WeeklySettlement, LAST_WEEK).reopened
+
+    app.test_cli_runner().invoke(args=['settle-week', '--week', LAST_WEEK.isoformat()])
+    db.session.expire_all()
+    assert totals() == {'user-0': 20.0}
@@ -0,0 +1,95 @@
+import time
+
+import jwt
+
+import auth
+from auth import TokenCache
+from extensions import db
+from jwks import JWKSCache
+from models import User
+from test_jwks import make_key, write_jwks
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_the_ttl_or_the_token_exp(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth.time, 'time', clock)
+    cache = TokenCache(max_size=10, ttl=60)
+    cache.put('long-lived', {'sub': 'user-1', 'exp': clock.now + 3600})
+    cache.put('short-lived', {'sub': 'user-1', 'exp': clock.now + 30})
+
+    clock.now += 29
+    assert cache.get('long-lived')['sub'] == 'user-1'
+    assert cache.get('short-lived')['sub'] == 'user-1'
+    clock.now += 1
+    assert cache.get('short-lived') is None
+    clock.now += 30
+    assert cache.get('long-lived') is None
+    assert not cache._entries and not cache._by_user
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TokenCache(max_size=2, ttl=60)
+    cache.put('a', {'sub': 'user-a'})
+    cache.put('b', {'sub': 'user-b'})
+    assert cache.get('a')['sub'] == 'user-a'
+    cache.put('c', {'sub': 'user-c'})
+
+    assert cache.get('b') is None
+    assert cache.get('a')['sub'] == 'user-a' and cache.get('c')['sub'] == 'user-c'
+    assert set(cache._by_user) == {'user-a', 'user-c'}
+
+    assert TokenCache(max_size=0, ttl=60).get('a') is None
+
+
+def test_user_writes_invalidate_every_token_of_that_user(app, client):
+    db.session.add_all(User(user_id=f'user-{i}', email=f'user-{i}@example.com', name=f'User {i}')
+                       for i in range(2))
+    db.session.commit()
+    cache = app.extensions['token_cache']
+    # A reissued token is cached on its own, alongside the one it replaces
+    old, reissued, other = [
+        jwt.encode({'sub': user_id, 'exp': int(time.time()) + 3600 + i}, app.config['JWT_SECRET'], algorithm='HS256')
+        for i, user_id in enumerate(['user-0', 'user-0', 'user-1'])
+    ]
+    for token in (old, reissued, other):
+        assert client.get('/user/profile', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+    assert cache.get(old)['sub'] == cache.get(reissued)['sub'] == 'user-0'
+
+    db.session.get(User, 'user-0').name = 'Renamed'
+    db.session.commit()
+    assert cache.get(old) is None and cache.get(reissued) is None
+    assert cache.get(other)['sub'] == 'user-1'
+
+def test_rotated_out_signing_keys_drop_their_cached_tokens(app, client, tmp_path, monkeypatch):
+    private_key, public_jwk = make_key('key-1')
+    jwks_path = tmp_path / 'jwks.json'
+    write_jwks(jwks_path, public_jwk)
+    cache = app.extensions['token_cache']
+    jwks_cache = JWKSCache(str(jwks_path), min_refresh_interval=0, on_keys_removed=cache.invalidate_keys)
+    monkeypatch.setitem(app.extensions, 'jwks_cache', jwks_cache)
+    db.session.add(User(user_id='auth0|123', email='auth0@example.com', name='Auth0 User'))
+    db.session.commit()
+
+    token = jwt.encode({'sub': 'auth0|123', 'exp': int(time.time()) + 60}, private_key,
+                       algorithm='RS256', headers={'kid': 'key-1'})
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/user/profile', headers=headers).status_code == 200
+    assert cache.get(token) is not None
+
+    # A refresh that keeps the key keeps the token
+    jwks_cache.refresh()
+    assert cache.get(token) is not None
+
+    _, rotated_jwk = make_key('key-2')
+    write_jwks(jwks_path, rotated_jwk)
+    jwks_cache.refresh()
+    assert cache.get(token) is None
+    assert client.get('/user/profile', headers=headers).status_code == 401
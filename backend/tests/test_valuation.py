@@ -0,0 +1,122 @@
+import csv
+from datetime import date, datetime, timedelta
+import math
+import random
+
+from extensions import db
+from models import InvestmentHistory, User
+from portfolio import record_investment_history
+from valuation import DEFAULT_PRICE_SERIES_PATH, RISK_PROFILES, TRADING_DAYS, load_price_series, value_chunk, \
+    value_portfolios
+
+SERIES_START = date(2024, 1, 1)
+SERIES_END = date(2026, 10, 16)
+
+
+def reference_value(day, risk_level, total_invested, last_date, last_value, last_contributed):
+    """One user's portfolio value, worked out a price at a time without NumPy."""
+    with open(DEFAULT_PRICE_SERIES_PATH, newline='') as f:
+        prices = sorted((datetime.strptime(row['date'], '%Y-%m-%d').date(), float(row['close']))
+                        for row in csv.DictReader(f))
+    if last_date is None:
+        return round(max(total_invested, 0.0), 2)
+
+    returns = [math.log(close / previous) for (_, previous), (_, close) in zip(prices, prices[1:])]
+    mean = sum(returns) / len(returns)
+    std = math.sqrt(sum((r - mean) ** 2 for r in returns) / len(returns))
+    mu, sigma = RISK_PROFILES.get(risk_level, RISK_PROFILES['standard'])
+
+    def price_index(when):
+        return max(sum(1 for price_date, _ in prices if price_date <= when) - 1, 0)
+
+    log_growth = sum(mu / TRADING_DAYS + sigma / math.sqrt(TRADING_DAYS) * (r - mean) / std
+                     for r in returns[price_index(last_date):price_index(day)])
+    if last_contributed is None:
+        last_contributed = total_invested
+    return round(max(last_value * math.exp(log_growth) + (total_invested - last_contributed), 0.0), 2)
+
+
+def random_rows(rng, count, day):
+    rows = []
+    for i in range(count):
+        last_date = None if i % 5 == 0 else day - timedelta(days=rng.randint(1, 400))
+        rows.append((
+            f'user-{i:03}',
+            rng.choice(list(RISK_PROFILES) + ['unknown']),
+            round(rng.uniform(0, 500), 2),
+            last_date,
+            None if last_date is None else round(rng.uniform(0, 600), 2),
+            None if last_date is None or i % 7 == 0 else round(rng.uniform(0, 500), 2)
+        ))
+    return rows
+
+
+def test_chunk_values_agree_with_a_scalar_reference():
+    prices = load_price_series()
+    day = date(2026, 6, 15)
+    rows = random_rows(random.Random(3), 40, day)
+
+    values = {row['user_id']: row['portfolio_value'] for row in value_chunk(prices, day, rows)}
+    for row in rows:
+        if row[3] is None and not row[2]:
+            assert row[0] not in values
+        else:
+            assert values[row[0]] == reference_value(day, *row[1:])
+
+
+def test_dates_outside_the_price_series():
+    prices = load_price_series()
+    assert prices.last_date == SERIES_END
+    rows = [
+        # Entirely before the series: no price moves, so the value holds
+        ('before', 'high', 100.0, date(2023, 6, 1), 120.0, 100.0),
+        # From before the start to inside it: grows from the first price
+        ('into', 'high', 100.0, date(2023, 6, 1), 120.0, 100.0),
+        # From inside the series to past its end: stops at the last price
+        ('past', 'medium', 80.0, date(2026, 6, 1), 90.0, 80.0),
+    ]
+    before = {row['user_id']: row['portfolio_value'] for row in value_chunk(prices, date(2023, 12, 1), rows[:1])}
+    assert before == {'before': 120.0}
+
+    inside = value_chunk(prices, date(2025, 3, 3), rows[1:2])[0]['portfolio_value']
+    assert inside == reference_value(date(2025, 3, 3), *rows[1][1:])
+    assert inside == reference_value(date(2025, 3, 3), 'high', 100.0, SERIES_START, 120.0, 100.0)
+
+    past = [value_chunk(prices, day, rows[2:])[0]['portfolio_value']
+            for day in (SERIES_END, SERIES_END + timedelta(days=1), date(2027, 6, 1))]
+    assert past == [reference_value(SERIES_END, *rows[2][1:])] * 3
+
+
+def test_chunk_boundaries_value_every_user_once(app):
+    prices = load_price_series()
+    rng = random.Random(8)
+    day = date(2026, 2, 2)
+    rows = random_rows(rng, 11, day)
+    for user_id, risk_level, total_invested, *_ in rows:
+        db.session.add(User(user_id=user_id, name=user_id, email=f'{user_id}@example.com',
+                            investment_risk_level=risk_level, total_invested=total_invested))
+    record_investment_history([
+        {'user_id': row[0], 'date': row[3], 'portfolio_value': row[4], 'contributed': row[5]}
+        for row in rows if row[3] is not None
+    ])
+    db.session.commit()
+
+    chunks = []
+    written = value_portfolios(day, prices, chunk_size=4, progress=lambda *chunk: chunks.append(chunk))
+    assert [(read, upper) for read, _, upper in chunks] == [(4, 'user-003'), (4, 'user-007'), (3, 'user-010')]
+    assert written == sum(count for _, count, _ in chunks)
+
+    valued = {entry.user_id: entry.portfolio_value for entry in InvestmentHistory.query.filter_by(date=day)}
+    assert valued == {row['user_id']: row['portfolio_value'] for row in value_chunk(prices, day, rows)}
+
+    # A second run of the same day, in other chunks, writes nothing
+    assert value_portfolios(day, prices, chunk_size=3) == 0
+
+
+def test_prices_dated_after_today_are_ignored(tmp_path):
+    today = datetime.now().date()
+    path = tmp_path / 'prices.csv'
+    path.write_text('date,close\n' + ''.join(
+        f'{today + timedelta(days=offset)},{100 + offset}\n' for offset in (-2, -1, 0, 1, 30)
+    ))
+    assert load_price_series(str(path)).last_date == today
@@ -0,0 +1,264 @@
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import create_app
+from apptime import week_bounds
+from extensions import db
+import writebehind
+from models import AppTimeHistory, AppTimeWeekly, AppUsageDaily, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    # Write-behind on, with a file database so a second app can stand in for
+    # a restarted worker
+    config = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+        'APPTIME_WRITE_BEHIND': True,
+        'APPTIME_JOURNAL_PATH': str(tmp_path / 'journal.db'),
+        'APPTIME_FLUSH_INTERVAL': 0,
+    }
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(user_id='user-1', email='user-1@example.com', name='User 1'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def post(client, auth_headers, date, app_name, hours):
+    return client.post('/user/apptime', headers=auth_headers('user-1'), json={
+        'date': date.isoformat(), 'app_name': app_name, 'time_spent_hours': hours
+    })
+
+
+def test_updates_are_coalesced_until_flushed(app, client, auth_headers):
+    today = datetime.now().date()
+    for hours in (1.0, 1.5, 2.0):
+        response = post(client, auth_headers, today, 'TikTok', hours)
+        assert response.status_code == 202
+        assert response.get_json()['pending'] is True
+    post(client, auth_headers, today, 'YouTube', 0.5)
+
+    buffer = app.extensions['apptime_buffer']
+    assert len(buffer) == 2
+    assert AppTimeHistory.query.count() == 0
+
+    assert buffer.drain() == 2
+    assert len(buffer) == 0
+    rows = {row.app_name: row.time_spent_hours for row in AppTimeHistory.query}
+    assert rows == {'TikTok': 2.0, 'YouTube': 0.5}
+    weekly = db.session.get(AppTimeWeekly, ('user-1', week_bounds(today)[0]))
+    assert weekly.time_spent_hours == 2.5
+    assert db.session.get(User, 'user-1').amount_charged_weekly == 5.0
+
+
+def test_reads_merge_pending_updates(app, client, auth_headers):
+    headers = auth_headers('user-1')
+    today = datetime.now().date()
+    yesterday = today - timedelta(days=1)
+    post(client, auth_headers, yesterday, 'TikTok', 1.0)
+    post(client, auth_headers, today, 'TikTok', 1.0)
+    app.extensions['apptime_buffer'].drain()
+
+    # One pending overwrite of a stored row and one pending new row
+    post(client, auth_headers, yesterday, 'TikTok', 3.0)
+    post(client, auth_headers, yesterday, 'Reddit', 0.5)
+
+    history = client.get('/user/apptime?days=7', headers=headers).get_json()['history']
+    assert [(entry['date'], entry['app_name'], entry['time_spent_hours']) for entry in history] == [
+        (yesterday.isoformat(), 'Reddit', 0.5),
+        (yesterday.isoformat(), 'TikTok', 3.0),
+        (today.isoformat(), 'TikTok', 1.0),
+    ]
+
+    first = client.get('/user/apptime?days=7&limit=2', headers=headers).get_json()
+    assert [entry['app_name'] for entry in first['history']] == ['Reddit', 'TikTok']
+    second = client.get(f"/user/apptime?days=7&limit=2&cursor={first['next_cursor']}", headers=headers).get_json()
+    assert [(entry['date'], entry['app_name']) for entry in second['history']] == [(today.isoformat(), 'TikTok')]
+    assert second['next_cursor'] is None
+
+    buckets = client.get('/user/apptime?days=7&bucket=week', headers=headers).get_json()['history']
+    totals = {}
+    for entry in buckets:
+        totals[entry['app_name']] = totals.get(entry['app_name'], 0.0) + entry['time_spent_hours']
+    assert totals == {'Reddit': 0.5, 'TikTok': 4.0}
+
+
+def test_journal_is_replayed_after_a_restart(app, client, auth_headers):
+    today = datetime.now().date()
+    post(client, auth_headers, today, 'TikTok', 2.0)
+    client.post('/user/apptime/batch', headers=auth_headers('user-1'), json={'entries': [
+        {'date': today.isoformat(), 'app_name': 'TikTok', 'time_spent_hours': 2.5}
+    ]})
+
+    restarted = create_app({**app.config, 'TESTING': True})
+    with restarted.app_context():
+        assert restarted.extensions['apptime_buffer'].drain() == 1
+        assert AppTimeHistory.query.one().time_spent_hours == 2.5
+        # Replaying an already written row changes nothing
+        restarted.extensions['apptime_buffer'].put([{
+            'user_id': 'user-1', 'date': today, 'app_name': 'TikTok',
+            'time_spent_hours': 2.5, 'amount_charged': 5.0
+        }])
+        restarted.extensions['apptime_buffer'].drain()
+        assert db.session.get(AppTimeWeekly, ('user-1', week_bounds(today)[0])).time_spent_hours == 2.5
+        db.session.remove()
+
+
+def test_invalid_updates_are_rejected_before_journaling(app, client, auth_headers):
+    response = client.post('/user/apptime', headers=auth_headers('user-1'), json={
+        'date': datetime.now().date().isoformat(), 'app_name': 'TikTok', 'time_spent_hours': -1
+    })
+    assert response.status_code == 400
+    assert len(app.extensions['apptime_buffer']) == 0
+
+
+def test_two_workers_flushing_one_journal_write_each_row_once(app, client, auth_headers, monkeypatch):
+    today = datetime.now().date()
+    post(client, auth_headers, today, 'TikTok', 2.0)
+    post(client, auth_headers, today, 'Reddit', 1.0)
+
+    # Two workers on the host, each with its own buffer on the shared journal
+    workers = [create_app({**app.config, 'TESTING': True}) for _ in range(2)]
+    writing = threading.Event()
+    release = threading.Event()
+    write_app_time = writebehind.write_app_time
+
+    def slow_write(user, rows):
+        writing.set()
+        release.wait(5)
+        write_app_time(user, rows)
+
+    def drain(worker, results, **kwargs):
+        with worker.app_context():
+            try:
+                results.append(worker.extensions['apptime_buffer'].drain(**kwargs))
+            finally:
+                db.session.remove()
+
+    monkeypatch.setattr(writebehind, 'write_app_time', slow_write)
+    first, second = [], []
+    flushing = threading.Thread(target=drain, args=(workers[0], first))
+    flushing.start()
+    assert writing.wait(5)
+    monkeypatch.setattr(writebehind, 'write_app_time', write_app_time)
+
+    # A flush thread skips its turn, a flush command waits for the other drain
+    drain(workers[1], second, wait=False)
+    waiting = threading.Thread(target=drain, args=(workers[1], second))
+    waiting.start()
+    release.set()
+    flushing.join(5)
+    waiting.join(5)
+
+    assert first == [2] and second == [0, 0]
+    db.session.expire_all()
+    assert db.session.get(AppTimeWeekly, ('user-1', week_bounds(today)[0])).time_spent_hours == 3.0
+    assert sorted((row.app_name, row.user_days, row.time_spent_hours) for row in AppUsageDaily.query) == [
+        ('Reddit', 1, 1.0), ('TikTok', 1, 2.0)
+    ]
+
+
+def journal(app, rows):
+    # Straight into the journal, as rows written before put() checked them would be
+    with sqlite3.connect(app.config['APPTIME_JOURNAL_PATH']) as conn:
+        conn.executemany(
+            'INSERT INTO pending_app_time (user_id, date, app_name, time_spent_hours, amount_charged) '
+            'VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+
+
+def add_users(*user_ids):
+    db.session.add_all(User(user_id=user_id, email=f'{user_id}@example.com', name=user_id) for user_id in user_ids)
+    db.session.commit()
+
+
+def test_a_bad_row_is_set_aside_and_the_rest_flushed(app):
+    add_users('user-2', 'user-3')
+    today = datetime.now().date().isoformat()
+    journal(app, [
+        ('user-1', today, 'TikTok', 1.0, 2.0),
+        ('user-2', today, 'TikTok', 1e308, 2e308),
+        ('user-2', today, 'Reddit', 1.0, 2.0),
+        ('user-3', today, 'TikTok', 3.0, 6.0),
+    ])
+    buffer = app.extensions['apptime_buffer']
+
+    assert buffer.drain() == 4
+    assert len(buffer) == 0
+    assert sorted((row.user_id, row.app_name) for row in AppTimeHistory.query) == [
+        ('user-1', 'TikTok'), ('user-2', 'Reddit'), ('user-3', 'TikTok')
+    ]
+    [(user_id, date, app_name, hours, _, error, _)] = buffer.failed()
+    assert (user_id, date, app_name, hours) == ('user-2', today, 'TikTok', 1e308)
+    assert 'time_spent_hours' in error
+
+
+def test_a_user_the_database_rejects_does_not_block_the_others(app, monkeypatch):
+    add_users('user-2', 'user-3')
+    today = datetime.now().date().isoformat()
+    journal(app, [(user_id, today, 'TikTok', 1.0, 2.0) for user_id in ('user-1', 'user-2', 'user-3')])
+    write_app_time = writebehind.write_app_time
+
+    def reject_user_2(user, rows):
+        write_app_time(user, rows)
+        if user.user_id == 'user-2':
+            raise IntegrityError('INSERT', {}, Exception('rejected'))
+
+    monkeypatch.setattr(writebehind, 'write_app_time', reject_user_2)
+    buffer = app.extensions['apptime_buffer']
+    assert buffer.drain() == 3
+    assert len(buffer) == 0
+    assert sorted(row.user_id for row in AppTimeHistory.query) == ['user-1', 'user-3']
+    assert db.session.get(AppTimeWeekly, ('user-3', week_bounds(datetime.now().date())[0])).time_spent_hours == 1.0
+    assert [row[0] for row in buffer.failed()] == ['user-2']
+
+
+def test_an_unreachable_database_keeps_the_rows_pending(app, monkeypatch):
+    today = datetime.now().date().isoformat()
+    journal(app, [('user-1', today, 'TikTok', 1.0, 2.0)])
+
+    def unreachable(user, rows):
+        raise OperationalError('SELECT', {}, Exception('connection refused'))
+
+    monkeypatch.setattr(writebehind, 'write_app_time', unreachable)
+    buffer = app.extensions['apptime_buffer']
+    with pytest.raises(OperationalError):
+        buffer.drain()
+    assert len(buffer) == 1 and buffer.failed() == []
+
+
+def test_journal_calls_run_on_the_blocking_pool(app, client, auth_headers, monkeypatch):
+    # Stands in for gevent's thread pool, which has the same apply()
+    pool = ThreadPool(2)
+    monkeypatch.setattr(writebehind, 'blocking_pool', lambda: pool)
+    buffer = app.extensions['apptime_buffer']
+    threads = set()
+    connection = buffer._connection
+
+    def record_thread():
+        threads.add(threading.get_ident())
+        return connection()
+
+    monkeypatch.setattr(buffer, '_connection', record_thread)
+    today = datetime.now().date()
+    try:
+        assert post(client, auth_headers, today, 'TikTok', 2.0).status_code == 202
+        assert [row.time_spent_hours for row in buffer.pending('user-1', today, today)] == [2.0]
+        assert buffer.drain() == 1
+        assert len(buffer) == 0
+    finally:
+        pool.close()
+        pool.join()
+    assert threads and threading.get_ident() not in threads
+    assert AppTimeHistory.query.one().time_spent_hours == 2.0
@@ -0,0 +1,184 @@
+"""Daily portfolio valuation for every user.
+
+Each risk level tracks the benchmark in the local price-series file, rescaled
+to its own expected return and volatility. Users are valued in chunks of
+NumPy arrays, so memory stays bounded however many users there are, and each
+chunk's InvestmentHistory rows and portfolio summaries are written with one
+executemany statement each.
+"""
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+
+from events import notify_user_changes
+from extensions import db
+from models import InvestmentHistory, User
+from portfolio import record_investment_history
+
+TRADING_DAYS = 252
+VALUATION_CHUNK_SIZE = 50000
+DEFAULT_PRICE_SERIES_PATH = os.path.join(os.path.dirname(__file__), 'data', 'price_series.csv')
+
+# Annualised (expected return, volatility) for each investment_risk_level
+RISK_PROFILES = {
+    'low': (0.03, 0.04),
+    'standard': (0.05, 0.08),
+    'medium': (0.07, 0.12),
+    'high': (0.10, 0.20),
+}
+PROFILE_NAMES = list(RISK_PROFILES)
+PROFILE_INDEX = {name: i for i, name in enumerate(PROFILE_NAMES)}
+
+
+class PriceSeries:
+    """Cumulative log returns of every risk profile on each price date."""
+    
+    def __init__(self, dates, closes):
+        order = np.argsort(dates)
+        self.dates = np.asarray(dates, dtype=np.int64)[order]
+        closes = np.asarray(closes, dtype=np.float64)[order]
+        if len(self.dates) < 2:
+            raise ValueError('Price series needs at least two prices')
+        
+        log_returns = np.diff(np.log(closes))
+        std = log_returns.std()
+        z = (log_returns - log_returns.mean()) / std if std > 0 else np.zeros_like(log_returns)
+        
+        mu = np.array([RISK_PROFILES[name][0] for name in PROFILE_NAMES]) / TRADING_DAYS
+        sigma = np.array([RISK_PROFILES[name][1] for name in PROFILE_NAMES]) / np.sqrt(TRADING_DAYS)
+        profile_returns = mu[:, None] + sigma[:, None] * z[None, :]
+        
+        # cumulative[p, i] is profile p's log growth from the first price date to date i
+        self.cumulative = np.zeros((len(PROFILE_NAMES), len(self.dates)))
+        self.cumulative[:, 1:] = np.cumsum(profile_returns, axis=1)
+    
+    @property
+    def last_date(self):
+        return datetime.fromordinal(int(self.dates[-1])).date()
+    
+    def positions(self, ordinals):
+        # Latest price on or before each date; dates before the series start use the first price
+        return np.clip(np.searchsorted(self.dates, ordinals, side='right') - 1, 0, None)
+    
+    def growth(self, profiles, from_ordinals, to_ordinal):
+        """Growth factor of each profile between from_ordinals and to_ordinal."""
+        end = self.cumulative[profiles, self.positions(np.array([to_ordinal]))[0]]
+        start = self.cumulative[profiles, self.positions(from_ordinals)]
+        return np.exp(end - start)
+
+def load_price_series(path=None):
+    """Read a date,close CSV into a PriceSeries, ignoring prices dated after today."""
+    dates = []
+    closes = []
+    today = datetime.now().date().toordinal()
+    with open(path or DEFAULT_PRICE_SERIES_PATH, newline='') as f:
+        for row in csv.DictReader(f):
+            ordinal = datetime.strptime(row['date'], '%Y-%m-%d').date().toordinal()
+            if ordinal > today:
+                continue
+            dates.append(ordinal)
+            closes.append(float(row['close']))
+    return PriceSeries(dates, closes)
+
+def value_chunk(prices, day, rows):
+    """Compute the day's portfolio values for one chunk of users.
+
+    rows are (user_id, risk_level, total_invested, last_date, last_value,
+    last_contributed) tuples, with the last_* fields None for users that have
+    never been valued. Returns InvestmentHistory row dicts.
+    """
+    count = len(rows)
+    user_ids = [row[0] for row in rows]
+    profiles = np.fromiter(
+        (PROFILE_INDEX.get(row[1], PROFILE_INDEX['standard']) for row in rows),
+        dtype=np.int64, count=count
+    )
+    total_invested = np.fromiter((row[2] or 0.0 for row in rows), dtype=np.float64, count=count)
+    has_previous = np.fromiter((row[3] is not None for row in rows), dtype=bool, count=count)
+    day_ordinal = day.toordinal()
+    last_dates = np.fromiter(
+        (row[3].toordinal() if row[3] is not None else day_ordinal for row in rows),
+        dtype=np.int64, count=count
+    )
+    last_values = np.fromiter((row[4] or 0.0 for row in rows), dtype=np.float64, count=count)
+    # Rows written before contributions were recorded count as fully contributed
+    last_contributed = np.fromiter(
+        (row[5] if row[5] is not None else (row[2] or 0.0) for row in rows),
+        dtype=np.float64, count=count
+    )
+    
+    growth = prices.growth(profiles, last_dates, day_ordinal)
+    values = np.where(
+        has_previous,
+        last_values * growth + (total_invested - last_contributed),
+        total_invested
+    )
+    values = np.round(np.maximum(values, 0.0), 2)
+    
+    # Users that were already valued today or have nothing invested are skipped
+    keep = np.where(has_previous, last_dates < day_ordinal, total_invested > 0)
+    return [{
+        'user_id': user_ids[i],
+        'date': day,
+        'portfolio_value': float(values[i]),
+        'contributed': float(total_invested[i])
+    } for i in np.flatnonzero(keep)]
+
+def value_portfolios(day, prices, chunk_size=VALUATION_CHUNK_SIZE, progress=None):
+    """Write every user's InvestmentHistory row for day; returns rows written."""
+    written = 0
+    last_user_id = ''
+    while True:
+        user_ids = db.session.execute(
+            db.select(User.user_id)
+            .where(User.user_id > last_user_id)
+            .order_by(User.user_id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not user_ids:
+            break
+        upper = user_ids[-1]
+        in_chunk = [User.user_id > last_user_id, User.user_id <= upper]
+        
+        latest_dates = db.select(
+            InvestmentHistory.user_id,
+            db.func.max(InvestmentHistory.date).label('date')
+        ).where(
+            InvestmentHistory.user_id > last_user_id,
+            InvestmentHistory.user_id <= upper,
+            InvestmentHistory.date <= day
+        ).group_by(InvestmentHistory.user_id).subquery()
+        latest = db.select(InvestmentHistory).join(
+            latest_dates,
+            db.and_(
+                InvestmentHistory.user_id == latest_dates.c.user_id,
+                InvestmentHistory.date == latest_dates.c.date
+            )
+        ).subquery()
+        
+        rows = db.session.execute(
+            db.select(
+                User.user_id,
+                User.investment_risk_level,
+                User.total_invested,
+                latest.c.date,
+                latest.c.portfolio_value,
+                latest.c.contributed
+            )
+            .outerjoin(latest, latest.c.user_id == User.user_id)
+            .where(*in_chunk)
+            .order_by(User.user_id)
+        ).all()
+        
+        history = value_chunk(prices, day, rows)
+        record_investment_history(history)
+        notify_user_changes()
+        db.session.commit()
+        
+        written += len(history)
+        if progress:
+            progress(len(rows), len(history), upper)
+        last_user_id = upper
+    return written
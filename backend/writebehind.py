@@ -0,0 +1,382 @@
+"""Write-behind buffering for POST /user/apptime.
+
+With APPTIME_WRITE_BEHIND on, single app time updates go to a local SQLite
+journal instead of the main database. The journal keeps only the latest
+value per (user, date, app), survives restarts and is shared by every
+worker on the host. A thread in each worker flushes it every
+APPTIME_FLUSH_INTERVAL seconds with one bulk upsert per user, and
+/user/apptime merges the pending values in so clients read their own
+writes. Weekly totals, exports and the leaderboard catch up on flush.
+
+Only one process drains the journal at a time: flushing holds an exclusive
+lock on a file next to it, and a worker's flush thread skips its turn while
+another process holds it. Two flushers never write the same rows at once,
+so neither counts a new key's whole value as its change to the weekly and
+per-app totals after the other already has.
+
+Flushing writes absolute values, so replaying rows that had already been
+written (a crash between the database commit and the journal delete)
+changes nothing.
+
+Rows are checked like POST /user/apptime before they are journaled and
+again when flushed. If the database rejects a batch, its users are retried
+with one commit each, and the rows of any user that still fails move to the
+journal's failed_app_time table, so one bad row never holds up the rest.
+
+sqlite3 and flock block inside C without yielding to gevent, and every put
+waits for an fsync. In gevent workers those calls run on gevent's native
+thread pool (see off_hub), so they hold up only the request that made them
+and not every greenlet of the worker. The database writes of a flush stay
+on the hub, where psycopg2 yields through psycogreen.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date as Date, datetime
+from functools import wraps
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: development servers run a single process, so there is nobody to lock out
+    fcntl = None
+
+try:
+    import gevent
+    from gevent import monkey
+except ImportError:
+    gevent = None
+
+from flask import current_app
+from sqlalchemy import exc
+
+from apptime import parse_apptime_entry, write_app_time
+from extensions import db
+from models import AppTimeHistory, User
+from retention import check_writable
+
+APPTIME_FLUSH_BATCH = 5000
+# The database could not be reached, rather than refused a row; the batch
+# stays pending for the next flush
+UNAVAILABLE_ERRORS = (exc.OperationalError, exc.InterfaceError, exc.TimeoutError)
+
+def blocking_pool():
+    """gevent's thread pool when gevent has patched threading, else None."""
+    if gevent is None or not monkey.is_module_patched('threading'):
+        return None
+    return gevent.get_hub().threadpool
+
+def off_hub(function):
+    """Run function on blocking_pool(), if there is one, waiting cooperatively for its result."""
+    @wraps(function)
+    def run(*args, **kwargs):
+        pool = blocking_pool()
+        if pool is None:
+            return function(*args, **kwargs)
+        return pool.apply(function, args, kwargs)
+    return run
+
+@off_hub
+def flock(lock_file, operation):
+    fcntl.flock(lock_file, operation)
+
+PendingAppTime = namedtuple('PendingAppTime', 'user_id date app_name time_spent_hours amount_charged')
+
+JOURNAL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pending_app_time (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    app_name TEXT NOT NULL,
+    time_spent_hours REAL NOT NULL,
+    amount_charged REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, date, app_name)
+);
+CREATE TABLE IF NOT EXISTS failed_app_time (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    app_name TEXT NOT NULL,
+    time_spent_hours REAL,
+    amount_charged REAL,
+    error TEXT NOT NULL,
+    failed_at TEXT NOT NULL
+);
+'''
+
+
+class AppTimeBuffer:
+    """Pending app time rows in a SQLite journal, latest value per key.
+
+    Each row carries a version bumped on every overwrite, so a flush only
+    deletes the rows it wrote and keeps any that changed meanwhile.
+    """
+    
+    def __init__(self, path, flush_interval=5.0, batch_size=APPTIME_FLUSH_BATCH):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        self._connection().executescript(JOURNAL_SCHEMA)
+    
+    def _connection(self):
+        # sqlite3 connections are per thread and must not cross a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Every accepted write is on disk before the response goes out
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+    
+    def put(self, rows):
+        """Journal app time rows (dicts of AppTimeHistory values), replacing pending ones.
+
+        Raises ValueError, journaling none of them, if any row would be
+        refused by POST /user/apptime.
+        """
+        for row in rows:
+            check_row(row)
+        self._insert(rows)
+    
+    @off_hub
+    def _insert(self, rows):
+        with self._connection() as conn:
+            conn.executemany(
+                '''INSERT INTO pending_app_time (user_id, date, app_name, time_spent_hours, amount_charged)
+                VALUES (:user_id, :date, :app_name, :time_spent_hours, :amount_charged)
+                ON CONFLICT (user_id, date, app_name) DO UPDATE SET
+                    time_spent_hours = excluded.time_spent_hours,
+                    amount_charged = excluded.amount_charged,
+                    version = version + 1''',
+                [{**row, 'date': row['date'].isoformat()} for row in rows]
+            )
+    
+    @off_hub
+    def pending(self, user_id, start_date, end_date, after=None):
+        """Return the user's pending rows between two dates, ordered by (date, app_name).
+
+        after is an optional (date, app_name) keyset position to start past.
+        """
+        query = '''SELECT user_id, date, app_name, time_spent_hours, amount_charged
+            FROM pending_app_time WHERE user_id = ? AND date >= ? AND date <= ?'''
+        params = [user_id, start_date.isoformat(), end_date.isoformat()]
+        if after:
+            query += ' AND (date > ? OR (date = ? AND app_name > ?))'
+            params += [after[0].isoformat(), after[0].isoformat(), after[1]]
+        rows = self._connection().execute(query + ' ORDER BY date, app_name', params).fetchall()
+        return [PendingAppTime(row[0], Date.fromisoformat(row[1]), *row[2:]) for row in rows]
+    
+    @off_hub
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM pending_app_time').fetchone()[0]
+    
+    @off_hub
+    def failed(self):
+        """Return the rows moved to failed_app_time, oldest first, with their errors."""
+        return self._connection().execute(
+            '''SELECT user_id, date, app_name, time_spent_hours, amount_charged, error, failed_at
+            FROM failed_app_time ORDER BY rowid'''
+        ).fetchall()
+    
+    @contextmanager
+    def _drain_lock(self, wait):
+        """Hold the journal's drain lock, yielding False if wait is off and another flusher has it."""
+        if fcntl is None:
+            yield True
+            return
+        with open(self.path + '.lock', 'a') as lock_file:
+            try:
+                flock(lock_file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                flock(lock_file, fcntl.LOCK_UN)
+    
+    def flush(self, wait=True):
+        """Write up to batch_size pending rows to the database and drop them from the journal.
+
+        Needs an app context. Waits for any other flusher to finish first,
+        or with wait off returns 0 straight away. Returns the number of rows
+        taken off the journal, written or moved to failed_app_time; if the
+        database is unreachable the rows stay pending for the next flush.
+        """
+        with self._drain_lock(wait) as locked:
+            return self._flush_batch() if locked else 0
+    
+    def _flush_batch(self):
+        taken = self._take()
+        if not taken:
+            return 0
+        
+        # {user_id: {journal key: row}}, and {journal key: error} for rows not written
+        by_user = {}
+        failed = {}
+        for user_id, date, app_name, hours, charged, version in taken:
+            key = (user_id, date, app_name, version)
+            try:
+                by_user.setdefault(user_id, {})[key] = check_row({
+                    'user_id': user_id,
+                    'date': Date.fromisoformat(date),
+                    'app_name': app_name,
+                    'time_spent_hours': hours,
+                    'amount_charged': charged
+                })
+            except ValueError as e:
+                failed[key] = str(e)
+        
+        try:
+            self._write(by_user)
+        except UNAVAILABLE_ERRORS:
+            db.session.rollback()
+            raise
+        except Exception:
+            db.session.rollback()
+            # Find the users whose rows the database refuses
+            for user_id, rows in by_user.items():
+                try:
+                    self._write({user_id: rows})
+                except UNAVAILABLE_ERRORS:
+                    db.session.rollback()
+                    raise
+                except Exception as e:
+                    db.session.rollback()
+                    failed.update((key, str(e)) for key in rows)
+        
+        if failed:
+            current_app.logger.error('Moved %d app time rows to failed_app_time in %s', len(failed), self.path)
+        self._remove(taken, failed)
+        return len(taken)
+    
+    @off_hub
+    def _take(self):
+        return self._connection().execute(
+            '''SELECT user_id, date, app_name, time_spent_hours, amount_charged, version
+            FROM pending_app_time ORDER BY user_id LIMIT ?''',
+            (self.batch_size,)
+        ).fetchall()
+    
+    @off_hub
+    def _remove(self, taken, failed):
+        """Delete the taken rows, unless changed since, moving the failed ones to failed_app_time."""
+        with self._connection() as conn:
+            if failed:
+                failed_at = datetime.utcnow().isoformat()
+                conn.executemany(
+                    '''INSERT INTO failed_app_time
+                        (user_id, date, app_name, time_spent_hours, amount_charged, error, failed_at)
+                    SELECT user_id, date, app_name, time_spent_hours, amount_charged, ?, ?
+                    FROM pending_app_time
+                    WHERE user_id = ? AND date = ? AND app_name = ? AND version = ?''',
+                    [(error, failed_at, *key) for key, error in failed.items()]
+                )
+            conn.executemany(
+                '''DELETE FROM pending_app_time
+                WHERE user_id = ? AND date = ? AND app_name = ? AND version = ?''',
+                [(user_id, date, app_name, version) for user_id, date, app_name, _, _, version in taken]
+            )
+    
+    def _write(self, by_user):
+        users = User.query.filter(User.user_id.in_(list(by_user))).options(
+            db.load_only(User.targeted_apps_time_weekly, User.amount_charged_weekly)
+        ).all()
+        # Rows of users deleted since they were journaled are dropped
+        for user in users:
+            write_app_time(user, list(by_user[user.user_id].values()))
+        db.session.commit()
+    
+    def drain(self, wait=True):
+        """Flush batch after batch until the journal is empty; returns rows taken off it.
+
+        Holds the drain lock throughout; see flush for wait.
+        """
+        total = 0
+        with self._drain_lock(wait) as locked:
+            while locked:
+                written = self._flush_batch()
+                total += written
+                if written < self.batch_size:
+                    break
+        return total
+    
+    def start_flusher(self, app):
+        """Start this process's flush thread unless it is already running.
+
+        Called per request rather than at import, so a --preload master
+        never runs one and each forked worker starts its own.
+        """
+        if not self.flush_interval or self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_forever, args=(app,), name='apptime-flusher', daemon=True).start()
+    
+    def _flush_forever(self, app):
+        while True:
+            time.sleep(self.flush_interval)
+            with app.app_context():
+                try:
+                    # Another worker already draining will get these rows
+                    self.drain(wait=False)
+                except Exception:
+                    app.logger.exception('App time flush failed; rows stay in the journal')
+                finally:
+                    db.session.remove()
+
+def init_app(app):
+    if not app.config['APPTIME_WRITE_BEHIND']:
+        return
+    path = app.config['APPTIME_JOURNAL_PATH']
+    if not path:
+        os.makedirs(app.instance_path, exist_ok=True)
+        path = os.path.join(app.instance_path, 'apptime-journal.db')
+    buffer = AppTimeBuffer(path, flush_interval=app.config['APPTIME_FLUSH_INTERVAL'])
+    app.extensions['apptime_buffer'] = buffer
+    app.before_request(lambda: buffer.start_flusher(app))
+
+def check_row(row):
+    """Return a journal row if POST /user/apptime would accept it, else raise ValueError."""
+    parse_apptime_entry({**row, 'date': row['date'].isoformat()})
+    check_writable(row['date'])
+    return row
+
+def merge_pending(entries, pending, limit=None):
+    """Overlay pending rows on AppTimeHistory entries, keeping (date, app_name) order."""
+    merged = {(entry.date, entry.app_name): entry for entry in entries}
+    merged.update(((row.date, row.app_name), row) for row in pending)
+    ordered = [merged[key] for key in sorted(merged)]
+    return ordered[:limit] if limit else ordered
+
+def pending_deltas(user_id, pending):
+    """Return (date, app_name, hours, charge) changes the pending rows make to stored ones."""
+    if not pending:
+        return []
+    stored = {
+        (entry.date, entry.app_name): entry
+        for entry in AppTimeHistory.query.filter(
+            AppTimeHistory.user_id == user_id,
+            db.tuple_(AppTimeHistory.date, AppTimeHistory.app_name).in_(
+                [(row.date, row.app_name) for row in pending]
+            )
+        )
+    }
+    deltas = []
+    for row in pending:
+        old = stored.get((row.date, row.app_name))
+        deltas.append((
+            row.date,
+            row.app_name,
+            row.time_spent_hours - (old.time_spent_hours if old else 0.0),
+            row.amount_charged - (old.amount_charged if old else 0.0)
+        ))
+    return deltas
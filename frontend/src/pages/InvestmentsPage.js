@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth0 } from '@auth0/auth0-react';
 import { useNavigate } from 'react-router-dom';
-import { investmentsAPI, userAPI } from '../services/api';
+import { dashboardAPI, investmentsAPI } from '../services/api';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts';
 import { ArrowUp, ArrowDown, TrendingUp, ArrowLeft } from 'lucide-react';
 
@@ -45,18 +45,14 @@ const InvestmentsPage = () => {
 
   const loadData = async () => {
     try {
-      const [portfolioRes, historyRes, profileRes] = await Promise.all([
-        investmentsAPI.getPortfolio(),
-        investmentsAPI.getHistory(30),
-        userAPI.getProfile(),
-      ]);
+      const { data } = await dashboardAPI.getDashboard({ history_days: 30 });
 
-      setPortfolio(portfolioRes.data);
-      setHistory(historyRes.data.history);
-      setProfile(profileRes.data);
+      setPortfolio(data.portfolio);
+      setHistory(data.investment_history);
+      setProfile(data.profile);
       
       // Show risk selection if not set
-      if (!profileRes.data.investment_risk_level || profileRes.data.investment_risk_level === 'standard') {
+      if (!data.profile.investment_risk_level || data.profile.investment_risk_level === 'standard') {
         setShowRiskSelection(true);
       }
       
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth0 } from '@auth0/auth0-react';
 import { useNavigate } from 'react-router-dom';
-import { userAPI, leaderboardAPI } from '../services/api';
+import { dashboardAPI } from '../services/api';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import { TrendingUp, Users, Settings, DollarSign } from 'lucide-react';
 
@@ -11,6 +11,7 @@ const ProfilePage = () => {
   const [profile, setProfile] = useState(null);
   const [appTimeHistory, setAppTimeHistory] = useState([]);
   const [leaderboard, setLeaderboard] = useState([]);
+  const [groupAverage, setGroupAverage] = useState(null);
   const [graphMode, setGraphMode] = useState('time'); // 'time' or 'amount'
   const [compareWith, setCompareWith] = useState('you');
   const [showAppsModal, setShowAppsModal] = useState(false);
@@ -22,15 +23,12 @@ const ProfilePage = () => {
 
   const loadData = async () => {
     try {
-      const [profileRes, appTimeRes, leaderboardRes] = await Promise.all([
-        userAPI.getProfile(),
-        userAPI.getAppTime(7),
-        leaderboardAPI.getLeaderboard(),
-      ]);
+      const { data } = await dashboardAPI.getDashboard({ apptime_days: 7 });
 
-      setProfile(profileRes.data);
-      setAppTimeHistory(appTimeRes.data.history);
-      setLeaderboard(leaderboardRes.data.leaderboard);
+      setProfile(data.profile);
+      setAppTimeHistory(data.apptime);
+      setLeaderboard(data.leaderboard);
+      setGroupAverage(data.group_average);
       setLoading(false);
     } catch (error) {
       console.error('Error loading data:', error);
@@ -80,12 +78,15 @@ const ProfilePage = () => {
       });
     }
 
-    // Calculate group average
-    const groupAvg = leaderboard.reduce((sum, u) => sum + u.targeted_apps_time_weekly, 0) / leaderboard.length;
-    const avgDaily = groupAvg / 7;
-    Object.keys(dataMap).forEach(key => {
-      dataMap[key].average = graphMode === 'time' ? avgDaily : (avgDaily * 2);
-    });
+    // Group average over every member of the user's team, from the API
+    if (compareWith === 'average' && groupAverage) {
+      const avgDaily = (graphMode === 'time'
+        ? groupAverage.targeted_apps_time_weekly
+        : groupAverage.amount_charged_weekly) / 7;
+      Object.keys(dataMap).forEach(key => {
+        dataMap[key].average = avgDaily;
+      });
+    }
 
     return Object.values(dataMap);
   };
@@ -237,7 +238,7 @@ const ProfilePage = () => {
             >
               <option value="you">You</option>
               <option value="leader">Leader</option>
-              <option value="average">Team Average</option>
+              <option value="average" disabled={!groupAverage}>Team Average</option>
             </select>
           </div>
           <ResponsiveContainer width="100%" height={300}>
@@ -15,9 +15,22 @@ api.interceptors.request.use((config) => {
   if (token) {
     config.headers.Authorization = `Bearer ${token}`;
   }
+  // Keeps reads right after a write on the primary database, whichever worker serves them
+  const lastWrite = localStorage.getItem('last_write');
+  if (lastWrite) {
+    config.headers['X-Last-Write'] = lastWrite;
+  }
   return config;
 });
 
+api.interceptors.response.use((response) => {
+  const lastWrite = response.headers['x-last-write'];
+  if (lastWrite) {
+    localStorage.setItem('last_write', lastWrite);
+  }
+  return response;
+});
+
 export const authAPI = {
   login: async (userData) => {
     const response = await api.post('/auth/login', userData);
@@ -32,18 +45,25 @@ export const userAPI = {
   getProfile: () => api.get('/user/profile'),
   getApps: () => api.get('/user/apps'),
   updateApps: (trackedApps) => api.put('/user/apps', { tracked_apps: trackedApps }),
-  getAppTime: (days = 7) => api.get(`/user/apptime?days=${days}`),
+  getAppTime: (days = 7, bucket) => api.get('/user/apptime', { params: { days, bucket } }),
   updateAppTime: (data) => api.post('/user/apptime', data),
+  exportAppTime: (format = 'csv') => api.get('/user/apptime/export', { params: { format }, responseType: 'blob' }),
+  updateAppTimeBatch: (entries) => api.post('/user/apptime/batch', { entries }),
 };
 
 export const leaderboardAPI = {
   getLeaderboard: () => api.get('/leaderboard'),
 };
 
+export const dashboardAPI = {
+  getDashboard: (params) => api.get('/dashboard', { params }),
+};
+
 export const investmentsAPI = {
   getPortfolio: () => api.get('/investments/portfolio'),
   setupInvestments: (riskLevel) => api.post('/investments/setup', { risk_level: riskLevel }),
-  getHistory: (days = 30) => api.get(`/investments/history?days=${days}`),
+  getHistory: (days = 30, bucket) => api.get('/investments/history', { params: { days, bucket } }),
+  exportHistory: (format = 'csv') => api.get('/investments/history/export', { params: { format }, responseType: 'blob' }),
 };
 
 export default api;